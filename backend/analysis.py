@@ -0,0 +1,738 @@
+# backend/analysis.py
+"""Análisis de transcripciones con ChatGPT.
+
+Para transcripciones largas se usa un esquema map-reduce: el texto se divide en
+fragmentos con un presupuesto de tokens, cada fragmento se resume en paralelo
+(con un límite de concurrencia) y luego las notas parciales se fusionan en las
+seis secciones del informe. Durante una sesión en vivo ``RollingAnalysis``
+ejecuta la fase map de forma incremental para que al detener sólo falte el
+último tramo y la fase reduce.
+
+El informe final se pide como salida estructurada (JSON con un esquema de seis
+campos de texto) y se lee en streaming con ``JSONSectionStreamParser``. Si el
+modelo no admite ``response_format`` o la respuesta no es JSON válido se usa el
+parser de encabezados (``SectionStreamParser``) sobre el texto libre. Un
+informe con secciones vacías se vuelve a pedir hasta ANALYSIS_MAX_ATTEMPTS veces.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+import unicodedata
+
+import metrics
+from llm import llm
+
+try:
+    import tiktoken
+except ImportError:  # Opcional: sin tiktoken se estima ~4 caracteres por token
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gpt-4o")
+# "auto" usa map-reduce sólo cuando el texto supera ANALYSIS_CHUNK_TOKENS
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "auto")
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "6000"))
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4"))
+# Análisis incremental durante la sesión: checkpoint cada N segmentos finales o M segundos
+ROLLING_ANALYSIS = os.getenv("ROLLING_ANALYSIS", "false").lower() in ("1", "true", "yes")
+ROLLING_EVERY_SEGMENTS = int(os.getenv("ROLLING_EVERY_SEGMENTS", "25"))
+ROLLING_EVERY_SECONDS = float(os.getenv("ROLLING_EVERY_SECONDS", "120"))
+# Intervalo mínimo entre mensajes analysis_delta al cliente
+ANALYSIS_DELTA_INTERVAL = float(os.getenv("ANALYSIS_DELTA_INTERVAL", "0.1"))
+# Informe final como JSON con esquema (salida estructurada) y llamadas máximas por informe incompleto
+ANALYSIS_STRUCTURED = os.getenv("ANALYSIS_STRUCTURED", "true").lower() in ("1", "true", "yes")
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "2"))
+
+# Incrementar al cambiar los prompts o el parser de secciones: forma parte de la clave de la caché de análisis
+PROMPT_VERSION = "3"
+
+SYSTEM_PROMPT = "Eres un analista organizacional experto en experiencia del empleado, clima laboral y relaciones interdepartamentales. Tu tarea es analizar transcripciones de entrevistas a profundidad con empleados de una empresa, con el objetivo de identificar percepciones por área, relaciones entre áreas y oportunidades de mejora en la experiencia del empleado. No separes el texto por oradores ni intentes identificar quién habla. Analiza todo el contenido como un texto continuo."
+
+REPORT_SECTIONS = """1. **Resumen general** de los temas tratados.
+2. **Percepciones por área** (identifica cada área mencionada y describe lo que se dice sobre ella).
+3. **Relaciones entre áreas** (cómo se percibe la colaboración, comunicación o fricciones entre áreas).
+4. **Factores que afectan positiva o negativamente la experiencia del empleado**.
+5. **Análisis de sentimiento general** y por cada área mencionada.
+6. **Recomendaciones accionables** para mejorar la experiencia del empleado, basadas en lo expresado en la entrevista."""
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """Cuenta tokens con tiktoken si está disponible; si no, hace una estimación.
+
+    Bloqueante (la primera llamada puede descargar el BPE): desde el event loop
+    usar ``split_into_chunks_async`` o ``asyncio.to_thread``.
+    """
+    global _encoding
+    if tiktoken is not None and _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.encoding_for_model(ANALYSIS_MODEL)
+                except Exception:
+                    _encoding = False  # No volver a intentarlo (p. ej. sin red para descargar el BPE)
+    if _encoding:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def split_into_chunks(text, max_tokens=ANALYSIS_CHUNK_TOKENS):
+    """Divide el texto en fragmentos de como máximo ``max_tokens``, respetando frases."""
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append(" ".join(current))
+        current = []
+        current_tokens = 0
+
+    for sentence in _SENTENCE_END.split(text.strip()):
+        tokens = count_tokens(sentence)
+        if tokens > max_tokens:
+            # Frase demasiado larga (p. ej. sin puntuación): cortar por palabras
+            flush()
+            words = sentence.split()
+            step = max(1, len(words) * max_tokens // tokens)
+            for i in range(0, len(words), step):
+                chunks.append(" ".join(words[i:i + step]))
+            continue
+        if current_tokens + tokens > max_tokens:
+            flush()
+        current.append(sentence)
+        current_tokens += tokens
+    flush()
+    return chunks
+
+
+async def split_into_chunks_async(text, max_tokens=ANALYSIS_CHUNK_TOKENS):
+    """``split_into_chunks`` en un hilo: tokenizar una transcripción larga no bloquea el event loop."""
+    return await asyncio.to_thread(split_into_chunks, text, max_tokens)
+
+
+SECTION_KEYS = [
+    "resumen",
+    "percepciones_por_area",
+    "relaciones_entre_areas",
+    "factores_experiencia",
+    "analisis_sentimiento",
+    "recomendaciones",
+]
+
+# Encabezados reconocidos (normalizados: minúsculas y sin tildes) para cada sección.
+# La forma larga basta por sí sola al inicio de la línea. La corta sólo vale en una línea
+# que es sólo un encabezado (#, negrita o "1." y nada detrás) y para la siguiente sección
+# esperada: así "- **Relaciones con Ventas**: ..." dentro de otra sección no la interrumpe.
+SECTION_HEADINGS = [
+    ("resumen", "resumen general", "resumen"),
+    ("percepciones_por_area", "percepciones por area", "percepciones"),
+    ("relaciones_entre_areas", "relaciones entre areas", "relaciones"),
+    ("factores_experiencia", "factores que afectan", "factores"),
+    ("analisis_sentimiento", "analisis de sentimiento", "sentimiento"),
+    ("recomendaciones", "recomendaciones accionables", "recomendaciones"),
+]
+
+# Formato de encabezado: "#", ">", número ("1." o "1)") y negrita/cursiva pegada al texto.
+# Las viñetas ("- ", "* ") no lo son: una línea de lista nunca abre una sección.
+_HEADING_MARKUP = re.compile(r"^\s*(?:[#>]+\s*)?(?:[*_]{1,3}(?=[^\s*_]))?(?:\d+\s*[.)]\s*)?(?:[*_]{1,3}(?=[^\s*_]))?")
+_PARTIAL_MARKUP = re.compile(r"^\s*[#>]*\s*[*_]{0,3}\d*[.)]?\s*[*_]{0,3}$")
+_HEADING_TRAILER = " *_."
+_MAX_HEADING_LENGTH = 120
+
+
+def _normalize(text):
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+
+
+class SectionStreamParser:
+    """Parser incremental de las seis secciones, guiado por los encabezados.
+
+    Se alimenta con fragmentos de texto (``feed``) y devuelve eventos
+    ``(sección, texto)`` en cuanto se sabe a qué sección pertenece cada texto.
+    Una línea sólo se retiene mientras aún podría ser un encabezado, y cada
+    sección sólo se abre una vez. Las listas dentro de una sección ("- Ventas:
+    ...", "- **Relaciones con Operaciones**: ...") nunca se toman por
+    encabezados, y la forma corta ("Relaciones") sólo abre la siguiente
+    sección esperada.
+    """
+
+    def __init__(self):
+        self.current = None
+        self.parts = {key: [] for key in SECTION_KEYS}
+        self._seen = set()
+        self._line = ""
+        self._emitted = 0  # caracteres de la línea actual ya asignados a una sección
+
+    def _next_expected(self):
+        """Primera sección aún no vista después de la actual (o desde el principio)."""
+        start = SECTION_KEYS.index(self.current) + 1 if self.current else 0
+        return next((key for key in SECTION_KEYS[start:] if key not in self._seen), None)
+
+    def _match_heading(self, line):
+        """Devuelve (sección, contenido tras el encabezado) o None."""
+        head, colon, rest = line.partition(":")
+        if len(head) > _MAX_HEADING_LENGTH:
+            return None
+        markup = _HEADING_MARKUP.match(head).group()
+        normalized = _normalize(head[len(markup):]).rstrip(_HEADING_TRAILER)
+        content = rest.strip(_HEADING_TRAILER) if colon else ""
+        for key, long_form, short_form in SECTION_HEADINGS:
+            if key not in self._seen and normalized.startswith(long_form):
+                # Lo que sigue a ":" en la misma línea ya es contenido
+                return key, rest.lstrip(" *_") if content else ""
+        next_key = self._next_expected()
+        if next_key is None or content or not markup.strip():
+            return None
+        short_form = next(short for key, _, short in SECTION_HEADINGS if key == next_key)
+        if normalized == short_form or ("#" in markup and normalized.startswith(short_form)):
+            return next_key, ""
+        return None
+
+    def _could_be_heading(self, partial):
+        head, colon, _ = partial.partition(":")
+        if colon or len(head) > _MAX_HEADING_LENGTH:
+            return False
+        if _PARTIAL_MARKUP.match(head):
+            return True
+        normalized = _normalize(head[_HEADING_MARKUP.match(head).end():]).rstrip(_HEADING_TRAILER)
+        if not normalized:
+            return False
+        forms = [long_form for key, long_form, _ in SECTION_HEADINGS if key not in self._seen]
+        next_key = self._next_expected()
+        forms += [short for key, _, short in SECTION_HEADINGS if key == next_key]
+        return any(form.startswith(normalized) or normalized.startswith(form) for form in forms)
+
+    def _emit(self, text, events):
+        if self.current is not None and text:
+            self.parts[self.current].append(text)
+            events.append((self.current, text))
+
+    def feed(self, delta):
+        events = []
+        self._line += delta
+        while "\n" in self._line:
+            line, self._line = self._line.split("\n", 1)
+            heading = self._match_heading(line) if self._emitted == 0 else None
+            if heading:
+                self.current = heading[0]
+                self._seen.add(self.current)
+                self._emit(heading[1] + "\n" if heading[1] else "", events)
+            else:
+                self._emit(line[self._emitted:] + "\n", events)
+            self._emitted = 0
+        if not self._line:
+            return events
+        if self._emitted == 0:
+            heading = self._match_heading(self._line) if ":" in self._line else None
+            if heading and heading[1]:
+                # "Encabezado: contenido": abrir la sección sin esperar al fin de línea
+                self.current = heading[0]
+                self._seen.add(self.current)
+                self._emit(heading[1], events)
+            elif heading or self._could_be_heading(self._line):
+                return events
+            else:
+                self._emit(self._line, events)
+        else:
+            self._emit(self._line[self._emitted:], events)
+        self._emitted = len(self._line)
+        return events
+
+    def close(self):
+        """Vacía la última línea pendiente."""
+        return self.feed("\n") if self._line else []
+
+    def result(self):
+        return {key: "".join(parts).strip() for key, parts in self.parts.items()}
+
+
+# Títulos de las secciones tal como se piden en el prompt (texto_completo de las respuestas JSON)
+SECTION_TITLES = [
+    ("resumen", "Resumen general"),
+    ("percepciones_por_area", "Percepciones por área"),
+    ("relaciones_entre_areas", "Relaciones entre áreas"),
+    ("factores_experiencia", "Factores que afectan la experiencia del empleado"),
+    ("analisis_sentimiento", "Análisis de sentimiento"),
+    ("recomendaciones", "Recomendaciones accionables"),
+]
+
+REPORT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "informe_entrevista",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {key: {"type": "string", "description": title} for key, title in SECTION_TITLES},
+            "required": SECTION_KEYS,
+            "additionalProperties": False,
+        },
+    },
+}
+
+STRUCTURED_INSTRUCTIONS = (
+    "\n\nDevuelve el informe como un objeto JSON con un campo de texto por apartado, en este orden: "
+    + ", ".join(SECTION_KEYS) + ". Dentro de cada campo puedes usar listas y negritas en Markdown."
+)
+
+
+class JSONSectionStreamParser:
+    """Parser incremental de la salida estructurada: un objeto JSON con las secciones como texto.
+
+    Misma interfaz que ``SectionStreamParser``: devuelve eventos ``(sección,
+    texto)`` con el contenido ya decodificado de cada campo a medida que llega,
+    sin esperar a que el JSON esté completo. Si la respuesta se corta,
+    ``result()`` conserva lo recibido hasta entonces.
+    """
+
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.current = None
+        self.parts = {key: [] for key in SECTION_KEYS}
+        self._state = "object"  # object | key | colon | value | string | other
+        self._key = []
+        self._escape = None  # None fuera de un escape; "" tras "\\"; "uXXXX" mientras se lee
+        self._high_surrogate = None
+
+    def _decode_escape(self, char):
+        """Añade ``char`` al escape en curso y devuelve el carácter decodificado (o None si falta)."""
+        self._escape += char
+        if self._escape[0] != "u":
+            self._escape = None
+            return self._ESCAPES.get(char, char)
+        if len(self._escape) < 5:
+            return None
+        try:
+            code = int(self._escape[1:], 16)
+        except ValueError:
+            code = 0xFFFD
+        self._escape = None
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = code
+            return None
+        if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        return chr(code)
+
+    def _flush(self, text, events):
+        if self.current is not None and text:
+            content = "".join(text)
+            self.parts[self.current].append(content)
+            events.append((self.current, content))
+        text.clear()
+
+    def feed(self, delta):
+        events = []
+        text = []  # contenido del campo actual recibido en este fragmento
+        for char in delta:
+            state = self._state
+            if state in ("key", "string"):
+                if self._escape is not None:
+                    char = self._decode_escape(char)
+                    if char is None:
+                        continue
+                elif char == "\\":
+                    self._escape = ""
+                    continue
+                elif char == '"':
+                    if state == "key":
+                        self._state = "colon"
+                    else:
+                        self._flush(text, events)
+                        self.current = None
+                        self._state = "object"
+                    continue
+                if state == "key":
+                    self._key.append(char)
+                elif self.current is not None:
+                    text.append(char)
+            elif state == "object":
+                if char == '"':
+                    self._key = []
+                    self._state = "key"
+            elif state == "colon":
+                if char == ":":
+                    self._state = "value"
+            elif state == "value":
+                if char == '"':
+                    key = "".join(self._key)
+                    self.current = key if key in self.parts else None
+                    self._state = "string"
+                elif not char.isspace():
+                    self._state = "other"  # null, números...: no es una sección
+            elif char in ",}":
+                self._state = "object"
+        self._flush(text, events)
+        return events
+
+    def close(self):
+        return []
+
+    def result(self):
+        return {key: "".join(parts).strip() for key, parts in self.parts.items()}
+
+
+def parse_sections(analysis_text):
+    """Estructura la respuesta en texto libre en las seis secciones del informe."""
+    parser = SectionStreamParser()
+    parser.feed(analysis_text)
+    parser.close()
+    analysis = parser.result()
+    analysis["texto_completo"] = analysis_text
+    return analysis
+
+
+def format_report(sections):
+    """Texto del informe con un encabezado por sección (legible y reanalizable con ``parse_sections``)."""
+    return "\n\n".join(f"{title}:\n{sections[key]}" for key, title in SECTION_TITLES if sections.get(key))
+
+
+def parse_structured(analysis_text, parser=None):
+    """Estructura una respuesta JSON; si no es JSON válido usa lo leído en streaming o los encabezados."""
+    try:
+        data = json.loads(analysis_text)
+        if not isinstance(data, dict):
+            raise ValueError("La respuesta no es un objeto JSON")
+        sections = {key: str(data.get(key) or "").strip() for key in SECTION_KEYS}
+    except ValueError:
+        if parser is None:
+            parser = JSONSectionStreamParser()
+            parser.feed(analysis_text)
+        sections = parser.result()
+        if not any(sections.values()):
+            return parse_sections(analysis_text)  # Texto libre pese a response_format
+    sections["texto_completo"] = format_report(sections)
+    return sections
+
+
+async def _complete(user_content, on_delta=None, parser=None, response_format=None):
+    """Llama al modelo y devuelve el texto de la respuesta.
+
+    Con ``on_delta`` usa streaming y reenvía los textos por sección según
+    ``parser`` (por defecto, el de encabezados); sin streaming, ``parser``
+    (opcional) lee la respuesta completa.
+    """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
+    options = {"response_format": response_format} if response_format else {}
+    if on_delta is None:
+        response = await llm.create_chat_completion(model=ANALYSIS_MODEL, messages=messages, **options)
+        text = response.choices[0].message.content or ""
+        if parser is not None:
+            parser.feed(text)
+            parser.close()
+        return text
+
+    parser = parser or SectionStreamParser()
+    text_parts = []
+    pending = []  # eventos acumulados desde el último envío
+    last_sent = 0.0
+
+    async def flush():
+        # Agrupar eventos consecutivos de la misma sección en un solo mensaje
+        merged = []
+        for section, text in pending:
+            if merged and merged[-1][0] == section:
+                merged[-1][1] += text
+            else:
+                merged.append([section, text])
+        pending.clear()
+        for section, text in merged:
+            await on_delta(section, text)
+
+    async for delta in llm.stream_chat_completion(model=ANALYSIS_MODEL, messages=messages, **options):
+        text_parts.append(delta)
+        pending.extend(parser.feed(delta))
+        now = time.monotonic()
+        if pending and now - last_sent >= ANALYSIS_DELTA_INTERVAL:
+            await flush()
+            last_sent = now
+    pending.extend(parser.close())
+    await flush()
+    return "".join(text_parts)
+
+
+_structured_unsupported = False  # El modelo rechazó response_format: no volver a pedirlo
+
+
+def _rejects_response_format(error):
+    import openai
+
+    return isinstance(error, openai.BadRequestError) and "response_format" in str(error)
+
+
+async def _complete_report(user_content, on_delta=None):
+    """Pide el informe final y lo devuelve en secciones, con el formato usado y los intentos.
+
+    Un informe con secciones vacías se vuelve a pedir (sin streaming, para no
+    duplicar los analysis_delta ya enviados) hasta ANALYSIS_MAX_ATTEMPTS veces.
+    """
+    global _structured_unsupported
+    attempts = 0
+    while True:
+        structured = ANALYSIS_STRUCTURED and not _structured_unsupported
+        response_format = "json" if structured else "text"
+        parser = JSONSectionStreamParser() if structured else SectionStreamParser()
+        try:
+            text = await _complete(
+                user_content + (STRUCTURED_INSTRUCTIONS if structured else ""),
+                on_delta if attempts == 0 else None,
+                parser,
+                REPORT_RESPONSE_FORMAT if structured else None,
+            )
+        except Exception as e:
+            if structured and _rejects_response_format(e):
+                logger.warning(f"{ANALYSIS_MODEL} no admite salida estructurada, se usa texto libre: {e}")
+                _structured_unsupported = True
+                continue
+            raise
+        attempts += 1
+        analysis = parse_structured(text, parser) if structured else parse_sections(text)
+        missing = [key for key in SECTION_KEYS if not analysis[key]]
+        metrics.analysis_reports.inc(format=response_format, result="incomplete" if missing else "complete")
+        if not missing or attempts >= ANALYSIS_MAX_ATTEMPTS:
+            if missing:
+                logger.warning(f"Informe incompleto tras {attempts} intentos: faltan {', '.join(missing)}")
+            return analysis, {"formato": response_format, "intentos": attempts}
+        metrics.analysis_retries.inc(format=response_format)
+        logger.warning(f"Informe incompleto (faltan {', '.join(missing)}); se vuelve a pedir")
+
+
+async def analyze_single(text, on_delta=None):
+    """Análisis en una sola llamada con la transcripción completa; devuelve (análisis, info)."""
+    return await _complete_report(f"""Analiza la siguiente transcripción y entrega un informe estructurado que contenga:
+
+{REPORT_SECTIONS}
+
+Transcripción: {text}
+""", on_delta)
+
+
+async def analyze_chunk(chunk, index, total, semaphore):
+    """Fase map: extrae notas de un fragmento para cada una de las seis secciones.
+
+    ``total`` es None cuando la entrevista sigue en curso (análisis incremental).
+    """
+    position = f"{index + 1} de {total}" if total else f"{index + 1} (la entrevista sigue en curso)"
+    async with semaphore:
+        started = time.perf_counter()
+        notes = await _complete(f"""El siguiente texto es el fragmento {position} de una misma entrevista. Extrae notas breves y concretas (sin redactar todavía el informe final) para cada uno de estos apartados, conservando áreas, ejemplos y citas relevantes:
+
+{REPORT_SECTIONS}
+
+Si el fragmento no aporta nada a un apartado, escribe "Sin información".
+
+Fragmento: {chunk}
+""")
+        logger.info(f"Fragmento {position} analizado en {time.perf_counter() - started:.2f}s")
+        return notes
+
+
+async def reduce_partials(partials, on_delta=None):
+    """Fase reduce: fusiona las notas parciales en el informe final; devuelve (análisis, info)."""
+    notes = "\n\n".join(
+        f"--- Notas del fragmento {i + 1} ---\n{partial}" for i, partial in enumerate(partials)
+    )
+    return await _complete_report(f"""Las siguientes notas se extrajeron, en orden, de fragmentos consecutivos de una misma entrevista. Intégralas (eliminando repeticiones y resolviendo contradicciones) y entrega un informe estructurado que contenga:
+
+{REPORT_SECTIONS}
+
+{notes}
+""", on_delta)
+
+
+async def analyze_map_reduce(chunks, max_concurrency=ANALYSIS_MAX_CONCURRENCY, on_delta=None):
+    """Ejecuta map (en paralelo) y reduce; devuelve el análisis y los tiempos."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    started = time.perf_counter()
+    partials = await asyncio.gather(
+        *(analyze_chunk(chunk, i, len(chunks), semaphore) for i, chunk in enumerate(chunks))
+    )
+    map_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    report, info = await reduce_partials(partials, on_delta)
+    reduce_seconds = time.perf_counter() - started
+    return report, {"map_s": round(map_seconds, 3), "reduce_s": round(reduce_seconds, 3), **info}
+
+
+async def _record_metrics(timings, text, analysis_text):
+    metrics.analysis_seconds.observe(timings["total_s"], mode=timings["modo"])
+    input_tokens, output_tokens = await asyncio.to_thread(lambda: (count_tokens(text), count_tokens(analysis_text)))
+    metrics.analysis_tokens.observe(input_tokens, kind="input")
+    metrics.analysis_tokens.observe(output_tokens, kind="output")
+
+
+async def generate_analysis(text, mode=None, on_delta=None):
+    """Genera análisis de la transcripción usando ChatGPT.
+
+    Si se indica ``on_delta`` (async (sección, texto)), el informe final se
+    genera en streaming y cada texto se reenvía en cuanto se conoce su sección.
+    """
+    try:
+        mode = mode or ANALYSIS_MODE
+        logger.info(f"Generando análisis para texto de {len(text)} caracteres")
+        started = time.perf_counter()
+
+        chunks = await split_into_chunks_async(text) if mode != "single" else [text]
+        if mode == "map_reduce" or len(chunks) > 1:
+            logger.info(f"Análisis map-reduce con {len(chunks)} fragmentos")
+            analysis, timings = await analyze_map_reduce(chunks, on_delta=on_delta)
+            timings["modo"] = "map_reduce"
+        else:
+            analysis, timings = await analyze_single(text, on_delta)
+            timings["modo"] = "single"
+        timings["fragmentos"] = len(chunks)
+        timings["total_s"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Análisis generado correctamente: {timings}")
+
+        analysis["tiempos"] = timings
+        await _record_metrics(timings, text, analysis["texto_completo"])
+        return analysis
+    except Exception as e:
+        metrics.analysis_errors.inc()
+        logger.error(f"Error al generar análisis con ChatGPT: {e}")
+        logger.exception("Detalle del error:")
+        return {"error": str(e), "texto_completo": text}
+
+
+class RollingAnalysis:
+    """Análisis incremental de una sesión en vivo.
+
+    A medida que llegan segmentos finales se ejecuta la fase map sobre el tramo
+    nuevo en una tarea de fondo. Al detener la sesión sólo queda analizar el
+    tramo desde el último checkpoint y ejecutar la fase reduce. ``segments`` es
+    el ``SegmentStore`` de la sesión (sólo de añadido).
+
+    No hay checkpoints mientras la transcripción quepa en un fragmento, y si al
+    finalizar cabe en uno se analiza completa con ``analyze_single``: map-reduce
+    sólo compensa cuando el texto no cabe en una llamada.
+    """
+
+    def __init__(self, on_snapshot=None,
+                 every_segments=ROLLING_EVERY_SEGMENTS, every_seconds=ROLLING_EVERY_SECONDS):
+        self.on_snapshot = on_snapshot  # async (analysis, segmentos) -> None, opcional
+        self.every_segments = every_segments
+        self.every_seconds = every_seconds
+        self.partials = []    # notas de la fase map, en orden
+        self.checkpoint = 0   # segmentos ya cubiertos por ``partials``
+        self._last_checkpoint = time.monotonic()
+        self._task = None
+        self._semaphore = asyncio.Semaphore(ANALYSIS_MAX_CONCURRENCY)
+        self._map_lock = asyncio.Lock()  # Un solo _map_tail a la vez (checkpoint de fondo o finalize)
+        self._finalizing = False
+
+    def notify(self, segments):
+        """Llamar tras cada segmento final; lanza un checkpoint de fondo si corresponde."""
+        if self._finalizing or (self._task and not self._task.done()):
+            return
+        if not self.partials and len(segments.text()) <= ANALYSIS_CHUNK_TOKENS * 4:
+            return  # Aún cabe en una sola llamada (estimación de ~4 caracteres por token)
+        pending = len(segments) - self.checkpoint
+        due = time.monotonic() - self._last_checkpoint >= self.every_seconds
+        if pending >= self.every_segments or (pending and due):
+            self._task = asyncio.create_task(self._run_checkpoint(segments, len(segments)))
+
+    async def _map_tail(self, segments, end=None):
+        """Ejecuta la fase map sobre los segmentos posteriores al checkpoint (hasta ``end``)."""
+        async with self._map_lock:
+            end = len(segments) if end is None else end
+            if end <= self.checkpoint:
+                return
+            tail = segments.text(self.checkpoint, end)
+            chunks = await split_into_chunks_async(tail)
+            notes = await asyncio.gather(*(
+                analyze_chunk(chunk, len(self.partials) + i, None, self._semaphore)
+                for i, chunk in enumerate(chunks)
+            ))
+            self.partials.extend(notes)
+            self.checkpoint = end
+            self._last_checkpoint = time.monotonic()
+
+    async def _run_checkpoint(self, segments, end):
+        try:
+            await self._map_tail(segments, end)
+            logger.info(f"Checkpoint de análisis incremental: {self.checkpoint} segmentos, {len(self.partials)} notas")
+            if self.on_snapshot:
+                analysis, _ = await reduce_partials(self.partials)
+                await self.on_snapshot(analysis, self.checkpoint)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # El tramo pendiente se volverá a analizar en el siguiente checkpoint o al finalizar
+            logger.error(f"Error en el análisis incremental: {e}")
+
+    def covers(self, text, segments):
+        """Indica si las notas acumuladas corresponden al texto que se pide analizar."""
+        return bool(self.partials) and text.split() == segments.text().split()
+
+    async def finalize(self, segments, on_delta=None):
+        """Incorpora el tramo final y devuelve el análisis completo."""
+        self._finalizing = True
+        try:
+            started = time.perf_counter()
+            text = segments.text()
+            if ANALYSIS_MODE == "auto" and len(await split_into_chunks_async(text)) <= 1:
+                # Cabe en una llamada: el informe se hace sobre la transcripción, no sobre notas
+                self.cancel()
+                return await generate_analysis(text, mode="single", on_delta=on_delta)
+            if self._task and not self._task.done():
+                await self._task
+            if self.checkpoint < len(segments):
+                await self._map_tail(segments)
+            tail_seconds = time.perf_counter() - started
+
+            reduce_started = time.perf_counter()
+            analysis, info = await reduce_partials(self.partials, on_delta)
+            analysis["tiempos"] = {
+                "modo": "rolling",
+                "fragmentos": len(self.partials),
+                "tramo_final_s": round(tail_seconds, 3),
+                "reduce_s": round(time.perf_counter() - reduce_started, 3),
+                "total_s": round(time.perf_counter() - started, 3),
+                **info,
+            }
+            logger.info(f"Análisis incremental finalizado: {analysis['tiempos']}")
+            await _record_metrics(analysis["tiempos"], segments.text(), analysis["texto_completo"])
+            return analysis
+        except Exception as e:
+            metrics.analysis_errors.inc()
+            logger.error(f"Error al finalizar el análisis incremental: {e}")
+            logger.exception("Detalle del error:")
+            return {"error": str(e), "texto_completo": segments.text()}
+        finally:
+            self._finalizing = False
+
+    def cancel(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+
+if __name__ == "__main__":
+    # Uso: OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python analysis.py transcripcion.txt
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    async def run(path):
+        with open(path, encoding="utf-8") as f:
+            try:
+                return await generate_analysis(f.read())
+            finally:
+                await llm.close()
+
+    result = asyncio.run(run(sys.argv[1]))
+    print(json.dumps(result.get("tiempos", result), ensure_ascii=False, indent=2))
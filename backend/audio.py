@@ -0,0 +1,183 @@
+# backend/audio.py
+"""Reenvío de audio del cliente a Deepgram con cola acotada por sesión.
+
+El bucle principal del WebSocket sólo encola los frames recibidos; una tarea
+dedicada los envía a Deepgram. Así un Deepgram lento no deja de leer del
+cliente sin control, y se puede ver cuánto audio hay en espera.
+
+Políticas cuando la cola está llena (más de AUDIO_QUEUE_SECONDS de audio o
+AUDIO_QUEUE_MAX_BYTES en espera):
+- "buffer": se deja de leer del cliente hasta que haya hueco (contrapresión).
+- "coalesce": como "buffer", pero el emisor agrupa los frames en espera en
+  envíos de hasta AUDIO_COALESCE_BYTES para vaciar la cola más rápido.
+- "drop": se descarta el frame nuevo y se cuenta. Sólo es seguro con audio
+  sin contenedor (linear16, p. ej. el que sale de preprocess.py); con
+  WebM/Opus corrompe el flujo.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+AUDIO_POLICIES = ("buffer", "coalesce", "drop")
+AUDIO_POLICY = os.getenv("AUDIO_POLICY", "coalesce")
+AUDIO_QUEUE_SECONDS = float(os.getenv("AUDIO_QUEUE_SECONDS", "10"))
+AUDIO_QUEUE_MAX_BYTES = int(os.getenv("AUDIO_QUEUE_MAX_BYTES", str(2 * 1024 * 1024)))
+AUDIO_COALESCE_BYTES = int(os.getenv("AUDIO_COALESCE_BYTES", str(64 * 1024)))
+
+
+class AudioForwarder:
+    """Cola acotada de frames de audio con una tarea emisora dedicada."""
+
+    def __init__(self, send, policy=AUDIO_POLICY, max_seconds=AUDIO_QUEUE_SECONDS,
+                 max_bytes=AUDIO_QUEUE_MAX_BYTES, coalesce_bytes=AUDIO_COALESCE_BYTES):
+        if policy not in AUDIO_POLICIES:
+            raise ValueError(f"Política de audio no soportada: {policy}")
+        self._send = send  # async (bytes) -> Any
+        self.policy = policy
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.coalesce_bytes = coalesce_bytes
+        self._queue = deque()  # (llegada, bytes)
+        self._queued_bytes = 0
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self._task = None
+        self._first_frame = None
+        # Métricas
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.sends = 0
+        self.bytes_sent = 0
+        self.frames_dropped = 0
+        self.bytes_dropped = 0
+        self.send_errors = 0
+        self.max_depth = 0
+        self.last_lag = 0.0   # segundos entre la llegada del frame y su envío a Deepgram
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    @property
+    def bytes_per_second(self):
+        """Tasa media del audio entrante; el cliente envía en tiempo real."""
+        if self._first_frame is None:
+            return 0.0
+        elapsed = time.monotonic() - self._first_frame
+        return self.bytes_in / elapsed if elapsed >= 1.0 else 0.0
+
+    @property
+    def queued_seconds(self):
+        """Segundos de audio en espera, estimados con la tasa media de entrada."""
+        rate = self.bytes_per_second
+        return self._queued_bytes / rate if rate else 0.0
+
+    def _full(self):
+        return bool(self._queue) and (
+            self._queued_bytes >= self.max_bytes or self.queued_seconds >= self.max_seconds
+        )
+
+    async def put(self, data):
+        """Encola un frame recibido del cliente; puede esperar o descartar según la política.
+
+        Devuelve False si el frame se descartó.
+        """
+        if self._first_frame is None:
+            self._first_frame = time.monotonic()
+        self.frames_in += 1
+        self.bytes_in += len(data)
+        async with self._changed:
+            if self._full():
+                if self.policy == "drop":
+                    self.frames_dropped += 1
+                    self.bytes_dropped += len(data)
+                    metrics.audio_frames_dropped.inc()
+                    if self.frames_dropped % 50 == 1:
+                        logger.warning(f"Cola de audio llena: {self.frames_dropped} frames descartados")
+                    return False
+                await self._changed.wait_for(lambda: not self._full() or self._closed)
+            self._queue.append((time.monotonic(), data))
+            self._queued_bytes += len(data)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            metrics.audio_queue_frames.observe(len(self._queue))
+            self._changed.notify_all()
+        return True
+
+    def _take(self):
+        """Saca de la cola el siguiente envío (varios frames si la política es coalesce)."""
+        arrived, data = self._queue.popleft()
+        if self.policy == "coalesce" and self._queue:
+            parts = [data]
+            size = len(data)
+            while self._queue and size + len(self._queue[0][1]) <= self.coalesce_bytes:
+                _, extra = self._queue.popleft()
+                parts.append(extra)
+                size += len(extra)
+            data = b"".join(parts)
+        self._queued_bytes -= len(data)
+        return arrived, data
+
+    async def _run(self):
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                arrived, data = self._take()
+                self._changed.notify_all()
+            try:
+                await self._send(data)
+                self.sends += 1
+                self.bytes_sent += len(data)
+            except Exception as e:
+                self.send_errors += 1
+                logger.error(f"Error al enviar audio a Deepgram: {e}")
+            lag = time.monotonic() - arrived
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self._lag_total += lag
+            metrics.audio_send_lag_seconds.observe(lag, policy=self.policy)
+
+    async def close(self, timeout=2.0):
+        """Deja de aceptar audio y espera (hasta ``timeout``) a que se vacíe la cola."""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Cola de audio cerrada con {len(self._queue)} frames sin enviar")
+                self._task.cancel()
+            except Exception as e:
+                logger.error(f"Error en la tarea de envío de audio: {e}")
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "depth": self.depth,
+            "queued_bytes": self._queued_bytes,
+            "queued_seconds": round(self.queued_seconds, 3),
+            "max_depth": self.max_depth,
+            "frames_in": self.frames_in,
+            "bytes_in": self.bytes_in,
+            "sends": self.sends,
+            "bytes_sent": self.bytes_sent,
+            "frames_dropped": self.frames_dropped,
+            "bytes_dropped": self.bytes_dropped,
+            "send_errors": self.send_errors,
+            "last_lag_s": round(self.last_lag, 3),
+            "max_lag_s": round(self.max_lag, 3),
+            "avg_lag_s": round(self._lag_total / (self.sends + self.send_errors), 3) if self.sends else 0.0,
+        }
@@ -0,0 +1,341 @@
+# backend/batch.py
+"""Transcripción por lotes de archivos de audio grabados.
+
+Los archivos subidos por HTTP se guardan en BATCH_UPLOAD_DIR y se encolan como
+trabajos. Un pool de BATCH_WORKERS tareas los procesa con la misma cadena que
+las sesiones en vivo (Deepgram → análisis → reportes), enviando el audio a
+Deepgram tan rápido como lo acepte (o a BATCH_FEED_BYTES_PER_SECOND) en lugar
+de al ritmo de reproducción. El estado de cada trabajo se consulta por su id;
+los segmentos se guardan en el almacén de sesiones con el id de sesión del
+trabajo. Análisis y reportes esperan turno en los mismos planificadores que
+las sesiones en vivo, con menor prioridad (ver ``scheduler``).
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+
+from deepgram import LiveOptions
+
+import metrics
+from analysis import generate_analysis
+from live import LiveTranscriber
+from pipeline import build_file_data, cached_analysis, file_metadata, spool_files
+from reports import REPORT_FORMATS, SECTIONS
+from scheduler import PRIORITY_BATCH, analysis_scheduler, render_scheduler
+from search import search_index
+from segments import SegmentStore
+from sessions import session_store
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+BATCH_MAX_QUEUED = int(os.getenv("BATCH_MAX_QUEUED", "100"))
+BATCH_UPLOAD_DIR = os.getenv("BATCH_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "rtt_uploads"))
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+BATCH_CHUNK_BYTES = int(os.getenv("BATCH_CHUNK_BYTES", str(32 * 1024)))
+BATCH_FEED_BYTES_PER_SECOND = float(os.getenv("BATCH_FEED_BYTES_PER_SECOND", "0"))  # 0 = sin límite
+BATCH_DRAIN_TIMEOUT = float(os.getenv("BATCH_DRAIN_TIMEOUT", "120"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "2"))
+BATCH_KEEP_JOBS = 1000  # Trabajos terminados que se conservan para consultar su estado
+
+JOB_STATES = ("queued", "transcribing", "analyzing", "rendering", "done", "failed", "cancelled")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def save_upload(chunks, max_bytes=BATCH_MAX_UPLOAD_BYTES):
+    """Guarda en BATCH_UPLOAD_DIR el cuerpo recibido (iterador asíncrono de bytes) y devuelve la ruta."""
+    os.makedirs(BATCH_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(BATCH_UPLOAD_DIR, uuid.uuid4().hex)
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"El archivo supera {max_bytes} bytes")
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        _remove_upload(path)
+        raise
+    return path
+
+
+class BatchJob:
+    """Estado de un trabajo por lotes."""
+
+    def __init__(self, path, filename, model, export_formats, tenant="batch"):
+        self.id = uuid.uuid4().hex
+        self.tenant = tenant
+        self.path = path
+        self.filename = filename
+        self.model = model
+        self.export_formats = export_formats
+        self.state = "queued"
+        self.error = None
+        self.attempts = 0
+        self.session_id = None
+        self.size = os.path.getsize(path)
+        self.bytes_sent = 0
+        self.segments = 0
+        self.audio_seconds = 0.0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.timings = {}
+        self.analysis = None
+        self.files = {}
+        self.queue_position = None  # posición en la cola de análisis o reportes mientras espera turno
+        self.task = None
+        self.cancel_requested = False
+
+    @property
+    def finished_state(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def to_dict(self, include_analysis=True):
+        transcribe_seconds = self.timings.get("transcripcion_s")
+        job = {
+            "job_id": self.id,
+            "state": self.state,
+            "filename": self.filename,
+            "model": self.model,
+            "tenant": self.tenant,
+            "queue_position": self.queue_position,
+            "session_id": self.session_id,
+            "size": self.size,
+            "progress": round(self.bytes_sent / self.size, 3) if self.size else 0.0,
+            "segments": self.segments,
+            "audio_seconds": round(self.audio_seconds, 3),
+            # Segundos de audio transcritos por segundo de trabajo (1.0 = tiempo real)
+            "realtime_factor": round(self.audio_seconds / transcribe_seconds, 2) if transcribe_seconds else None,
+            "attempts": self.attempts,
+            "cancel_requested": self.cancel_requested,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "timings": self.timings,
+            "error": self.error,
+            "files": self.files,
+        }
+        if include_analysis:
+            job["analysis"] = self.analysis
+        return job
+
+
+class BatchQueue:
+    """Cola de trabajos con un pool fijo de tareas de procesamiento."""
+
+    def __init__(self, workers=BATCH_WORKERS, max_queued=BATCH_MAX_QUEUED):
+        self._deepgram = None
+        self.workers = workers
+        self.max_queued = max_queued
+        self.jobs = {}
+        self._queue = None
+        self._tasks = []
+
+    def start(self, deepgram):
+        self._deepgram = deepgram
+        metrics.batch_queue_depth.set_function(lambda: self.depth)
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Cola de lotes iniciada con {self.workers} workers")
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(self, path, filename, model="nova-2", export_formats=None, tenant="batch"):
+        """Encola un archivo ya guardado en disco y devuelve el trabajo."""
+        if self.depth >= self.max_queued:
+            raise QueueFull(f"Hay {self.depth} trabajos en cola")
+        formats = [name for name in (export_formats or ["excel"]) if name in REPORT_FORMATS]
+        job = BatchJob(path, filename, model, formats, tenant)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._forget_old_jobs()
+        logger.info(f"Trabajo {job.id} encolado: {filename} ({job.size} bytes)")
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.finished_state:
+            return job
+        job.cancel_requested = True
+        if job.task is not None:
+            job.task.cancel()  # _worker marca el trabajo como cancelado
+        else:
+            job.state = "cancelled"
+            job.finished = time.time()
+            _remove_upload(job.path)
+        return job
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.finished_state]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(0, len(finished) - BATCH_KEEP_JOBS)]:
+            del self.jobs[job.id]
+
+    async def _worker(self, index):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.state == "cancelled":
+                    continue
+                job.task = asyncio.create_task(self._run_job(job))
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    if not job.cancel_requested:
+                        raise  # Se está cerrando la app
+                    job.state = "cancelled"
+                    job.finished = time.time()
+                    logger.info(f"Trabajo {job.id} cancelado")
+            finally:
+                job.task = None
+                self._queue.task_done()
+
+    async def _run_job(self, job):
+        job.started = time.time()
+        try:
+            segments = await self._transcribe_with_retries(job)
+            text = segments.text()
+            if not text:
+                raise ValueError("La transcripción está vacía")
+
+            job.state = "analyzing"
+            started = time.perf_counter()
+            async def on_position(position):
+                job.queue_position = position
+
+            async def generate():
+                async with analysis_scheduler.slot(job.tenant, PRIORITY_BATCH, on_position):
+                    return await generate_analysis(text)
+
+            analysis = await cached_analysis(text, generate)
+            job.timings["analisis_s"] = round(time.perf_counter() - started, 3)
+            if "error" in analysis:
+                raise RuntimeError(analysis["error"])
+            job.analysis = analysis
+            search_index.add_analysis(job.session_id, analysis, SECTIONS)
+
+            if job.export_formats:
+                job.state = "rendering"
+                started = time.perf_counter()
+                file_data = await build_file_data(
+                    text, analysis, job.export_formats, segments.rows(),
+                    render_scheduler.slot(job.tenant, PRIORITY_BATCH, on_position)
+                )
+                await spool_files(file_data)
+                job.files = {
+                    format_name: file_metadata(format_name, file_info, "http")
+                    for format_name, file_info in file_data.items()
+                }
+                job.timings["reportes_s"] = round(time.perf_counter() - started, 3)
+            job.state = "done"
+            logger.info(f"Trabajo {job.id} completado: {job.timings}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            logger.error(f"Trabajo {job.id} fallido: {e}")
+        finally:
+            job.finished = time.time()
+            _remove_upload(job.path)
+            if job.session_id:
+                await session_store.release(job.session_id)
+            metrics.batch_jobs.inc(state=job.state if job.finished_state else "cancelled")
+
+    async def _transcribe_with_retries(self, job):
+        job.session_id = await session_store.create(meta={"batch": job.filename, "model": job.model})
+        while True:
+            job.attempts += 1
+            try:
+                return await self._transcribe(job)
+            except (ConnectionError, TimeoutError) as e:
+                if job.attempts >= BATCH_MAX_ATTEMPTS:
+                    raise
+                logger.warning(f"Trabajo {job.id}: intento {job.attempts} fallido ({e}); se reintenta")
+                # Los segmentos del intento fallido se descartan con una sesión nueva
+                search_index.remove_session(job.session_id)
+                await session_store.release(job.session_id)
+                job.session_id = await session_store.create(meta={"batch": job.filename, "model": job.model})
+
+    async def _transcribe(self, job):
+        """Envía el archivo a Deepgram y devuelve los segmentos finales (``SegmentStore``)."""
+        job.state = "transcribing"
+        job.bytes_sent = 0
+        job.segments = 0
+        job.audio_seconds = 0.0
+        segments = SegmentStore()
+
+        async def on_transcript(result, offset):
+            transcript = result.channel.alternatives[0].transcript
+            job.audio_seconds = max(job.audio_seconds, offset + result.start + result.duration)
+            if result.is_final and transcript.strip():
+                segments.append_result(result, offset)
+                job.segments = len(segments)
+                segment = segments.to_dict(len(segments) - 1)
+                search_index.add_segment(job.session_id, len(segments) - 1, segment)
+                await session_store.append(job.session_id, segment)
+
+        options = LiveOptions(
+            model=job.model,
+            language="es",
+            smart_format=True,
+            interim_results=False,
+        )
+        transcriber = LiveTranscriber(self._deepgram, options, on_transcript=on_transcript, realtime=False)
+        started = time.perf_counter()
+        await transcriber.start()
+        try:
+            with open(job.path, "rb") as f:
+                while True:
+                    chunk = await asyncio.to_thread(f.read, BATCH_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    await transcriber.send(chunk)
+                    job.bytes_sent += len(chunk)
+                    if BATCH_FEED_BYTES_PER_SECOND:
+                        # Ritmo máximo: no adelantarse a bytes_sent / tasa
+                        ahead = job.bytes_sent / BATCH_FEED_BYTES_PER_SECOND - (time.perf_counter() - started)
+                        if ahead > 0:
+                            await asyncio.sleep(ahead)
+            if not await transcriber.drain(BATCH_DRAIN_TIMEOUT):
+                raise TimeoutError("Deepgram no terminó de transcribir el archivo")
+        finally:
+            await transcriber.finish()
+        job.timings["transcripcion_s"] = round(time.perf_counter() - started, 3)
+        if job.timings["transcripcion_s"] > 0:
+            metrics.batch_realtime_factor.observe(job.audio_seconds / job.timings["transcripcion_s"])
+        return segments
+
+    def stats(self):
+        states = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {"workers": self.workers, "queued": self.depth, "jobs": states}
+
+
+def _remove_upload(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"No se pudo borrar el archivo subido {path}: {e}")
@@ -0,0 +1 @@
+"""Benchmarks de componentes del backend (se ejecutan con ``python -m benchmarks.<nombre>`` desde backend/)."""
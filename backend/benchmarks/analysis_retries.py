@@ -0,0 +1,143 @@
+# backend/benchmarks/analysis_retries.py
+"""Tasa de reintentos del informe final: salida estructurada frente a texto libre.
+
+Arranca ``stubs.fake_openai`` con ``--incomplete-rate`` (fracción de informes
+incompletos: en texto libre, encabezados que el parser no reconoce, como los de
+gpt-4o en Markdown; con salida estructurada, JSON con campos vacíos o cortado a
+mitad) y ejecuta ``--runs`` análisis con ANALYSIS_STRUCTURED desactivado
+("antes") y activado ("después"). Con el stub las tasas sólo reflejan el
+``--incomplete-rate`` inyectado (la salida lo indica como sintética): sirven
+para comprobar que los reintentos funcionan en ambos modos. Para medir la tasa
+real de informes incompletos, ``--live`` usa el endpoint configurado
+(OPENAI_BASE_URL / OPENAI_API_KEY, ANALYSIS_MODEL) con una transcripción real
+(``--transcript``); cada análisis cuesta una o más llamadas al modelo. Por cada modo indica los informes completos
+a la primera, los reintentos, los que siguen incompletos tras
+ANALYSIS_MAX_ATTEMPTS y las llamadas al modelo por análisis.
+
+Uso (desde backend/):
+    python -m benchmarks.analysis_retries --runs 50 --incomplete-rate 0.4
+    python -m benchmarks.analysis_retries --stream --json resultados.json
+    python -m benchmarks.analysis_retries --live --transcript entrevista.txt --runs 20
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+from benchmarks.load_test import BACKEND_DIR, free_port
+
+
+async def wait_ready(url, timeout=30):
+    async with httpx.AsyncClient() as client:
+        for _ in range(int(timeout / 0.2)):
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} no respondió a tiempo")
+
+
+SAMPLE_TEXT = "El equipo de ventas siente que operaciones no responde a tiempo. " * 20
+
+
+async def run_mode(structured, runs, stream, text):
+    import analysis
+    from llm import llm
+
+    analysis.ANALYSIS_STRUCTURED = structured
+
+    async def ignore_delta(section, delta):
+        pass
+
+    requests_before = llm.requests
+    complete_first = 0
+    attempts = 0
+    incomplete = 0
+    for _ in range(runs):
+        result = await analysis.generate_analysis(text, mode="single", on_delta=ignore_delta if stream else None)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        tries = result["tiempos"]["intentos"]
+        attempts += tries
+        complete_first += tries == 1 and all(result[key] for key in analysis.SECTION_KEYS)
+        incomplete += not all(result[key] for key in analysis.SECTION_KEYS)
+    return {
+        "runs": runs,
+        "complete_first_try": complete_first,
+        "retries": attempts - runs,
+        "retry_rate": round((attempts - runs) / runs, 3),
+        "incomplete_after_retries": incomplete,
+        "llm_calls_per_analysis": round((llm.requests - requests_before) / runs, 3),
+    }
+
+
+async def run_modes(args, text):
+    from llm import llm
+
+    results = {}
+    try:
+        for name, structured in (("texto_libre", False), ("estructurado", True)):
+            results[name] = await run_mode(structured, args.runs, args.stream, text)
+            print(f"{name:<13} " + "  ".join(f"{k}={v}" for k, v in results[name].items()))
+    finally:
+        await llm.close()
+    return results
+
+
+async def main(args):
+    text = SAMPLE_TEXT
+    if args.transcript:
+        with open(args.transcript, encoding="utf-8") as f:
+            text = f.read()
+
+    if args.live:
+        if not os.getenv("OPENAI_API_KEY"):
+            sys.exit("--live necesita OPENAI_API_KEY (y OPENAI_BASE_URL si no es la API de OpenAI)")
+        source = f"endpoint configurado ({os.getenv('OPENAI_BASE_URL') or 'api.openai.com'})"
+        print(f"Origen: {source}; tasa real de informes incompletos")
+        results = await run_modes(args, text)
+    else:
+        source = f"stub sintético (--incomplete-rate {args.incomplete_rate})"
+        print(f"Origen: {source}; las tasas reflejan el valor inyectado, no las del modelo")
+        port = free_port()
+        stub = subprocess.Popen(
+            [sys.executable, "-m", "stubs.fake_openai", "--port", str(port),
+             "--incomplete-rate", str(args.incomplete_rate)],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+        try:
+            await wait_ready(f"http://127.0.0.1:{port}/")
+            results = await run_modes(args, text)
+        finally:
+            stub.terminate()
+            stub.wait()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "source": "live" if args.live else "stub",
+                "incomplete_rate": None if args.live else args.incomplete_rate,
+                "stream": args.stream,
+                "results": results,
+            }, f, indent=2)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--incomplete-rate", type=float, default=0.4,
+                        help="Sólo con el stub: fracción de informes incompletos que devuelve en ambos modos "
+                             "(texto libre sin los encabezados esperados; JSON con campos vacíos o cortado)")
+    parser.add_argument("--live", action="store_true",
+                        help="Usa el endpoint configurado (OPENAI_BASE_URL/OPENAI_API_KEY) en lugar del stub")
+    parser.add_argument("--transcript", help="Archivo de texto a analizar (por defecto, un texto de ejemplo)")
+    parser.add_argument("--stream", action="store_true", help="Informe en streaming (analysis_delta)")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    asyncio.run(main(parser.parse_args()))
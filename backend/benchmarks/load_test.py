@@ -0,0 +1,468 @@
+# backend/benchmarks/load_test.py
+"""Prueba de carga de /ws/transcribe con Deepgram y OpenAI simulados.
+
+Arranca los stubs locales (``stubs.fake_deepgram`` y ``stubs.fake_openai``,
+con latencia y jitter configurables) y la app con uvicorn, y lanza
+``--clients`` clientes simulados. Cada cliente envía audio en trozos al
+ritmo de reproducción (un archivo grabado con ``--audio``, o bytes sintéticos)
+durante ``--seconds``, y después pide ``stop_and_analyze`` con la
+transcripción recibida.
+
+Mide:
+- latencia de transcripción: desde el envío del trozo que completa el audio de
+  un resultado final (campo ``end``) hasta recibirlo;
+- latencia de análisis: desde ``stop_and_analyze`` hasta ``analysis_complete``;
+- retraso del event loop del servidor (``rtt_event_loop_lag_seconds``);
+- memoria residente del servidor por sesión (pico durante la prueba menos la
+  línea base, dividido por el número de clientes).
+
+Los resultados se guardan en JSON (``--output``) y se pueden comparar con una
+ejecución anterior (``--compare``), que marca las métricas que empeoran más de
+``--tolerance``.
+
+Uso (desde backend/):
+    python -m benchmarks.load_test --clients 50 --seconds 30
+    python -m benchmarks.load_test --clients 50 --deepgram-latency 0.2 --openai-latency 1 --openai-jitter 0.5
+    python -m benchmarks.load_test --clients 50 --compare benchmarks/results/anterior.json
+    python -m benchmarks.load_test --url ws://127.0.0.1:8000 --clients 20  # servidor ya arrancado
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+import httpx
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+# Métricas que se comparan con --compare: (ruta en el resultado, True si más alto es peor)
+COMPARED = [
+    (("transcript_latency", "p50"), True),
+    (("transcript_latency", "p99"), True),
+    (("analysis_latency", "p50"), True),
+    (("analysis_latency", "p99"), True),
+    (("event_loop_lag", "p99"), True),
+    (("memory", "per_session_bytes"), True),
+    (("sessions", "failed"), True),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values):
+    """p50, p90, p99 y máximo (interpolación lineal); None si no hay muestras."""
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def q(fraction):
+        position = fraction * (len(ordered) - 1)
+        low = int(position)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+    return {
+        "count": len(ordered),
+        "p50": round(q(0.5), 4),
+        "p90": round(q(0.9), 4),
+        "p99": round(q(0.99), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def parse_metrics(text):
+    """{(nombre, etiquetas): valor} de un texto de exposición de Prometheus."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_labels, value = line.rsplit(" ", 1)
+        name, _, labels = name_labels.partition("{")
+        samples[(name, labels.rstrip("}"))] = float(value.replace("+Inf", "inf"))
+    return samples
+
+
+def histogram_buckets(samples, name):
+    """[(le, acumulado)] de un histograma sin etiquetas propias."""
+    buckets = []
+    for (sample_name, labels), value in samples.items():
+        if sample_name == f"{name}_bucket":
+            le = labels.split('le="', 1)[1].split('"', 1)[0]
+            buckets.append((float(le.replace("+Inf", "inf")), value))
+    return sorted(buckets)
+
+
+def histogram_quantile(fraction, before, after):
+    """Cuantil de las observaciones entre dos lecturas de un histograma (como histogram_quantile de Prometheus)."""
+    counts = [(le, n - dict(before).get(le, 0)) for le, n in after]
+    if not counts or counts[-1][1] <= 0:
+        return None
+    target = fraction * counts[-1][1]
+    previous_le, previous_n = 0.0, 0
+    for le, n in counts:
+        if n >= target:
+            if le == float("inf"):
+                return previous_le  # Por encima de la última cubeta finita
+            if n == previous_n:
+                return le
+            return previous_le + (le - previous_le) * (target - previous_n) / (n - previous_n)
+        previous_le, previous_n = le, n
+    return previous_le
+
+
+class ServerProcesses:
+    """Stubs de Deepgram y OpenAI y la app con uvicorn, en subprocesos."""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = []
+        self.app_port = free_port()
+        self.deepgram_port = free_port()
+        self.openai_port = free_port()
+
+    def _spawn(self, argv, env=None):
+        process = subprocess.Popen(
+            [sys.executable, *argv], cwd=BACKEND_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=None if self.args.verbose else subprocess.DEVNULL,
+        )
+        self.processes.append(process)
+        return process
+
+    async def start(self):
+        args = self.args
+        self._spawn([
+            "-m", "stubs.fake_deepgram", "--port", str(self.deepgram_port),
+            "--latency", str(args.deepgram_latency), "--jitter", str(args.deepgram_jitter),
+            "--bytes-per-second", str(args.bytes_per_second), "--segment-seconds", str(args.segment_seconds),
+        ])
+        self._spawn([
+            "-m", "stubs.fake_openai", "--port", str(self.openai_port),
+            "--latency", str(args.openai_latency), "--jitter", str(args.openai_jitter),
+        ])
+        env = dict(os.environ)
+        env.update({
+            "DEEPGRAM_URL": f"http://127.0.0.1:{self.deepgram_port}",
+            "DEEPGRAM_API_KEY": env.get("DEEPGRAM_API_KEY", "fake"),
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.openai_port}/v1",
+            "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "fake"),
+            "SESSION_STORE": "memory",
+        })
+        env.update(dict(item.split("=", 1) for item in args.env))
+        self.app = self._spawn(
+            ["-m", "uvicorn", "main:app", "--port", str(self.app_port), "--log-level", "warning"], env=env
+        )
+        await self._wait_ready()
+        return f"ws://127.0.0.1:{self.app_port}"
+
+    async def _wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.app.poll() is not None:
+                    raise RuntimeError("La app terminó al arrancar (usa --verbose para ver el error)")
+                try:
+                    if (await client.get(f"http://127.0.0.1:{self.app_port}/")).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise TimeoutError("La app no respondió a tiempo")
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class MetricsSampler:
+    """Lee /metrics periódicamente para seguir la memoria y el retraso del event loop del servidor."""
+
+    def __init__(self, http_url, interval=1.0):
+        self.url = f"{http_url}/metrics"
+        self.interval = interval
+        self.memory = []
+        self.first = None
+        self.last = None
+
+    async def scrape(self, client):
+        samples = parse_metrics((await client.get(self.url)).text)
+        self.memory.append(samples.get(("rtt_process_resident_memory_bytes", ""), 0.0))
+        return samples
+
+    async def run(self, stop):
+        async with httpx.AsyncClient() as client:
+            self.first = await self.scrape(client)
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.last = await self.scrape(client)
+
+
+class SimulatedClient:
+    def __init__(self, index, url, audio, args):
+        self.index = index
+        self.url = f"{url}/ws/transcribe"
+        self.audio = audio
+        self.args = args
+        self.transcript_latencies = []
+        self.analysis_latency = None
+        self.finals = []
+        self.error = None
+        self._sent_at = []  # (bytes enviados tras el trozo, momento del envío)
+        self._analysis_done = asyncio.Event()
+
+    def _sent_time(self, audio_seconds):
+        """Momento en que se envió el trozo que contiene el audio hasta ``audio_seconds``."""
+        needed = audio_seconds * self.args.bytes_per_second
+        for sent_bytes, sent_at in self._sent_at:
+            if sent_bytes >= needed - 1:
+                return sent_at
+        return None
+
+    async def _read(self, ws):
+        async for raw in ws:
+            if isinstance(raw, bytes):
+                continue  # Archivos en modo "binary" (no se usan aquí)
+            message = json.loads(raw)
+            now = time.perf_counter()
+            if message.get("is_final") and message.get("transcript"):
+                self.finals.append(message["transcript"])
+                sent_at = self._sent_time(message.get("end", 0.0))
+                if sent_at is not None:
+                    self.transcript_latencies.append(now - sent_at)
+            elif message.get("analysis_complete"):
+                self.analysis_latency = now - self._stop_sent
+                if message.get("analysis", {}).get("error"):
+                    self.error = message["analysis"]["error"]
+                self._analysis_done.set()
+                return
+            elif message.get("error"):
+                self.error = message["error"]
+
+    async def run(self):
+        args = self.args
+        chunk_bytes = max(1, int(args.bytes_per_second * args.chunk_ms / 1000))
+        total_bytes = int(args.bytes_per_second * args.seconds)
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                await ws.send(json.dumps({"model": "nova-2"}))
+                reader = asyncio.create_task(self._read(ws))
+                started = time.perf_counter()
+                sent = 0
+                position = 0
+                while sent < total_bytes:
+                    # Ritmo de reproducción: el trozo i sale en started + i * chunk_ms
+                    delay = started + sent / args.bytes_per_second - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if self.audio:
+                        if position >= len(self.audio):
+                            position = 0  # El archivo se repite si dura menos que --seconds
+                        chunk = self.audio[position:position + chunk_bytes]
+                        position += len(chunk)
+                    else:
+                        chunk = bytes(chunk_bytes)
+                    await ws.send(chunk)
+                    sent += len(chunk)
+                    self._sent_at.append((sent, time.perf_counter()))
+                # Esperar los últimos resultados antes de pedir el análisis
+                await asyncio.sleep(args.tail_seconds)
+                self._stop_sent = time.perf_counter()
+                await ws.send(json.dumps({
+                    "command": "stop_and_analyze",
+                    "transcript": " ".join(self.finals),
+                    "export_formats": args.export_formats,
+                    "download_mode": "http",
+                    "stream_analysis": False,
+                }))
+                await asyncio.wait_for(self._analysis_done.wait(), args.analysis_timeout)
+                reader.cancel()
+        except Exception as e:
+            self.error = self.error or f"{type(e).__name__}: {e}"
+
+
+async def run_load_test(url, args):
+    http_url = url.replace("ws://", "http://").replace("wss://", "https://")
+    audio = None
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio = f.read()
+
+    stop = asyncio.Event()
+    sampler = MetricsSampler(http_url, args.sample_interval)
+    sampler_task = asyncio.create_task(sampler.run(stop))
+    await asyncio.sleep(args.sample_interval)  # Línea base antes de conectar clientes
+
+    clients = [SimulatedClient(i, url, audio, args) for i in range(args.clients)]
+    started = time.perf_counter()
+    tasks = []
+    for client in clients:
+        tasks.append(asyncio.create_task(client.run()))
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up / args.clients)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler_task
+
+    lag_name = "rtt_event_loop_lag_seconds"
+    lag_before = histogram_buckets(sampler.first, lag_name)
+    lag_after = histogram_buckets(sampler.last, lag_name)
+    lag_count = sampler.last.get((f"{lag_name}_count", ""), 0) - sampler.first.get((f"{lag_name}_count", ""), 0)
+    lag_sum = sampler.last.get((f"{lag_name}_sum", ""), 0) - sampler.first.get((f"{lag_name}_sum", ""), 0)
+    baseline = sampler.memory[0]
+    peak = max(sampler.memory)
+    failed = [client for client in clients if client.error]
+
+    return {
+        "sessions": {
+            "clients": args.clients,
+            "completed": len(clients) - len(failed),
+            "failed": len(failed),
+            "errors": sorted({client.error for client in failed})[:10],
+            "elapsed_s": round(elapsed, 2),
+            "final_segments": sum(len(client.finals) for client in clients),
+        },
+        "transcript_latency": percentiles([x for client in clients for x in client.transcript_latencies]),
+        "analysis_latency": percentiles([c.analysis_latency for c in clients if c.analysis_latency is not None]),
+        "event_loop_lag": {
+            "samples": int(lag_count),
+            "mean": round(lag_sum / lag_count, 4) if lag_count else None,
+            "p50": _round(histogram_quantile(0.5, lag_before, lag_after)),
+            "p99": _round(histogram_quantile(0.99, lag_before, lag_after)),
+        },
+        "memory": {
+            "baseline_bytes": int(baseline),
+            "peak_bytes": int(peak),
+            "per_session_bytes": int((peak - baseline) / args.clients) if args.clients else None,
+        },
+    }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def compare(current, previous, tolerance):
+    """Líneas con la variación de cada métrica respecto a ``previous``; las que empeoran se marcan."""
+    lines = []
+    regressions = 0
+    for path, higher_is_worse in COMPARED:
+        old = previous["results"]
+        new = current["results"]
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+        worse = change > tolerance if higher_is_worse else change < -tolerance
+        regressions += worse
+        lines.append(f"  {'.'.join(path):<32} {old:>12.4g} -> {new:>12.4g} ({change:+.1%}){'  << EMPEORA' if worse else ''}")
+    return lines, regressions
+
+
+def print_summary(results):
+    sessions = results["sessions"]
+    print(f"Sesiones: {sessions['completed']}/{sessions['clients']} completadas en {sessions['elapsed_s']} s"
+          f" ({sessions['final_segments']} segmentos finales)")
+    for error in sessions["errors"]:
+        print(f"  error: {error}")
+    for name in ("transcript_latency", "analysis_latency", "event_loop_lag"):
+        values = results[name]
+        print(f"{name:<20} " + "  ".join(f"{k}={v}" for k, v in values.items()))
+    memory = results["memory"]
+    print(f"{'memory':<20} base={memory['baseline_bytes'] / 1e6:.1f}MB pico={memory['peak_bytes'] / 1e6:.1f}MB"
+          f" por_sesión={(memory['per_session_bytes'] or 0) / 1e3:.0f}KB")
+
+
+async def main(args):
+    servers = None
+    try:
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            servers = ServerProcesses(args)
+            url = await servers.start()
+        results = await run_load_test(url, args)
+    finally:
+        if servers:
+            servers.stop()
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        "results": results,
+    }
+    print_summary(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        lines, regressions = compare(report, previous, args.tolerance)
+        print(f"Comparación con {args.compare}:")
+        differences = [
+            key for key in ("clients", "seconds", "chunk_ms", "deepgram_latency", "openai_latency", "env")
+            if previous.get("config", {}).get(key) != report["config"][key]
+        ]
+        if differences:
+            print(f"  (aviso: configuración distinta en {', '.join(differences)})")
+        print("\n".join(lines))
+        if regressions:
+            print(f"{regressions} métricas empeoran más de un {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10, help="Sesiones simultáneas")
+    parser.add_argument("--seconds", type=float, default=20.0, help="Segundos de audio por sesión")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Segundos para conectar a todos los clientes")
+    parser.add_argument("--chunk-ms", type=int, default=250, help="Duración de cada trozo de audio")
+    parser.add_argument("--bytes-per-second", type=int, default=4000, help="Tasa de bits del audio")
+    parser.add_argument("--audio", help="Archivo de audio grabado que se envía en bucle (por defecto, bytes nulos)")
+    parser.add_argument("--tail-seconds", type=float, default=2.0,
+                        help="Espera tras el último trozo antes de stop_and_analyze")
+    parser.add_argument("--export-formats", nargs="*", default=["excel"])
+    parser.add_argument("--analysis-timeout", type=float, default=300.0)
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Segundos entre lecturas de /metrics")
+    parser.add_argument("--url", help="Servidor ya arrancado (ws://host:puerto); si no, se arrancan app y stubs")
+    parser.add_argument("--deepgram-latency", type=float, default=0.1)
+    parser.add_argument("--deepgram-jitter", type=float, default=0.05)
+    parser.add_argument("--segment-seconds", type=float, default=2.0, help="Audio por resultado final del stub")
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--openai-jitter", type=float, default=0.2)
+    parser.add_argument("--env", nargs="*", default=[], metavar="CLAVE=VALOR",
+                        help="Variables de entorno extra para la app (p. ej. AUDIO_POLICY=buffer)")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto benchmarks/results/load_<fecha>.json)")
+    parser.add_argument("--compare", help="Resultados anteriores con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento tolerado en --compare")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs de la app")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,205 @@
+# backend/benchmarks/report_render.py
+"""Benchmark del renderizado de reportes: plantillas precompiladas frente a la
+implementación anterior (pandas para Excel, hoja de estilos y documento nuevos
+en cada llamada para PDF y Word).
+
+Mide, por formato y tamaño de transcripción, el mejor tiempo de ``--repeat``
+ejecuciones y el pico de memoria (``tracemalloc``, en una ejecución aparte).
+
+Uso (desde backend/):
+    python -m benchmarks.report_render
+    python -m benchmarks.report_render --words 1000 10000 --formats pdf --json resultados.json
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+import pandas as pd
+from docx import Document
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+
+from report_templates import SECTIONS, TIMECODED_TITLE, load_templates
+from reports import RENDERERS
+from segments import format_timestamp
+
+VOCABULARY = (
+    "la reunión con el área de ventas fue productiva aunque hubo fricción entre los jefes "
+    "y operaciones por los plazos de entrega el equipo siente que falta planificación semanal."
+).split()
+SEGMENT_WORDS = 10  # Palabras por segmento con marcas de tiempo (~3 s de audio)
+
+
+# --- Implementación anterior (reports.py antes de las plantillas) ---
+
+def legacy_render_excel(text, analysis, segments=None):
+    """Genera un archivo Excel con el análisis.
+
+    ``segments`` (opcional) es una lista de (inicio, fin, texto) que se añade
+    como transcripción con marcas de tiempo; lo mismo en PDF y Word.
+    """
+    df = pd.DataFrame({
+        "Transcripción Completa": [text],
+        "Resumen General": [analysis.get("resumen", "")],
+        "Percepciones por Área": [analysis.get("percepciones_por_area", "")],
+        "Relaciones entre Áreas": [analysis.get("relaciones_entre_areas", "")],
+        "Factores Experiencia": [analysis.get("factores_experiencia", "")],
+        "Análisis de Sentimiento": [analysis.get("analisis_sentimiento", "")],
+        "Recomendaciones": [analysis.get("recomendaciones", "")]
+    })
+
+    # Guardar en un buffer en memoria
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False)
+        if segments:
+            pd.DataFrame(
+                [(format_timestamp(start), format_timestamp(end), text) for start, end, text in segments],
+                columns=["Inicio", "Fin", "Texto"],
+            ).to_excel(writer, sheet_name="Marcas de tiempo", index=False)
+    return output.getvalue()
+
+
+def legacy_render_pdf(text, analysis, segments=None):
+    """Genera un archivo PDF con el análisis."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    heading_style = styles["Heading2"]
+    normal_style = styles["Normal"]
+
+    story = [Paragraph("Análisis de Transcripción", styles["Title"]), Spacer(1, 12)]
+    for key, title in SECTIONS:
+        story.append(Paragraph(title, heading_style))
+        story.append(Paragraph(analysis.get(key, ""), normal_style))
+        story.append(Spacer(1, 12))
+
+    story.append(Paragraph("Transcripción Completa", heading_style))
+    story.append(Paragraph(text, normal_style))
+
+    if segments:
+        story.append(Spacer(1, 12))
+        story.append(Paragraph(TIMECODED_TITLE, heading_style))
+        for start, _, segment_text in segments:
+            story.append(Paragraph(f"<b>[{format_timestamp(start)}]</b> {escape(segment_text)}", normal_style))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def legacy_render_word(text, analysis, segments=None):
+    """Genera un archivo Word con el análisis."""
+    doc = Document()
+    doc.add_heading("Análisis de Transcripción", 0)
+    for key, title in SECTIONS:
+        doc.add_heading(title, level=1)
+        doc.add_paragraph(analysis.get(key, ""))
+
+    doc.add_heading("Transcripción Completa", level=1)
+    doc.add_paragraph(text)
+
+    if segments:
+        doc.add_heading(TIMECODED_TITLE, level=1)
+        for start, _, segment_text in segments:
+            paragraph = doc.add_paragraph()
+            paragraph.add_run(f"[{format_timestamp(start)}] ").bold = True
+            paragraph.add_run(segment_text)
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+LEGACY_RENDERERS = {
+    "excel": legacy_render_excel,
+    "pdf": legacy_render_pdf,
+    "word": legacy_render_word,
+}
+
+
+def make_inputs(words, seed=0):
+    """Transcripción de ``words`` palabras, un análisis de ~300 palabras por sección y sus segmentos."""
+    rng = random.Random(seed)
+    tokens = [rng.choice(VOCABULARY) for _ in range(words)]
+    text = " ".join(tokens)
+    analysis = {key: " ".join(rng.choice(VOCABULARY) for _ in range(300)) for key, _ in SECTIONS}
+    segments = [
+        (i / SEGMENT_WORDS * 3.0, (i / SEGMENT_WORDS + 1) * 3.0, " ".join(tokens[i:i + SEGMENT_WORDS]))
+        for i in range(0, words, SEGMENT_WORDS)
+    ]
+    return text, analysis, segments
+
+
+def measure(render, text, analysis, segments, repeat):
+    """(mejor tiempo en s, pico de memoria en bytes, tamaño del archivo)."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = render(text, analysis, segments)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        render(text, analysis, segments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, len(data)
+
+
+def run(word_counts, formats, repeat, with_segments):
+    load_templates()  # Como en el pool: las plantillas se construyen al arrancar el proceso
+    results = []
+    for words in word_counts:
+        text, analysis, segments = make_inputs(words)
+        segments = segments if with_segments else None
+        for format_name in formats:
+            row = {"words": words, "format": format_name}
+            for variant, renderers in (("legacy", LEGACY_RENDERERS), ("template", RENDERERS)):
+                seconds, peak, size = measure(renderers[format_name], text, analysis, segments, repeat)
+                row[variant] = {"seconds": round(seconds, 4), "peak_bytes": peak, "size_bytes": size}
+            row["speedup"] = round(row["legacy"]["seconds"] / row["template"]["seconds"], 2)
+            row["memory_ratio"] = round(row["legacy"]["peak_bytes"] / max(1, row["template"]["peak_bytes"]), 2)
+            results.append(row)
+            print(
+                f"{words:>7} {format_name:<6}"
+                f" {row['legacy']['seconds']:>9.3f}s {row['template']['seconds']:>9.3f}s {row['speedup']:>7.1f}x"
+                f" {row['legacy']['peak_bytes'] / 1e6:>9.1f}MB {row['template']['peak_bytes'] / 1e6:>9.1f}MB",
+                flush=True,
+            )
+    return results
+
+
+if __name__ == "__main__":
+    import logging
+    import warnings
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--formats", nargs="+", default=list(RENDERERS), choices=list(RENDERERS))
+    parser.add_argument("--repeat", type=int, default=3, help="Ejecuciones por medida (se toma la mejor)")
+    parser.add_argument("--no-segments", action="store_true", help="Sin transcripción con marcas de tiempo")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    args = parser.parse_args()
+
+    # Ambas implementaciones avisan de las celdas de Excel truncadas en cada llamada
+    warnings.simplefilter("ignore")
+    logging.getLogger("report_templates").setLevel(logging.ERROR)
+    print(f"{'palabras':>7} {'formato':<6} {'anterior':>10} {'plantilla':>10} {'mejora':>8} {'mem ant.':>11} {'mem plant.':>11}")
+    results = run(args.words, args.formats, args.repeat, not args.no_segments)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "segments": not args.no_segments,
+                "results": results,
+            }, f, indent=2)
+        print(f"Resultados guardados en {args.json}")
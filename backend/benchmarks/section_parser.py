@@ -0,0 +1,149 @@
+# backend/benchmarks/section_parser.py
+"""Parser de encabezados del informe en texto libre: secciones correctas y velocidad.
+
+Informes en Markdown como los de gpt-4o, con listas dentro de las secciones
+("- **Relaciones con Operaciones**: ...", "  - Sentimiento: ...") que antes
+abrían una sección posterior antes de su encabezado real. Cada informe se
+analiza de una vez y en streaming con fragmentos de distinto tamaño, y se
+comprueba que cada sección empieza y termina con el texto esperado. Termina
+con código 1 si algún caso falla. Al final mide los caracteres por segundo
+del parser en streaming.
+
+Uso (desde backend/):
+    python -m benchmarks.section_parser
+    python -m benchmarks.section_parser --repeat 200 --seed 7
+"""
+import sys
+import time
+import random
+import argparse
+
+from analysis import SECTION_KEYS, SectionStreamParser, parse_sections
+
+# (nombre, informe, {sección: (inicio esperado, final esperado)})
+CASES = [
+    ("listas con negrita dentro de las secciones", """## Resumen general
+La entrevista trata la coordinación entre áreas.
+
+## Percepciones por área
+- **Ventas**: exigente.
+- **Relaciones con Operaciones**: tensas por los plazos.
+  - Sentimiento: negativo en el equipo.
+
+## Relaciones entre áreas
+Hay fricción entre Ventas y Operaciones.
+
+## Factores que afectan la experiencia del empleado
+- **Factores positivos**: buen ambiente.
+
+## Análisis de sentimiento
+Neutral.
+- Sentimiento: mixto en Ventas.
+
+## Recomendaciones
+1. Definir acuerdos de servicio.
+2. Recomendaciones: revisar la planificación.""", {
+        "resumen": ("La entrevista", "entre áreas."),
+        "percepciones_por_area": ("- **Ventas**", "negativo en el equipo."),
+        "relaciones_entre_areas": ("Hay fricción", "Operaciones."),
+        "factores_experiencia": ("- **Factores positivos**", "buen ambiente."),
+        "analisis_sentimiento": ("Neutral.", "mixto en Ventas."),
+        "recomendaciones": ("1. Definir", "revisar la planificación."),
+    }),
+    ("encabezados cortos en negrita y listas con el mismo nombre", """**Resumen**
+Texto del resumen.
+
+**Percepciones**
+- Relaciones: buenas con RR. HH.
+* Factores: la carga de trabajo.
+**Relaciones con Operaciones**
+Tensas.
+
+**Relaciones**
+Fricción.
+
+### Factores
+- Positivos: ambiente.
+
+**Sentimiento:**
+Neutral.
+
+1. **Recomendaciones**
+- Planificar.""", {
+        "resumen": ("Texto del resumen.", "Texto del resumen."),
+        "percepciones_por_area": ("- Relaciones: buenas", "Tensas."),
+        "relaciones_entre_areas": ("Fricción.", "Fricción."),
+        "factores_experiencia": ("- Positivos", "ambiente."),
+        "analisis_sentimiento": ("Neutral.", "Neutral."),
+        "recomendaciones": ("- Planificar.", "- Planificar."),
+    }),
+    ("encabezado largo con el contenido en la misma línea", """Resumen general: La entrevista trata sobre la carga.
+
+Percepciones por área: Ventas se percibe como exigente.
+- Relaciones: buenas.
+
+Relaciones entre áreas: Fricción por los plazos.
+
+Factores que afectan positiva o negativamente la experiencia del empleado: Ambiente.
+
+Análisis de sentimiento general: Neutral.
+
+Recomendaciones accionables: Acuerdos de servicio.""", {
+        "resumen": ("La entrevista", "la carga."),
+        "percepciones_por_area": ("Ventas se percibe", "- Relaciones: buenas."),
+        "relaciones_entre_areas": ("Fricción", "los plazos."),
+        "factores_experiencia": ("Ambiente.", "Ambiente."),
+        "analisis_sentimiento": ("Neutral.", "Neutral."),
+        "recomendaciones": ("Acuerdos", "de servicio."),
+    }),
+]
+
+
+def stream(text, max_chunk, rng):
+    parser = SectionStreamParser()
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, max_chunk)
+        parser.feed(text[position:position + size])
+        position += size
+    parser.close()
+    return parser.result()
+
+
+def check(name, text, expected, rng):
+    """Lista de errores del caso: secciones mal asignadas o distintas en streaming."""
+    errors = []
+    whole = {key: value for key, value in parse_sections(text).items() if key in SECTION_KEYS}
+    for key, (start, end) in expected.items():
+        if not (whole[key].startswith(start) and whole[key].endswith(end)):
+            errors.append(f"{name}: {key} = {whole[key]!r}")
+    for max_chunk in (1, 3, 8, 64):
+        if stream(text, max_chunk, rng) != whole:
+            errors.append(f"{name}: el resultado en streaming (fragmentos de hasta {max_chunk}) no coincide")
+    return errors
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    errors = []
+    for name, text, expected in CASES:
+        case_errors = check(name, text, expected, rng)
+        print(f"{'OK   ' if not case_errors else 'FALLO'} {name}")
+        errors.extend(case_errors)
+    for error in errors:
+        print(f"  {error}")
+
+    text = "\n\n".join(report for _, report, _ in CASES)
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        stream(text, 16, rng)
+    seconds = time.perf_counter() - started
+    print(f"Streaming (fragmentos de hasta 16 caracteres): {len(text) * args.repeat / seconds / 1e6:.2f} M caracteres/s")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100, help="Repeticiones para medir la velocidad")
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,156 @@
+# backend/benchmarks/startup.py
+"""Arranque en frío de la app: tiempo de importación por dependencia y hasta el primer WebSocket.
+
+1. Importa ``main`` en un proceso nuevo con ``python -X importtime`` y suma el
+   tiempo propio de cada módulo por paquete de primer nivel (openai, deepgram,
+   reportlab...). Indica también qué librerías pesadas quedan cargadas tras
+   importar ``main`` (las de exportación deberían cargarse sólo en el pool de
+   renderizado).
+2. Arranca los stubs de Deepgram y OpenAI, lanza uvicorn y mide desde el
+   lanzamiento hasta que el primer WebSocket de /ws/transcribe recibe el
+   mensaje de sesión (es decir, hasta poder transcribir).
+
+Uso (desde backend/):
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --top 15 --json arranque.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+import websockets
+
+from benchmarks.load_test import BACKEND_DIR, free_port
+
+HEAVY_MODULES = ("openai", "deepgram", "pandas", "numpy", "reportlab", "docx", "openpyxl", "fastapi")
+
+IMPORT_PROBE = (
+    "import sys, time, json\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))\n"
+)
+
+
+def app_env(extra=None):
+    env = dict(os.environ)
+    env.setdefault("DEEPGRAM_API_KEY", "fake")
+    env.setdefault("OPENAI_API_KEY", "fake")
+    env["SESSION_STORE"] = "memory"
+    env.update(extra or {})
+    return env
+
+
+def measure_imports(env):
+    """Importa main con -X importtime; devuelve segundos totales, por paquete y módulos pesados cargados."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_PROBE % (HEAVY_MODULES,)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    by_package = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us = int(fields[0])
+        except ValueError:
+            continue  # Cabecera
+        by_package[fields[2].strip().split(".")[0]] += self_us / 1e6
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return probe["seconds"], dict(by_package), probe["loaded"]
+
+
+async def first_websocket(env, timeout=60):
+    """Segundos desde lanzar uvicorn hasta que un WebSocket recibe el mensaje de sesión."""
+    port = free_port()
+    started = time.monotonic()
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.monotonic() - started < timeout:
+            if app.poll() is not None:
+                raise RuntimeError("La app terminó al arrancar")
+            try:
+                async with websockets.connect(f"ws://127.0.0.1:{port}/ws/transcribe", open_timeout=timeout) as ws:
+                    await ws.send(json.dumps({"model": "nova-2"}))
+                    async for message in ws:
+                        if json.loads(message).get("status") == "session":
+                            return time.monotonic() - started
+            except (OSError, websockets.InvalidHandshake):
+                await asyncio.sleep(0.02)
+        raise TimeoutError("La app no aceptó el WebSocket a tiempo")
+    finally:
+        app.terminate()
+        app.wait()
+
+
+def spawn_stubs():
+    deepgram_port, openai_port = free_port(), free_port()
+    stubs = [
+        subprocess.Popen([sys.executable, "-m", module, "--port", str(port)], cwd=BACKEND_DIR,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for module, port in (("stubs.fake_deepgram", deepgram_port), ("stubs.fake_openai", openai_port))
+    ]
+    env = {
+        "DEEPGRAM_URL": f"http://127.0.0.1:{deepgram_port}",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+    }
+    return stubs, env
+
+
+async def main(args):
+    stubs, stub_env = spawn_stubs()
+    env = app_env(stub_env)
+    try:
+        await asyncio.sleep(1.0)  # Que los stubs estén escuchando antes de medir
+        imports = [measure_imports(env) for _ in range(args.repeat)]
+        websocket_times = [await first_websocket(env) for _ in range(args.repeat)]
+    finally:
+        for stub in stubs:
+            stub.terminate()
+            stub.wait()
+
+    import_seconds = [seconds for seconds, _, _ in imports]
+    packages = defaultdict(list)
+    for _, by_package, _ in imports:
+        for package, seconds in by_package.items():
+            packages[package].append(seconds)
+    per_package = sorted(((statistics.median(v), k) for k, v in packages.items()), reverse=True)
+    loaded = imports[-1][2]
+
+    print(f"import main: mediana {statistics.median(import_seconds):.3f}s  (mín {min(import_seconds):.3f}s)")
+    print(f"{'paquete':<22}{'importación':>12}")
+    for seconds, package in per_package[:args.top]:
+        print(f"{package:<22}{seconds:>11.3f}s")
+    print(f"Librerías pesadas cargadas por main: {', '.join(loaded) or 'ninguna'}")
+    print(f"Hasta el primer WebSocket aceptado: mediana {statistics.median(websocket_times):.3f}s"
+          f"  (mín {min(websocket_times):.3f}s, máx {max(websocket_times):.3f}s)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "repeat": args.repeat,
+                "import_main_s": import_seconds,
+                "import_by_package_s": {package: seconds for seconds, package in per_package},
+                "heavy_modules_loaded": loaded,
+                "first_websocket_s": websocket_times,
+            }, f, indent=2)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12, help="Paquetes que se muestran, de más a menos lento")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,176 @@
+# backend/cache.py
+"""Caché direccionada por contenido para análisis y reportes generados.
+
+Dos niveles: un LRU en memoria acotado por bytes y, opcionalmente, una base
+SQLite en disco (CACHE_DB_PATH) con expiración por TTL. Las claves son hashes
+del contenido, así que reintentos o peticiones de otro formato para la misma
+transcripción reutilizan el trabajo ya hecho.
+"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH")  # Sin definir: sólo caché en memoria
+
+_KIND_BYTES = "bytes"
+_KIND_JSON = "json"
+
+
+def content_key(*parts):
+    """Hash SHA-256 de las partes (texto) que determinan el contenido cacheado."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class _DiskTier:
+    """Nivel en disco sobre SQLite; los métodos son bloqueantes (usar desde un hilo)."""
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return row[0], bytes(row[1]), row[2]
+
+    def set(self, key, kind, value, created):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, kind, value, created) VALUES (?, ?, ?, ?)",
+                (key, kind, value, created),
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ReportCache:
+    """Caché de dos niveles para dicts JSON (análisis) y bytes (archivos)."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS, db_path=CACHE_DB_PATH):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (kind, payload, created)
+        self._size = 0
+        self._disk = _DiskTier(db_path, ttl) if db_path else None
+        self._sets_since_purge = 0
+        # Métricas
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _remember(self, key, kind, payload, created):
+        if len(payload) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old[1])
+        self._entries[key] = (kind, payload, created)
+        self._size += len(payload)
+        while self._size > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    @staticmethod
+    def _decode(kind, payload):
+        return json.loads(payload) if kind == _KIND_JSON else payload
+
+    async def get(self, key):
+        """Devuelve el valor cacheado o None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.time() - entry[2] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits_memory += 1
+                metrics.cache_requests.inc(result="memory")
+                return self._decode(entry[0], entry[1])
+            self._size -= len(entry[1])
+            del self._entries[key]
+
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key)
+            if row is not None:
+                self.hits_disk += 1
+                metrics.cache_requests.inc(result="disk")
+                self._remember(key, *row)
+                return self._decode(row[0], row[1])
+
+        self.misses += 1
+        metrics.cache_requests.inc(result="miss")
+        return None
+
+    async def set(self, key, value):
+        """Guarda un dict serializable en JSON o un objeto bytes."""
+        if isinstance(value, (bytes, bytearray)):
+            kind, payload = _KIND_BYTES, bytes(value)
+        else:
+            kind, payload = _KIND_JSON, json.dumps(value, ensure_ascii=False).encode("utf-8")
+        created = time.time()
+        self._remember(key, kind, payload, created)
+
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, kind, payload, created)
+            self._sets_since_purge += 1
+            if self._sets_since_purge >= 100:
+                self._sets_since_purge = 0
+                await self.purge_expired()
+
+    async def purge_expired(self):
+        """Elimina del disco las entradas con más de ``ttl`` segundos."""
+        if self._disk is not None:
+            deleted = await asyncio.to_thread(self._disk.purge_expired)
+            if deleted:
+                logger.info(f"Caché: {deleted} entradas expiradas eliminadas del disco")
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+
+report_cache = ReportCache()
@@ -0,0 +1,333 @@
+# backend/live.py
+"""Conexión en vivo con Deepgram con reconexión automática.
+
+``LiveTranscriber`` envuelve la conexión ``asynclive`` de una sesión. Guarda en
+un buffer circular los últimos DEEPGRAM_REPLAY_SECONDS de audio; si Deepgram
+cierra la conexión o da error a mitad de la entrevista, abre una nueva con las
+mismas ``LiveOptions``, reenvía el audio guardado y descarta las palabras de
+los resultados que ya se habían recibido antes del corte.
+
+Para alinear los resultados de conexiones distintas se usa una línea de tiempo
+de reloj: el audio llega en tiempo real, así que el segundo ``t`` de una
+conexión corresponde aproximadamente a ``época + t``, donde la época es la
+hora de llegada del primer audio enviado por esa conexión.
+
+Si el audio pasa antes por el preprocesado (preprocess.py), que quita los
+silencios, esa aproximación deja de valer: con ``timeline=`` el transcriptor
+cuenta los bytes enviados y el preprocesador traduce cada segundo enviado al
+segundo de audio recibido correspondiente.
+
+Con ``realtime=False`` (archivos enviados más rápido que en tiempo real) el
+reloj no sirve para alinear: no hay reconexión ni métrica de latencia, y una
+conexión perdida hace fallar el envío para que el llamador reintente.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+
+from deepgram import LiveTranscriptionEvents
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEEPGRAM_REPLAY_SECONDS = float(os.getenv("DEEPGRAM_REPLAY_SECONDS", "8"))
+DEEPGRAM_RECONNECT_ATTEMPTS = int(os.getenv("DEEPGRAM_RECONNECT_ATTEMPTS", "5"))
+# Si la conexión se pierde sin audio reciente (p. ej. una pausa larga), la
+# reconexión se hace al llegar el siguiente audio en lugar de inmediatamente
+IDLE_RECONNECT_SECONDS = 5.0
+# Tolerancia al comparar tiempos de conexiones distintas
+DEDUP_TOLERANCE_SECONDS = 0.3
+
+
+class LiveTranscriber:
+    """Conexión de Deepgram de una sesión, con buffer de reenvío y reconexión."""
+
+    def __init__(self, deepgram, options, on_transcript, on_status=None,
+                 replay_seconds=DEEPGRAM_REPLAY_SECONDS, replay_header=True, time_offset=0.0, realtime=True,
+                 timeline=None):
+        self._deepgram = deepgram
+        self._options = options
+        # async (result, offset) -> None; offset convierte los tiempos del resultado en segundos de la sesión
+        self._on_transcript = on_transcript
+        self._on_status = on_status          # async (estado, detalle) -> None, opcional
+        self.replay_seconds = replay_seconds
+        # Con audio en contenedor (WebM) la nueva conexión necesita la cabecera del primer trozo
+        self.replay_header = replay_header
+        self.realtime = realtime
+        # Opcional (AudioPreprocessor): started, bytes_per_second y source_seconds(segundos enviados)
+        self._timeline = timeline
+        self._connection = None
+        self._ring = deque()   # (seq, llegada, bytes, bytes enviados antes de este trozo)
+        self._seq = 0
+        self._sent_bytes = 0
+        self._stream_base = 0  # bytes enviados antes del primer trozo de la conexión actual
+        self._header = None    # (llegada, bytes, duración estimada)
+        self._epoch = None     # llegada del primer audio de la conexión actual
+        self._origin = None    # llegada del primer audio de la sesión
+        self.time_offset = time_offset  # segundos ya transcritos antes (sesión reanudada)
+        self._generation = 0   # número de conexión (0 = la original)
+        self._last_final_end = None  # fin (en la línea de tiempo de reloj) del último final aceptado
+        self._last_audio = None
+        self._lost = False
+        self._closing = False
+        self._reconnect_task = None
+        self._drained = asyncio.Event()  # Metadata final de Deepgram tras CloseStream
+        # Métricas
+        self.reconnects = 0
+        self.reconnect_failures = 0
+        self.last_reconnect_seconds = 0.0
+        self.max_reconnect_seconds = 0.0
+        self.replayed_bytes = 0
+        self.duplicates_dropped = 0
+
+    def _new_connection(self):
+        connection = self._deepgram.listen.asynclive.v("1")
+        generation = self._generation
+
+        async def on_message(client, result, **kwargs):
+            if generation == self._generation:
+                await self._handle_result(result)
+
+        async def on_metadata(client, metadata, **kwargs):
+            logger.debug(f"Deepgram metadata: {metadata}")
+            if generation == self._generation:
+                self._drained.set()
+
+        async def on_speech_started(client, speech_started, **kwargs):
+            logger.debug("Deepgram speech_started")
+
+        async def on_utterance_end(client, utterance_end, **kwargs):
+            logger.debug("Deepgram utterance_end")
+
+        async def on_error(client, error, **kwargs):
+            error_message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            logger.error(f"Error de Deepgram: {error_message}")
+            if generation == self._generation:
+                self._connection_lost(f"error: {error_message}")
+
+        async def on_open(client, open_event, **kwargs):
+            logger.info(f"Conexión Deepgram abierta: {open_event}")
+
+        async def on_close(client, close_event=None, **kwargs):
+            logger.info(f"Conexión Deepgram cerrada: {close_event}")
+            if generation == self._generation:
+                self._connection_lost("cerrada por Deepgram")
+
+        connection.on(LiveTranscriptionEvents.Transcript, on_message)
+        connection.on(LiveTranscriptionEvents.Metadata, on_metadata)
+        connection.on(LiveTranscriptionEvents.SpeechStarted, on_speech_started)
+        connection.on(LiveTranscriptionEvents.UtteranceEnd, on_utterance_end)
+        connection.on(LiveTranscriptionEvents.Error, on_error)
+        connection.on(LiveTranscriptionEvents.Open, on_open)
+        connection.on(LiveTranscriptionEvents.Close, on_close)
+        return connection
+
+    async def start(self):
+        self._connection = self._new_connection()
+        if await self._connection.start(self._options) is False:
+            raise ConnectionError("No se pudo iniciar la conexión con Deepgram")
+
+    async def send(self, data):
+        """Envía audio a Deepgram y lo guarda en el buffer de reenvío."""
+        now = time.monotonic()
+        if not self.realtime:
+            if self._lost:
+                raise ConnectionError("Se perdió la conexión con Deepgram")
+            await self._connection.send(data)
+            return
+        offset = self._remember(now, data)
+        if self._lost and self._reconnect_task is None:
+            self._schedule_reconnect()
+        if self._reconnect_task is not None:
+            return  # Se reenviará desde el buffer al reconectar
+        if self._epoch is None:
+            self._epoch = now
+            self._stream_base = offset
+        if self._origin is None:
+            self._origin = now
+        await self._connection.send(data)
+
+    def _remember(self, now, data):
+        if self._header is None:
+            self._header = [now, data, 0.0]
+        elif self._header[2] == 0.0:
+            self._header[2] = now - self._header[0]  # duración aproximada del primer trozo
+        offset = self._sent_bytes
+        self._ring.append((self._seq, now, data, offset))
+        self._seq += 1
+        self._sent_bytes += len(data)
+        self._last_audio = now
+        while self._ring and now - self._ring[0][1] > self.replay_seconds:
+            self._ring.popleft()
+        return offset
+
+    def _connection_lost(self, reason):
+        if self._closing or self._lost:
+            return
+        self._lost = True
+        logger.warning(f"Conexión con Deepgram perdida ({reason})")
+        if not self.realtime:
+            self._drained.set()  # Despierta a drain(), que comprobará _lost
+            return
+        recent_audio = self._last_audio is not None and time.monotonic() - self._last_audio < IDLE_RECONNECT_SECONDS
+        if recent_audio:
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        # En una tarea aparte: finish() de la conexión vieja cancela la tarea que ejecuta sus handlers
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _notify(self, status, detail=None):
+        if self._on_status:
+            try:
+                await self._on_status(status, detail)
+            except Exception as e:
+                logger.warning(f"No se pudo notificar el estado '{status}': {e}")
+
+    async def _reconnect(self):
+        started = time.monotonic()
+        await self._notify("reconnecting")
+        old = self._connection
+        self._generation += 1
+        try:
+            await old.finish()
+        except Exception as e:
+            logger.debug(f"Error al cerrar la conexión anterior: {e}")
+
+        for attempt in range(DEEPGRAM_RECONNECT_ATTEMPTS):
+            if self._closing:
+                return
+            try:
+                self._connection = self._new_connection()
+                if await self._connection.start(self._options) is False:
+                    raise ConnectionError("start() devolvió False")
+                await self._replay()
+                break
+            except Exception as e:
+                logger.error(f"Reintento {attempt + 1} de conexión con Deepgram fallido: {e}")
+                self._generation += 1
+                await asyncio.sleep(min(8.0, 0.5 * 2 ** attempt))
+        else:
+            self.reconnect_failures += 1
+            metrics.deepgram_reconnects.inc(result="failed")
+            self._reconnect_task = None
+            await self._notify("reconnect_failed")
+            return
+
+        elapsed = time.monotonic() - started
+        self.reconnects += 1
+        self.last_reconnect_seconds = elapsed
+        self.max_reconnect_seconds = max(self.max_reconnect_seconds, elapsed)
+        metrics.deepgram_reconnects.inc(result="ok")
+        metrics.deepgram_reconnect_seconds.observe(elapsed)
+        self._lost = False
+        self._reconnect_task = None
+        logger.info(f"Reconectado con Deepgram en {elapsed:.2f}s (reconexión nº {self.reconnects})")
+        await self._notify("reconnected", {"seconds": round(elapsed, 3)})
+
+    async def _replay(self):
+        """Reenvía el buffer (y lo que llegue mientras tanto) a la conexión nueva."""
+        if not self._ring:
+            self._epoch = None
+            return
+        first_seq, first_arrival, _, first_offset = self._ring[0]
+        self._epoch = first_arrival
+        self._stream_base = first_offset
+        if self.replay_header and first_seq != 0 and self._header is not None:
+            # La cabecera del contenedor va delante: su audio desplaza la línea de tiempo
+            await self._connection.send(self._header[1])
+            self._epoch -= self._header[2]
+        next_seq = first_seq
+        while True:
+            pending = [entry for entry in self._ring if entry[0] >= next_seq]
+            if not pending:
+                return
+            for seq, _, data, _ in pending:
+                await self._connection.send(data)
+                self.replayed_bytes += len(data)
+                next_seq = seq + 1
+
+    async def _handle_result(self, result):
+        """Pasa el resultado a la sesión, descartando lo ya recibido antes de reconectar."""
+        epoch = self._epoch if self._epoch is not None else time.monotonic()
+        if self._timeline is not None:
+            # Tiempos del audio enviado -> segundos de la sesión (el preprocesado quitó silencios)
+            base = self._stream_base / self._timeline.bytes_per_second
+
+            def clock(t):
+                return self._timeline.started + self._timeline.source_seconds(base + t)
+        else:
+            def clock(t):
+                return epoch + t
+        start = clock(result.start)
+        end = clock(result.start + result.duration)
+        if self._generation > 0 and self._last_final_end is not None:
+            boundary = self._last_final_end + DEDUP_TOLERANCE_SECONDS
+            if end <= boundary:
+                if result.is_final:
+                    self.duplicates_dropped += 1
+                return
+            alternative = result.channel.alternatives[0]
+            if start < boundary and alternative.words:
+                # Resultado a caballo del corte: quedarse sólo con las palabras nuevas
+                words = [w for w in alternative.words if clock((w.start + w.end) / 2) > self._last_final_end]
+                alternative.words = words
+                alternative.transcript = " ".join(w.punctuated_word or w.word for w in words)
+        if self._epoch is not None and self.realtime:
+            # Latencia: desde que llegó el final del audio transcrito hasta ahora
+            latency = max(0.0, time.monotonic() - end)
+            metrics.deepgram_result_latency.observe(latency, final="true" if result.is_final else "false")
+        if result.is_final:
+            self._last_final_end = max(end, self._last_final_end or end)
+        if self._timeline is not None:
+            started = self._timeline.started
+            for word in result.channel.alternatives[0].words or []:
+                word.start, word.end = clock(word.start) - started, clock(word.end) - started
+            result.start, result.duration = start - started, end - start
+            offset = self.time_offset
+        else:
+            offset = self.time_offset + (epoch - self._origin if self._origin is not None else 0.0)
+        await self._on_transcript(result, offset)
+
+    async def keep_alive(self):
+        """Mantiene abierta la conexión mientras no se envía audio (silencios quitados por el preprocesado)."""
+        if self._connection is not None and not self._lost and self._reconnect_task is None:
+            await self._connection.keep_alive()
+
+    async def drain(self, timeout):
+        """Pide a Deepgram que termine con el audio enviado y espera sus últimos resultados.
+
+        Devuelve False si no llega la confirmación (Metadata) en ``timeout`` segundos.
+        """
+        if self._reconnect_task is not None:
+            await self._reconnect_task
+        self._drained.clear()
+        self._closing = True  # El cierre que sigue a CloseStream no es una pérdida de conexión
+        await self._connection.send(json.dumps({"type": "CloseStream"}))
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Deepgram no confirmó el cierre en {timeout}s")
+            return False
+        return not self._lost
+
+    async def finish(self):
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._connection is not None:
+            await self._connection.finish()
+
+    def stats(self):
+        return {
+            "reconnects": self.reconnects,
+            "reconnect_failures": self.reconnect_failures,
+            "last_reconnect_s": round(self.last_reconnect_seconds, 3),
+            "max_reconnect_s": round(self.max_reconnect_seconds, 3),
+            "replayed_bytes": self.replayed_bytes,
+            "duplicates_dropped": self.duplicates_dropped,
+        }
@@ -0,0 +1,239 @@
+# backend/llm.py
+"""Cliente compartido de OpenAI para toda la aplicación.
+
+Un único ``AsyncOpenAI`` con pool de conexiones HTTP, creado en segundo plano
+al arrancar la app (o en la primera llamada, si llega antes), con límite global de peticiones concurrentes, limitador de tasa
+(token bucket), reintentos con backoff exponencial y jitter ante 429/5xx, y un
+presupuesto de tiempo total por llamada.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import importlib
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # 0 = sin límite de tasa
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "300"))  # incluye reintentos
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """Limitador de tasa: ``rate`` peticiones por segundo con ráfagas de hasta ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _is_retryable(error):
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error):
+    """Segundos indicados por la cabecera Retry-After, si la hay."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """Envoltorio de ``AsyncOpenAI`` con control de concurrencia, tasa y reintentos."""
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._client = None
+        self._starting = None  # creación del cliente en curso (las llamadas concurrentes la esperan)
+        self._semaphore = None
+        self._bucket = None
+        # Métricas
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def start(self):
+        """Crea el cliente HTTP compartido (idempotente)."""
+        if self._client is not None:
+            return
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._create_client())
+        try:
+            await asyncio.shield(self._starting)
+        except Exception:
+            self._starting = None  # La próxima llamada lo vuelve a intentar
+            raise
+
+    async def _create_client(self):
+        # Importar openai tarda alrededor de un segundo: en un hilo, sin bloquear el event loop
+        await asyncio.to_thread(importlib.import_module, "openai")
+        # La URL base se puede redirigir a un stub local con OPENAI_BASE_URL
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        import httpx
+
+        self._client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            max_retries=0,  # Los reintentos se gestionan aquí con el presupuesto de tiempo
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                )
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.requests_per_minute > 0:
+            rate = self.requests_per_minute / 60
+            self._bucket = TokenBucket(rate, capacity=max(1.0, min(self.max_concurrency, rate * 10)))
+        logger.info(f"Cliente OpenAI compartido iniciado (concurrencia máxima {self.max_concurrency})")
+
+    async def close(self):
+        if self._starting is not None and not self._starting.done():
+            self._starting.cancel()
+        self._starting = None
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            logger.info("Cliente OpenAI compartido cerrado")
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Espera antes del siguiente intento, o None si no se debe reintentar."""
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if not _is_retryable(error) or attempt >= self.max_retries:
+            return None
+        if asyncio.get_running_loop().time() + delay >= deadline:
+            return None
+        return delay
+
+    async def _acquire_slot(self, deadline):
+        """Respeta el limitador de tasa y devuelve el tiempo restante del presupuesto."""
+        if self._bucket is not None:
+            await self._bucket.acquire()
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            self.failures += 1
+            raise asyncio.TimeoutError("Presupuesto de tiempo agotado para la llamada a OpenAI")
+        return remaining
+
+    async def create_chat_completion(self, **kwargs):
+        """``chat.completions.create`` con reintentos dentro del presupuesto de tiempo."""
+        await self.start()
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                remaining = await self._acquire_slot(deadline)
+                self.in_flight += 1
+                self.requests += 1
+                try:
+                    response = await self._client.chat.completions.create(timeout=remaining, **kwargs)
+                    metrics.llm_requests.inc(result="ok")
+                    return response
+                except Exception as e:
+                    error = e
+                finally:
+                    self.in_flight -= 1
+
+            delay = self._retry_delay(error, attempt, deadline)
+            if delay is None:
+                self.failures += 1
+                metrics.llm_requests.inc(result="failed")
+                raise error
+            attempt += 1
+            self.retries += 1
+            metrics.llm_requests.inc(result="retried")
+            logger.warning(f"Error reintentable de OpenAI ({error}); reintento {attempt} en {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def stream_chat_completion(self, **kwargs):
+        """Versión en streaming: produce los fragmentos de texto a medida que llegan.
+
+        Sólo se reintenta si el error ocurre antes de recibir el primer fragmento.
+        """
+        await self.start()
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        attempt = 0
+        while True:
+            received = False
+            async with self._semaphore:
+                remaining = await self._acquire_slot(deadline)
+                self.in_flight += 1
+                self.requests += 1
+                try:
+                    stream = await self._client.chat.completions.create(
+                        stream=True, timeout=remaining, **kwargs
+                    )
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            received = True
+                            yield chunk.choices[0].delta.content
+                    metrics.llm_requests.inc(result="ok")
+                    return
+                except Exception as e:
+                    if received:
+                        self.failures += 1
+                        metrics.llm_requests.inc(result="failed")
+                        raise
+                    error = e
+                finally:
+                    self.in_flight -= 1
+
+            delay = self._retry_delay(error, attempt, deadline)
+            if delay is None:
+                self.failures += 1
+                metrics.llm_requests.inc(result="failed")
+                raise error
+            attempt += 1
+            self.retries += 1
+            metrics.llm_requests.inc(result="retried")
+            logger.warning(f"Error reintentable de OpenAI ({error}); reintento {attempt} en {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+
+llm = LLMClient()
+metrics.llm_in_flight.set_function(lambda: llm.in_flight)
@@ -0,0 +1,165 @@
+# backend/loop_watchdog.py
+"""Vigilancia del event loop: retraso de planificación y llamadas bloqueantes.
+
+Una tarea de latido (``asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)``) mide cuánto
+tarda el loop en volver a ejecutarla (``rtt_event_loop_lag_seconds``) y anota
+la hora de cada latido. Un hilo aparte comprueba esa hora: si el loop lleva
+más de LOOP_WATCHDOG_THRESHOLD segundos sin latir es que algo síncrono lo
+está bloqueando, y el hilo captura la pila del hilo del loop en ese momento
+(la función bloqueante y la corrutina que la llamó). Al volver el latido se
+registra la duración del bloqueo, se escribe en el log con la pila y se
+guarda entre los últimos bloqueos (``GET /admin/watchdog``).
+
+El hilo se puede activar, desactivar o cambiar de umbral en caliente con
+``POST /admin/watchdog``; la medida del retraso sigue siempre activa.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.1"))
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "true").lower() in ("1", "true", "yes")
+LOOP_WATCHDOG_THRESHOLD = float(os.getenv("LOOP_WATCHDOG_THRESHOLD", "0.25"))
+LOOP_WATCHDOG_STACK_DEPTH = int(os.getenv("LOOP_WATCHDOG_STACK_DEPTH", "25"))
+LOOP_WATCHDOG_KEEP = 50  # Bloqueos recientes que se conservan para el endpoint de administración
+
+
+class LoopWatchdog:
+    """Latido en el event loop y un hilo que captura la pila cuando el latido se retrasa."""
+
+    def __init__(self, interval=EVENT_LOOP_LAG_INTERVAL, threshold=LOOP_WATCHDOG_THRESHOLD,
+                 enabled=LOOP_WATCHDOG, stack_depth=LOOP_WATCHDOG_STACK_DEPTH):
+        self.interval = interval
+        self.threshold = threshold
+        self.enabled = enabled
+        self.stack_depth = stack_depth
+        self.stalls = deque(maxlen=LOOP_WATCHDOG_KEEP)
+        self.stall_count = 0
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._pending = None  # bloqueo detectado por el hilo, a completar en el siguiente latido
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Arranca el latido (y el hilo si está activado); se llama desde el event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat = asyncio.create_task(self._beat())
+        metrics.loop_watchdog_enabled.set_function(lambda: int(self.enabled))
+        if self.enabled:
+            self._start_thread()
+
+    async def stop(self):
+        self._stop_thread()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+
+    def configure(self, enabled=None, threshold=None):
+        """Activa/desactiva el hilo o cambia el umbral en caliente."""
+        if threshold is not None:
+            if threshold <= 0:
+                raise ValueError("El umbral debe ser mayor que 0")
+            self.threshold = threshold
+        if enabled is not None and enabled != self.enabled:
+            self.enabled = enabled
+            if enabled:
+                self._start_thread()
+            else:
+                self._stop_thread()
+            logger.info(f"Vigilancia del event loop {'activada' if enabled else 'desactivada'}")
+        return self.state()
+
+    def _start_thread(self):
+        if self._thread is not None or self._loop is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def _stop_thread(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self._thread = None
+
+    async def _beat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            metrics.event_loop_lag.observe(lag)
+            with self._lock:
+                self._last_beat = time.monotonic()
+                stall, self._pending = self._pending, None
+            if stall is not None:
+                self._finish_stall(stall, lag)
+
+    def _watch(self):
+        """Hilo: comprueba el latido y captura la pila del hilo del loop si se ha parado."""
+        while not self._stop.wait(min(0.05, max(0.005, self.threshold / 4))):
+            with self._lock:
+                if self._pending is not None:
+                    continue  # Ya capturado; se completa en el próximo latido
+                blocked = time.monotonic() - self._last_beat - self.interval
+                if blocked < self.threshold:
+                    continue
+                self._pending = self._capture(blocked)
+
+    def _capture(self, blocked):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame)[-self.stack_depth:] if frame is not None else []
+        task = asyncio.current_task(self._loop)  # Lectura de un dict; segura desde otro hilo
+        coroutine = task.get_coro() if task is not None else None
+        return {
+            "detected_at": time.time(),
+            "blocked_s_at_detection": round(blocked, 3),
+            "task": task.get_name() if task is not None else None,
+            "coroutine": getattr(coroutine, "__qualname__", None),
+            "stack": "".join(stack),
+        }
+
+    def _finish_stall(self, stall, lag):
+        stall["duration_s"] = round(lag, 3)
+        self.stall_count += 1
+        self.stalls.append(stall)
+        metrics.event_loop_stalls.inc()
+        metrics.event_loop_stall_seconds.observe(lag)
+        logger.warning(
+            f"Event loop bloqueado {lag:.3f}s (tarea {stall['task']}, corrutina {stall['coroutine']}):\n"
+            f"{stall['stack']}"
+        )
+
+    def state(self):
+        return {
+            "enabled": self.enabled,
+            "threshold_s": self.threshold,
+            "interval_s": self.interval,
+            "stalls": self.stall_count,
+        }
+
+    def recent_stalls(self, limit=10):
+        return list(self.stalls)[-limit:][::-1]
+
+
+loop_watchdog = LoopWatchdog()
@@ -3,47 +3,134 @@ import os
 import asyncio
 import logging
 import json
-import pandas as pd
+import re
+import hmac
+import hashlib
+import secrets
+from contextlib import asynccontextmanager
 from datetime import datetime
-import openai
+from typing import Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 from deepgram import (
     DeepgramClient,
     DeepgramClientOptions,
-    LiveTranscriptionEvents,
     LiveOptions,
 )
 
 # --- Configuración Inicial ---
 load_dotenv()  # Carga variables de entorno desde .env
 
+# Módulos locales: se importan después de load_dotenv() porque leen su configuración del entorno
+from audio import AUDIO_POLICIES, AUDIO_POLICY, AudioForwarder
+from scheduler import SchedulerFull, analysis_scheduler, render_scheduler
+from preprocess import AUDIO_PREPROCESS, LIVE_ENCODING, AudioPreprocessor, available as preprocessing_available, is_raw
+from batch import BatchQueue, QueueFull, UploadTooLarge, save_upload
+from analysis import ROLLING_ANALYSIS, RollingAnalysis, generate_analysis
+from cache import report_cache
+import metrics
+from live import LiveTranscriber
+from llm import llm
+from loop_watchdog import loop_watchdog
+from metrics import SessionTrace
+from pipeline import (
+    build_file_data,
+    cached_analysis,
+    file_metadata,
+    purge_spooled_reports,
+    render_cached,
+    spool_files,
+    spooled_report_path,
+    write_file,
+)
+from reports import REPORT_FORMATS, SECTIONS, render_pool
+from search import SEARCH_INDEX, search_index
+from segments import SegmentStore
+from sessions import SESSION_DB_PATH, SESSION_STORE, load_or_create_secret, purge_periodically, session_store
+
 API_KEY = os.getenv("DEEPGRAM_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("DEEPGRAM_API_KEY no encontrada en las variables de entorno.")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY no encontrada en las variables de entorno.")
-
-# Configurar OpenAI
-openai.api_key = OPENAI_API_KEY
+# Nivel de log del SDK de Deepgram (con DEBUG registra cada mensaje de cada sesión)
+DEEPGRAM_LOG_LEVEL = os.getenv("DEEPGRAM_LOG_LEVEL", "WARNING")
+
+# Entrega de archivos: tamaño de cada trozo binario (modo "chunked" y descargas HTTP)
+FILE_CHUNK_SIZE = int(os.getenv("FILE_CHUNK_SIZE", str(64 * 1024)))
+
+# Token para los endpoints /admin (cabecera X-Admin-Token); sin él los endpoints están deshabilitados
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Clave con la que se firman los tokens de acceso a sesiones y trabajos. Con el almacén SQLite debe ser
+# la misma en todos los workers y entre reinicios: si no se fija, se genera una y se guarda junto a la base
+ACCESS_TOKEN_SECRET = os.getenv("ACCESS_TOKEN_SECRET") or (
+    load_or_create_secret(SESSION_DB_PATH + ".secret") if SESSION_STORE == "sqlite" else secrets.token_hex(32)
+)
 
 # Setup logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Deepgram Client Configuration
-config: DeepgramClientOptions = DeepgramClientOptions(
-    verbose=logging.DEBUG
-)
-
-# Initialize Deepgram Client
-deepgram: DeepgramClient = DeepgramClient(API_KEY, config)
+# Cliente de Deepgram: se crea en el lifespan (importar main no necesita las claves)
+deepgram: Optional[DeepgramClient] = None
+
+# Trabajos de transcripción por lotes (archivos subidos por HTTP)
+batch_queue = BatchQueue()
+
+def create_deepgram_client():
+    """Comprueba las claves y crea el cliente de Deepgram."""
+    if not API_KEY:
+        raise ValueError("DEEPGRAM_API_KEY no encontrada en las variables de entorno.")
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY no encontrada en las variables de entorno.")
+    # DEEPGRAM_URL permite apuntar a un servidor local (python -m stubs.fake_deepgram)
+    config = DeepgramClientOptions(
+        url=os.getenv("DEEPGRAM_URL", ""),
+        verbose=getattr(logging, DEEPGRAM_LOG_LEVEL.upper(), logging.WARNING),
+    )
+    return DeepgramClient(API_KEY, config)
+
+async def warmup():
+    """Arranca el pool de renderizado y el cliente de OpenAI sin retrasar la primera conexión."""
+    results = await asyncio.gather(render_pool.start(), llm.start(), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Error al precalentar: {result}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Recursos compartidos por todas las sesiones durante la vida de la app."""
+    global deepgram
+    deepgram = create_deepgram_client()
+    # Precalentar en segundo plano: la app acepta conexiones mientras tanto
+    warmup_task = asyncio.create_task(warmup())
+    await report_cache.purge_expired()
+    await session_store.purge_expired()
+    purge_task = asyncio.create_task(purge_periodically(session_store))
+    if SEARCH_INDEX:
+        try:
+            await search_index.start()
+            await search_index.purge_expired()
+        except Exception as e:
+            # Sin índice (p. ej. SQLite sin FTS5) la app funciona igual; /search responde 503
+            logger.error(f"No se pudo iniciar el índice de búsqueda: {e}")
+            await search_index.close()
+    await asyncio.to_thread(purge_spooled_reports)
+    batch_queue.start(deepgram)
+    loop_watchdog.start()
+    yield
+    await loop_watchdog.stop()
+    warmup_task.cancel()
+    purge_task.cancel()
+    await batch_queue.shutdown()
+    await llm.close()
+    render_pool.shutdown()
+    report_cache.close()
+    session_store.close()
+    await search_index.close()
 
 # Initialize FastAPI app - KEEP ONLY THIS INSTANCE
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS - MOVE THIS HERE
 app.add_middleware(
@@ -59,19 +146,25 @@ async def websocket_endpoint(websocket: WebSocket):
     """Maneja conexiones WebSocket de clientes para transcripción en tiempo real."""
     await websocket.accept()
     logger.info(f"Cliente conectado: {websocket.client}")
-
-    dg_connection = None
-    full_transcript = []  # Almacena la transcripción completa
+    metrics.sessions_total.inc()
+    metrics.active_sessions.inc()
+    trace = SessionTrace()  # Tiempos de la sesión; se envían con analysis_complete si el cliente pide "trace"
+
+    dg_connection = None  # LiveTranscriber: conexión con Deepgram con reconexión automática
+    audio_forwarder = None  # Cola de audio hacia Deepgram (se crea al iniciar la conexión)
+    preprocessor = None  # Preprocesado opcional del audio (silencios, 16 kHz mono) antes de la cola
+    post_session_task = None  # Análisis y reportes pedidos con stop_and_analyze
+    post_session_queued = False  # La tarea anterior está esperando turno
+    full_transcript = SegmentStore()  # Segmentos finales con sus tiempos (y los de cada palabra)
+    session_id = None  # Id en el almacén de sesiones (se crea tras la configuración; permite reanudarla)
     is_final = False  # Indica si el fragmento es final o parcial
+    rolling = None  # Análisis incremental (se crea tras recibir la configuración)
     
     # Default model configuration
     selected_model = "nova-2"  # Default model for 2-person conversations
 
     try:
-        dg_connection = deepgram.listen.asynclive.v("1")
-        logger.info("Conexión asíncrona de Deepgram creada.")
-
-        async def on_message(self, result, **kwargs):
+        async def on_message(result, offset=0.0):
             """Callback para cuando se recibe una transcripción."""
             nonlocal full_transcript  # Add this line to access the outer variable
             
@@ -83,14 +176,20 @@ async def websocket_endpoint(websocket: WebSocket):
                     # Solo enviamos al cliente los resultados finales o parciales con indicador
                     message = {
                         "transcript": transcript,
-                        "is_final": is_final
+                        "is_final": is_final,
+                        # Segundos de audio de la sesión que cubre el resultado
+                        "start": round(offset + result.start, 3),
+                        "end": round(offset + result.start + result.duration, 3)
                     }
                     
                     # Si es un resultado final, lo guardamos para análisis posterior
                     if is_final and transcript.strip():
                         logger.info(f"Adding final transcript segment: '{transcript}'")
-                        full_transcript.append(transcript)
+                        full_transcript.append_result(result, offset)
                         logger.info(f"Current transcript segments: {len(full_transcript)}")
+                        if rolling:
+                            rolling.notify(full_transcript)
+                        await store_segment(len(full_transcript) - 1)
                     
                     await websocket.send_text(json.dumps(message))
             except WebSocketDisconnect:
@@ -98,44 +197,17 @@ async def websocket_endpoint(websocket: WebSocket):
             except Exception as e:
                 logger.error(f"Error al procesar/enviar mensaje: {e}")
 
-        # --- Resto de handlers de eventos ---
-        async def on_metadata(self, metadata, **kwargs):
-            logger.debug(f"Deepgram metadata: {metadata}")
-
-        async def on_speech_started(self, speech_started, **kwargs):
-            logger.debug("Deepgram speech_started")
-
-        async def on_utterance_end(self, utterance_end, **kwargs):
-            logger.debug("Deepgram utterance_end")
-
-        async def on_error(self, error, **kwargs):
-            error_message = error.get("message", str(error))
-            logger.error(f"Error de Deepgram: {error_message}")
-            try:
-                await websocket.send_text(json.dumps({"error": error_message}))
-            except Exception as e:
-                logger.error(f"Error al enviar mensaje de error: {e}")
-
-        async def on_open(self, open_event, **kwargs):
-            """Callback cuando la conexión con Deepgram se abre."""
-            logger.info(f"Conexión Deepgram abierta: {open_event}")
-
-        # Fix the on_close handler to properly handle the close_event parameter
-        async def on_close(self, close_event=None, **kwargs):
-            """Callback cuando la conexión con Deepgram se cierra."""
-            logger.info(f"Conexión Deepgram cerrada: {close_event}")
-
-        # --- Registrar Handlers de Eventos ---
-        dg_connection.on(LiveTranscriptionEvents.Transcript, on_message)
-        dg_connection.on(LiveTranscriptionEvents.Metadata, on_metadata)
-        dg_connection.on(LiveTranscriptionEvents.SpeechStarted, on_speech_started)
-        dg_connection.on(LiveTranscriptionEvents.UtteranceEnd, on_utterance_end)
-        dg_connection.on(LiveTranscriptionEvents.Error, on_error)
-        dg_connection.on(LiveTranscriptionEvents.Open, on_open)
-        dg_connection.on(LiveTranscriptionEvents.Close, on_close)
+        async def on_status(status, detail=None):
+            """Informa al cliente de las reconexiones con Deepgram."""
+            if status == "reconnect_failed":
+                message = {"error": "Se perdió la conexión con Deepgram y no se pudo restablecer"}
+            else:
+                message = {"status": status, **(detail or {})}
+            await websocket.send_text(json.dumps(message))
 
         # Wait for initial configuration from client before starting
         logger.info("Esperando configuración inicial del cliente...")
+        config_message = {}
         try:
             config_message_raw = await websocket.receive_text()
             config_message = json.loads(config_message_raw)
@@ -158,6 +230,255 @@ async def websocket_endpoint(websocket: WebSocket):
                 "model": selected_model
             }))
 
+        # --- Análisis incremental ---
+        async def send_interim_analysis(analysis, segments):
+            """Envía al cliente una instantánea del análisis en curso."""
+            try:
+                await websocket.send_text(json.dumps({
+                    "analysis_interim": True,
+                    "analysis": analysis,
+                    "segments": segments
+                }))
+            except Exception as e:
+                logger.warning(f"No se pudo enviar el análisis parcial: {e}")
+
+        if config_message.get("rolling_analysis", ROLLING_ANALYSIS):
+            rolling = RollingAnalysis(
+                on_snapshot=send_interim_analysis if config_message.get("interim_analysis") else None
+            )
+
+        # --- Sesión persistente ---
+        # El cliente puede reanudar una sesión anterior (tras un reinicio o desde otro worker) con su session_id
+        resume_id = config_message.get("session_id")
+        if resume_id and not has_access("session", resume_id, config_message.get("access_token")):
+            # No se crea otra sesión en silencio: el cliente perdería la suya sin saberlo
+            logger.warning(f"Token de acceso no válido para reanudar la sesión {resume_id}")
+            await websocket.send_text(json.dumps({
+                "error": "Token de acceso no válido para reanudar la sesión",
+                "session_id": resume_id,
+            }))
+            await websocket.close(code=1008, reason="Token de acceso no válido")
+            return
+        resumed = bool(resume_id) and await session_store.exists(resume_id)
+        session_id = await session_store.create(resume_id if resumed else None, {"model": selected_model})
+        time_offset = 0.0
+        if resumed:
+            full_transcript.extend_dicts(await session_store.segments(session_id))
+            time_offset = full_transcript.duration
+            if rolling and full_transcript:
+                rolling.notify(full_transcript)
+            logger.info(f"Sesión {session_id} reanudada con {len(full_transcript)} segmentos")
+        await websocket.send_text(json.dumps({
+            "status": "session",
+            "session_id": session_id,
+            "access_token": access_token("session", session_id),
+            "resumed": resumed,
+            "segments": full_transcript.texts() if resumed else []
+        }))
+
+        async def store_segment(index):
+            """Persiste un segmento final; un fallo del almacén no interrumpe la transcripción."""
+            segment = full_transcript.to_dict(index)
+            search_index.add_segment(session_id, index, segment)
+            try:
+                await session_store.append(session_id, segment)
+            except Exception as e:
+                logger.error(f"No se pudo guardar el segmento de la sesión {session_id}: {e}")
+
+        async def stored_transcript(requested_id, token):
+            """Segmentos de otra sesión del almacén (con su token de acceso), o los de esta sesión."""
+            if requested_id and requested_id != session_id:
+                segments = SegmentStore()
+                if not has_access("session", requested_id, token):
+                    logger.warning(f"Token de acceso no válido para analizar la sesión {requested_id}")
+                    return segments
+                segments.extend_dicts(await session_store.segments(requested_id))
+                return segments
+            return full_transcript
+
+        async def send_analysis_delta(section, text):
+            """Reenvía al cliente el texto del informe a medida que se genera."""
+            try:
+                await websocket.send_text(json.dumps({
+                    "analysis_delta": {"section": section, "text": text}
+                }))
+            except Exception as e:
+                logger.warning(f"No se pudo enviar el fragmento del análisis: {e}")
+
+        def trace_fields(message):
+            """Campo "spans" para analysis_complete si el cliente lo pidió en la configuración o en el mensaje."""
+            if message.get("trace", config_message.get("trace", False)):
+                return {"spans": trace.spans()}
+            return {}
+
+        # --- Análisis y reportes al terminar la sesión ---
+        # Esperan turno en los planificadores compartidos (ver scheduler.py); mientras tanto
+        # el cliente recibe su posición en la cola
+        tenant = str(config_message.get("tenant") or (websocket.client.host if websocket.client else "anonimo"))
+
+        def queue_notifier(stage):
+            async def notify(position):
+                nonlocal post_session_queued
+                post_session_queued = position is not None
+                if position is None:
+                    message = {"status": "started", "stage": stage}
+                else:
+                    message = {"status": "queued", "stage": stage, "position": position}
+                try:
+                    await websocket.send_text(json.dumps(message))
+                except Exception as e:
+                    logger.warning(f"No se pudo enviar la posición en la cola: {e}")
+            return notify
+
+        def render_slot():
+            return render_scheduler.slot(tenant, on_position=queue_notifier("render"))
+
+        async def analyze(complete_text, on_delta=None):
+            """Devuelve el análisis cacheado, el incremental si cubre el mismo texto, o uno nuevo."""
+            async def generate():
+                async with analysis_scheduler.slot(tenant, on_position=queue_notifier("analysis")):
+                    if rolling and rolling.covers(complete_text, full_transcript):
+                        return await rolling.finalize(full_transcript, on_delta)
+                    return await generate_analysis(complete_text, on_delta=on_delta)
+            return await cached_analysis(complete_text, generate)
+
+        def index_analysis(target_id, analysis):
+            """Indexa las secciones del análisis para la búsqueda (salvo si falló)."""
+            if "error" not in analysis:
+                search_index.add_analysis(target_id, analysis, SECTIONS)
+
+        async def stop_and_analyze(message):
+            """Analiza la transcripción y envía el análisis y los archivos pedidos."""
+            try:
+                # Get export format preferences
+                export_formats = message.get("export_formats", ["excel"])  # Default to Excel if not specified
+                logger.info(f"Requested export formats: {export_formats}")
+
+                # Check if transcript was sent directly from frontend
+                client_transcript = message.get("transcript")
+
+                # Enviar el informe en streaming (analysis_delta) salvo que el cliente lo desactive
+                on_delta = send_analysis_delta if message.get("stream_analysis", True) else None
+
+                if client_transcript:
+                    logger.info("Using transcript sent from client")
+                    complete_text = client_transcript
+                    with trace.span("analysis"):
+                        analysis = await analyze(complete_text, on_delta)
+                    index_analysis(session_id, analysis)
+
+                    # Generate files based on requested formats
+                    file_data = {}
+
+                    try:
+                        with trace.span("render"):
+                            # Marcas de tiempo sólo si el texto del cliente es el de la sesión
+                            rows = None
+                            if full_transcript and full_transcript.text().split() == complete_text.split():
+                                rows = full_transcript.rows()
+                            file_data = await build_file_data(complete_text, analysis, export_formats, rows, render_slot())
+
+                        # Modo de entrega: "binary" (un frame por archivo), "chunked"
+                        # (cabecera + trozos + fin) o "http" (sólo URLs de descarga)
+                        download_mode = message.get("download_mode", "binary")
+                        if download_mode == "http":
+                            with trace.span("spool"):
+                                await spool_files(file_data)
+
+                        # Send analysis and file data to client
+                        await websocket.send_text(json.dumps({
+                            "analysis_complete": True,
+                            "analysis": analysis,
+                            "file_data": {
+                                format_name: file_metadata(format_name, file_info, download_mode)
+                                for format_name, file_info in file_data.items()
+                            },
+                            **trace_fields(message)
+                        }))
+
+                        # Send each file separately to avoid large JSON messages
+                        for format_name, file_info in file_data.items():
+                            if download_mode == "chunked":
+                                await send_file_chunked(websocket, format_name, file_info)
+                            elif download_mode != "http":
+                                await websocket.send_bytes(file_info["data"])
+                            logger.info(f"Sent {format_name} file to client ({download_mode})")
+
+                        logger.info(f"Análisis completado y archivos enviados al cliente")
+                    except Exception as e:
+                        logger.error(f"Error al generar archivos: {e}")
+                        # Enviar solo el análisis sin archivos
+                        await websocket.send_text(json.dumps({
+                            "analysis_complete": True,
+                            "analysis": analysis,
+                            "error_saving": str(e),
+                            **trace_fields(message)
+                        }))
+                        logger.info("Análisis completado pero no se pudieron generar los archivos")
+                # If no client transcript, try to use the backend's stored transcript
+                elif segments := await stored_transcript(message.get("session_id"), message.get("access_token")):
+                    logger.info(f"Analyzing transcript with {len(segments)} segments")
+                    complete_text = segments.text()
+                    logger.info(f"Complete text for analysis: '{complete_text}'")
+                    with trace.span("analysis"):
+                        analysis = await analyze(complete_text, on_delta)
+                    index_analysis(message.get("session_id") or session_id, analysis)
+
+                    # Guardar en Excel (generado en el pool, escrito desde un hilo)
+                    filename = f"transcripcion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+                    filepath = os.path.join(os.getcwd(), filename)
+
+                    with trace.span("render"):
+                        excel_data = (await render_cached(
+                            complete_text, analysis, ["excel"], segments.rows(), render_slot()
+                        ))["excel"]
+                    await asyncio.to_thread(write_file, filepath, excel_data)
+
+                    # Enviar ruta del archivo al cliente
+                    await websocket.send_text(json.dumps({
+                        "analysis_complete": True,
+                        "file_path": filepath,
+                        "analysis": analysis,
+                        **trace_fields(message)
+                    }))
+
+                    logger.info(f"Análisis completado y guardado en {filepath}")
+                else:
+                    logger.warning("No transcript data to analyze")
+                    await websocket.send_text(json.dumps({
+                        "error": "No hay transcripción para analizar"
+                    }))
+            except SchedulerFull as e:
+                logger.warning(f"Análisis rechazado: {e}")
+                await websocket.send_text(json.dumps({
+                    "error": "El servidor está ocupado, inténtalo de nuevo en unos minutos"
+                }))
+            except Exception as e:
+                logger.exception(f"Error al analizar la sesión: {e}")
+                try:
+                    await websocket.send_text(json.dumps({"error": f"Error al analizar la transcripción: {e}"}))
+                except Exception:
+                    pass
+
+        # --- Preprocesado del audio (opcional) ---
+        # Sin "audio_format" el cliente envía el contenedor del MediaRecorder (WebM/Opus)
+        audio_format = config_message.get("audio_format")
+        preprocess = bool(config_message.get("preprocess", AUDIO_PREPROCESS))
+        if preprocess and not preprocessing_available(audio_format):
+            logger.warning("Preprocesado de audio no disponible (falta ffmpeg); el audio se envía tal cual")
+            preprocess = False
+        if preprocess:
+            encoding = LIVE_ENCODING
+            preprocessor = AudioPreprocessor(
+                emit=lambda data: audio_forwarder.put(data),
+                keep_alive=lambda: dg_connection.keep_alive(),
+                input_format=audio_format,
+            )
+        elif is_raw(audio_format):
+            encoding = {key: audio_format[key] for key in ("encoding", "sample_rate", "channels") if key in audio_format}
+        else:
+            encoding = {}
+
         # --- Opciones de Transcripción de Deepgram ---
         options = LiveOptions(
             model=selected_model,
@@ -166,11 +487,28 @@ async def websocket_endpoint(websocket: WebSocket):
             interim_results=True,
             utterance_end_ms="1000",
             vad_events=True,
+            **encoding,
         )
 
-        await dg_connection.start(options)
+        dg_connection = LiveTranscriber(
+            deepgram, options, on_transcript=on_message, on_status=on_status, time_offset=time_offset,
+            replay_header=not encoding, timeline=preprocessor
+        )
+        with trace.span("deepgram_connect"):
+            await dg_connection.start()
         logger.info(f"Conexión Deepgram iniciada con modelo {selected_model} y lista para recibir audio.")
 
+        # El audio se encola y una tarea dedicada lo envía a Deepgram
+        audio_policy = config_message.get("audio_policy", AUDIO_POLICY)
+        if audio_policy not in AUDIO_POLICIES:
+            logger.warning(f"Política de audio desconocida '{audio_policy}', usando '{AUDIO_POLICY}'")
+            audio_policy = AUDIO_POLICY
+        audio_forwarder = AudioForwarder(dg_connection.send, policy=audio_policy)
+        audio_forwarder.start()
+        if preprocessor:
+            preprocessor.start()
+            logger.info(f"Preprocesado de audio activado ({preprocessor.decoder})")
+
         # --- Bucle Principal ---
         while True:
             try:
@@ -189,115 +527,14 @@ async def websocket_endpoint(websocket: WebSocket):
                             # Si recibimos un comando para detener y analizar
                             if message.get("command") == "stop_and_analyze":
                                 logger.info("Received stop_and_analyze command")
-                                
-                                # Get export format preferences
-                                export_formats = message.get("export_formats", ["excel"])  # Default to Excel if not specified
-                                logger.info(f"Requested export formats: {export_formats}")
-                                
-                                # Check if transcript was sent directly from frontend
-                                client_transcript = message.get("transcript")
-                                
-                                if client_transcript:
-                                    logger.info("Using transcript sent from client")
-                                    complete_text = client_transcript
-                                    analysis = await generate_analysis(complete_text)
-                                    
-                                    # Generate files based on requested formats
-                                    file_data = {}
-                                    
-                                    try:
-                                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                        
-                                        if "excel" in export_formats:
-                                            excel_data = await generate_excel_file(complete_text, analysis, timestamp)
-                                            file_data["excel"] = {
-                                                "filename": f"transcripcion_{timestamp}.xlsx",
-                                                "data": excel_data,
-                                                "content_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                            }
-                                        
-                                        if "pdf" in export_formats:
-                                            pdf_data = await generate_pdf_file(complete_text, analysis, timestamp)
-                                            file_data["pdf"] = {
-                                                "filename": f"transcripcion_{timestamp}.pdf",
-                                                "data": pdf_data,
-                                                "content_type": "application/pdf"
-                                            }
-                                        
-                                        if "word" in export_formats:
-                                            word_data = await generate_word_file(complete_text, analysis, timestamp)
-                                            file_data["word"] = {
-                                                "filename": f"transcripcion_{timestamp}.docx",
-                                                "data": word_data,
-                                                "content_type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                                            }
-                                        
-                                        # Send analysis and file data to client
-                                        await websocket.send_text(json.dumps({
-                                            "analysis_complete": True,
-                                            "analysis": analysis,
-                                            "file_data": {
-                                                format_name: {
-                                                    "filename": file_info["filename"],
-                                                    "content_type": file_info["content_type"],
-                                                    # We'll send the actual file data in a separate message
-                                                }
-                                                for format_name, file_info in file_data.items()
-                                            }
-                                        }))
-                                        
-                                        # Send each file separately to avoid large JSON messages
-                                        for format_name, file_info in file_data.items():
-                                            await websocket.send_bytes(file_info["data"])
-                                            logger.info(f"Sent {format_name} file to client")
-                                        
-                                        logger.info(f"Análisis completado y archivos enviados al cliente")
-                                    except Exception as e:
-                                        logger.error(f"Error al generar archivos: {e}")
-                                        # Enviar solo el análisis sin archivos
-                                        await websocket.send_text(json.dumps({
-                                            "analysis_complete": True,
-                                            "analysis": analysis,
-                                            "error_saving": str(e)
-                                        }))
-                                        logger.info("Análisis completado pero no se pudieron generar los archivos")
-                                # If no client transcript, try to use the backend's stored transcript
-                                elif full_transcript:
-                                    logger.info(f"Analyzing transcript with {len(full_transcript)} segments")
-                                    complete_text = " ".join(full_transcript)
-                                    logger.info(f"Complete text for analysis: '{complete_text}'")
-                                    analysis = await generate_analysis(complete_text)
-                                    
-                                    # Guardar en Excel
-                                    filename = f"transcripcion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                                    filepath = os.path.join(os.getcwd(), filename)
-                                    
-                                    # Crear DataFrame y guardar
-                                    df = pd.DataFrame({
-                                        "Transcripción Completa": [complete_text],
-                                        "Resumen General": [analysis.get("resumen", "")],
-                                        "Percepciones por área": [analysis.get("percepciones_por_area", "")],
-                                        "Relaciones entre áreas": [analysis.get("relaciones_entre_areas", "")],
-                                        "Factores Experiencia": [analysis.get("factores_experiencia", "")],
-                                        "Análisis de Sentimiento": [analysis.get("analisis_sentimiento", "")],
-                                        "Recomendaciones": [analysis.get("recomendaciones", "")]
-                                    })
-                                    
-                                    df.to_excel(filepath, index=False)
-                                    
-                                    # Enviar ruta del archivo al cliente
+                                if post_session_task and not post_session_task.done():
                                     await websocket.send_text(json.dumps({
-                                        "analysis_complete": True,
-                                        "file_path": filepath,
-                                        "analysis": analysis
+                                        "error": "Ya hay un análisis en curso para esta sesión"
                                     }))
-                                    
-                                    logger.info(f"Análisis completado y guardado en {filepath}")
                                 else:
-                                    logger.warning("No transcript data to analyze")
-                                    await websocket.send_text(json.dumps({
-                                        "error": "No hay transcripción para analizar"
-                                    }))
+                                    # En una tarea aparte: el bucle sigue leyendo y detecta si el
+                                    # cliente se desconecta mientras espera turno
+                                    post_session_task = asyncio.create_task(stop_and_analyze(message))
                         except json.JSONDecodeError as e:
                             logger.error(f"Error al decodificar mensaje JSON del cliente: {e}")
                             logger.error(f"Mensaje recibido: {message_raw}")
@@ -305,7 +542,10 @@ async def websocket_endpoint(websocket: WebSocket):
                     elif "bytes" in message_raw:
                         # Es un mensaje de bytes (audio)
                         audio_data = message_raw["bytes"]
-                        await dg_connection.send(audio_data)
+                        await (preprocessor or audio_forwarder).put(audio_data)
+                elif message_raw.get("type") == "websocket.disconnect":
+                    logger.info(f"Cliente desconectado: {websocket.client}")
+                    break
                 else:
                     logger.warning(f"Mensaje no reconocido: {message_raw}")
                 
@@ -324,203 +564,49 @@ async def websocket_endpoint(websocket: WebSocket):
         except Exception:
             pass
     finally:
+        if post_session_task and not post_session_task.done() and post_session_queued:
+            # Aún esperaba turno: se sale de la cola. Si ya estaba en marcha se deja terminar
+            # (el análisis queda en caché por si el cliente vuelve a pedirlo)
+            post_session_task.cancel()
+            logger.info("Cliente desconectado mientras esperaba turno: análisis cancelado")
+        if rolling:
+            rolling.cancel()
+        if preprocessor:
+            await preprocessor.close()
+            logger.info(f"Estadísticas del preprocesado de audio: {preprocessor.stats()}")
+        if audio_forwarder:
+            await audio_forwarder.close()
+            logger.info(f"Estadísticas de audio: {audio_forwarder.stats()}")
         if dg_connection:
             await dg_connection.finish()
+            logger.info(f"Estadísticas de Deepgram: {dg_connection.stats()}")
             logger.info("Conexión Deepgram cerrada.")
+        if session_id:
+            await session_store.release(session_id)
+        metrics.active_sessions.dec()
         logger.info(f"Limpieza completa para cliente: {websocket.client}")
 
-async def generate_analysis(text):
-    """Genera análisis de la transcripción usando ChatGPT."""
-    try:
-        logger.info(f"Generando análisis para texto de {len(text)} caracteres")
-        
-        # Usar la API de OpenAI correctamente (versión async)
-        from openai import AsyncOpenAI
-        
-        # Inicializar el cliente
-        client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-        
-        # Nuevo prompt para análisis organizacional
-        messages = [
-            {
-                "role": "system",
-                "content": "Eres un analista organizacional experto en experiencia del empleado, clima laboral y relaciones interdepartamentales. Tu tarea es analizar transcripciones de entrevistas a profundidad con empleados de una empresa, con el objetivo de identificar percepciones por área, relaciones entre áreas y oportunidades de mejora en la experiencia del empleado. No separes el texto por oradores ni intentes identificar quién habla. Analiza todo el contenido como un texto continuo."
-            },
-            {
-                "role": "user",
-                "content": f"""Analiza la siguiente transcripción y entrega un informe estructurado que contenga:
-         
-1. **Resumen general** de los temas tratados.
-2. **Percepciones por área** (identifica cada área mencionada y describe lo que se dice sobre ella).
-3. **Relaciones entre áreas** (cómo se percibe la colaboración, comunicación o fricciones entre áreas).
-4. **Factores que afectan positiva o negativamente la experiencia del empleado**.
-5. **Análisis de sentimiento general** y por cada área mencionada.
-6. **Recomendaciones accionables** para mejorar la experiencia del empleado, basadas en lo expresado en la entrevista.
-         
-Transcripción: {text}
-"""
-            }
-        ]
-        
-        # Realizar la solicitud con el nuevo prompt
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages
-        )
-        
-        analysis_text = response.choices[0].message.content
-        logger.info("Análisis generado correctamente")
-        
-        # Intentar estructurar la respuesta
-        analysis = {
-            "resumen": "",
-            "percepciones_por_area": "",
-            "relaciones_entre_areas": "",
-            "factores_experiencia": "",
-            "analisis_sentimiento": "",
-            "recomendaciones": "",
-            "texto_completo": analysis_text
+async def send_file_chunked(websocket, format_name, file_info):
+    """Envía un archivo como cabecera JSON + trozos binarios de FILE_CHUNK_SIZE + fin.
+
+    Entre trozos se cede el control al event loop, así que los mensajes de
+    transcripción de la sesión pueden intercalarse mientras dura la descarga.
+    """
+    data = memoryview(file_info["data"])
+    await websocket.send_text(json.dumps({
+        "file_header": {
+            "format": format_name,
+            "filename": file_info["filename"],
+            "content_type": file_info["content_type"],
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "chunk_size": FILE_CHUNK_SIZE,
+            "chunks": -(-len(data) // FILE_CHUNK_SIZE),
         }
-        
-        # Extraer secciones (implementación simple)
-        sections = analysis_text.split("\n\n")
-        if len(sections) >= 6:
-            analysis["resumen"] = sections[0].replace("Resumen general:", "").strip()
-            analysis["percepciones_por_area"] = sections[1].replace("Percepciones por área:", "").strip()
-            analysis["relaciones_entre_areas"] = sections[2].replace("Relaciones entre áreas:", "").strip()
-            analysis["factores_experiencia"] = sections[3].replace("Factores que afectan positiva o negativamente la experiencia del empleado:", "").strip()
-            analysis["analisis_sentimiento"] = sections[4].replace("Análisis de sentimiento general:", "").strip()
-            analysis["recomendaciones"] = sections[5].replace("Recomendaciones accionables:", "").strip()
-        
-        return analysis
-    except Exception as e:
-        logger.error(f"Error al generar análisis con ChatGPT: {e}")
-        logger.exception("Detalle del error:")
-        return {"error": str(e), "texto_completo": text}
-
-# Add these functions after the generate_analysis function
-
-async def generate_excel_file(text, analysis, timestamp):
-    """Genera un archivo Excel con el análisis."""
-    try:
-        # Crear DataFrame
-        df = pd.DataFrame({
-            "Transcripción Completa": [text],
-            "Resumen General": [analysis.get("resumen", "")],
-            "Percepciones por Área": [analysis.get("percepciones_por_area", "")],
-            "Relaciones entre Áreas": [analysis.get("relaciones_entre_areas", "")],
-            "Factores Experiencia": [analysis.get("factores_experiencia", "")],
-            "Análisis de Sentimiento": [analysis.get("analisis_sentimiento", "")],
-            "Recomendaciones": [analysis.get("recomendaciones", "")]
-        })
-        
-        # Guardar en un buffer en memoria
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False)
-        
-        output.seek(0)
-        return output.getvalue()
-    except Exception as e:
-        logger.error(f"Error al generar archivo Excel: {e}")
-        raise
-
-async def generate_pdf_file(text, analysis, timestamp):
-    """Genera un archivo PDF con el análisis."""
-    try:
-        # Crear un buffer en memoria
-        buffer = BytesIO()
-        
-        # Crear el documento PDF
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Título
-        title_style = styles["Title"]
-        story.append(Paragraph("Análisis de Transcripción", title_style))
-        story.append(Spacer(1, 12))
-        
-        # Estilos para secciones y contenido
-        heading_style = styles["Heading2"]
-        normal_style = styles["Normal"]
-        
-        # Añadir secciones
-        story.append(Paragraph("Resumen General", heading_style))
-        story.append(Paragraph(analysis.get("resumen", ""), normal_style))
-        story.append(Spacer(1, 12))
-        
-        story.append(Paragraph("Percepciones por Área", heading_style))
-        story.append(Paragraph(analysis.get("percepciones_por_area", ""), normal_style))
-        story.append(Spacer(1, 12))
-        
-        story.append(Paragraph("Relaciones entre Áreas", heading_style))
-        story.append(Paragraph(analysis.get("relaciones_entre_areas", ""), normal_style))
-        story.append(Spacer(1, 12))
-        
-        story.append(Paragraph("Factores que Afectan la Experiencia del Empleado", heading_style))
-        story.append(Paragraph(analysis.get("factores_experiencia", ""), normal_style))
-        story.append(Spacer(1, 12))
-        
-        story.append(Paragraph("Análisis de Sentimiento", heading_style))
-        story.append(Paragraph(analysis.get("analisis_sentimiento", ""), normal_style))
-        story.append(Spacer(1, 12))
-        
-        story.append(Paragraph("Recomendaciones", heading_style))
-        story.append(Paragraph(analysis.get("recomendaciones", ""), normal_style))
-        story.append(Spacer(1, 12))
-        
-        story.append(Paragraph("Transcripción Completa", heading_style))
-        story.append(Paragraph(text, normal_style))
-        
-        # Construir el documento
-        doc.build(story)
-        
-        buffer.seek(0)
-        return buffer.getvalue()
-    except Exception as e:
-        logger.error(f"Error al generar archivo PDF: {e}")
-        raise
-
-async def generate_word_file(text, analysis, timestamp):
-    """Genera un archivo Word con el análisis."""
-    try:
-        # Crear un documento Word
-        doc = Document()
-        
-        # Título
-        doc.add_heading("Análisis de Transcripción", 0)
-        
-        # Añadir secciones
-        doc.add_heading("Resumen General", level=1)
-        doc.add_paragraph(analysis.get("resumen", ""))
-        
-        doc.add_heading("Percepciones por Área", level=1)
-        doc.add_paragraph(analysis.get("percepciones_por_area", ""))
-        
-        doc.add_heading("Relaciones entre Áreas", level=1)
-        doc.add_paragraph(analysis.get("relaciones_entre_areas", ""))
-        
-        doc.add_heading("Factores que Afectan la Experiencia del Empleado", level=1)
-        doc.add_paragraph(analysis.get("factores_experiencia", ""))
-        
-        doc.add_heading("Análisis de Sentimiento", level=1)
-        doc.add_paragraph(analysis.get("analisis_sentimiento", ""))
-        
-        doc.add_heading("Recomendaciones", level=1)
-        doc.add_paragraph(analysis.get("recomendaciones", ""))
-        
-        doc.add_heading("Transcripción Completa", level=1)
-        doc.add_paragraph(text)
-        
-        # Guardar en un buffer en memoria
-        buffer = BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-        return buffer.getvalue()
-    except Exception as e:
-        logger.error(f"Error al generar archivo Word: {e}")
-        raise
+    }))
+    for offset in range(0, len(data), FILE_CHUNK_SIZE):
+        await websocket.send_bytes(bytes(data[offset:offset + FILE_CHUNK_SIZE]))
+    await websocket.send_text(json.dumps({"file_end": {"format": format_name}}))
 
 @app.get("/")
 async def root():
@@ -529,15 +615,205 @@ async def root():
         "message": "API de Transcripción en Tiempo Real con FastAPI y Deepgram. Conéctate vía WebSocket a /ws/transcribe"
     }
 
-# ... Add these imports at the top of the file
-from fastapi.responses import FileResponse
-from io import BytesIO
-import docx
-from docx import Document
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-import tempfile
+_REPORT_ID = re.compile(r"^[0-9a-f]{64}$")
+_UNSAFE_FILENAME = re.compile(r"[^\w.\-]")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Métricas del servidor en formato de texto de Prometheus."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/reports/{format_name}/{report_id}")
+async def download_report(format_name: str, report_id: str, filename: Optional[str] = None):
+    """Descarga en streaming un reporte generado, desde la caché o desde REPORTS_DIR."""
+    if format_name not in REPORT_FORMATS or not _REPORT_ID.match(report_id):
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    extension = REPORT_FORMATS[format_name]["extension"]
+    filename = _UNSAFE_FILENAME.sub("_", filename or f"transcripcion_{report_id[:12]}.{extension}")
+    content_type = REPORT_FORMATS[format_name]["content_type"]
+
+    path = spooled_report_path(format_name, report_id)
+    if os.path.exists(path):
+        return FileResponse(path, media_type=content_type, filename=filename)
+
+    data = await report_cache.get(report_id)
+    if not isinstance(data, bytes):
+        # La caché también guarda análisis (dicts) con claves del mismo formato: no son reportes
+        raise HTTPException(status_code=404, detail="Reporte no encontrado o expirado")
+
+    async def iter_chunks():
+        view = memoryview(data)
+        for offset in range(0, len(view), FILE_CHUNK_SIZE):
+            yield bytes(view[offset:offset + FILE_CHUNK_SIZE])
+
+    return StreamingResponse(
+        iter_chunks(),
+        media_type=content_type,
+        headers={
+            "Content-Length": str(len(data)),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
+
+@app.post("/batch/jobs", status_code=202)
+async def create_batch_job(request: Request, filename: str = "audio", model: str = "nova-2",
+                           export_formats: str = "excel", tenant: Optional[str] = None):
+    """Sube un archivo de audio (cuerpo de la petición) y lo encola para transcribirlo y analizarlo."""
+    if batch_queue.depth >= batch_queue.max_queued:
+        raise HTTPException(status_code=503, detail="Cola de trabajos llena, inténtalo más tarde")
+    try:
+        path = await save_upload(request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        job = batch_queue.submit(path, filename, model, export_formats.split(","),
+                                 tenant or (request.client.host if request.client else "batch"))
+    except QueueFull as e:
+        os.remove(path)
+        raise HTTPException(status_code=503, detail=str(e))
+    return job_response(job, include_analysis=True)
+
+def job_response(job, include_analysis):
+    """Estado del trabajo para su dueño: con su token y el de su sesión (para /sessions/{id}/transcript)."""
+    response = job.to_dict(include_analysis=include_analysis)
+    response["access_token"] = access_token("batch", job.id)
+    if job.session_id:
+        response["session_access_token"] = access_token("session", job.session_id)
+    return response
+
+@app.get("/batch/jobs")
+async def list_batch_jobs(tenant: Optional[str] = None, x_access_token: Optional[str] = Header(None),
+                          x_admin_token: Optional[str] = Header(None)):
+    """Estado resumido de los trabajos por lotes.
+
+    Con el token de administración, todos (o los de ``tenant``); si no, sólo los
+    trabajos cuyos tokens de acceso se pasen en X-Access-Token, separados por comas.
+    """
+    if is_admin(x_admin_token):
+        jobs = [job for job in batch_queue.jobs.values() if tenant is None or job.tenant == tenant]
+    else:
+        tokens = [token.strip() for token in (x_access_token or "").split(",") if token.strip()]
+        jobs = [
+            job for job in batch_queue.jobs.values()
+            if any(has_access("batch", job.id, token) for token in tokens)
+        ]
+    return {
+        "stats": batch_queue.stats(),
+        "jobs": [job_response(job, include_analysis=False) for job in jobs],
+    }
+
+@app.get("/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str, x_access_token: Optional[str] = Header(None),
+                        x_admin_token: Optional[str] = Header(None)):
+    """Estado de un trabajo; al terminar incluye el análisis y las URLs de los reportes."""
+    require_access("batch", job_id, x_access_token, x_admin_token)
+    job = batch_queue.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job_response(job, include_analysis=True)
+
+@app.delete("/batch/jobs/{job_id}")
+async def cancel_batch_job(job_id: str, x_access_token: Optional[str] = Header(None),
+                           x_admin_token: Optional[str] = Header(None)):
+    """Cancela un trabajo en cola o en curso."""
+    require_access("batch", job_id, x_access_token, x_admin_token)
+    job = batch_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job_response(job, include_analysis=False)
+
+@app.get("/sessions/{session_id}/transcript")
+async def session_transcript(session_id: str, start: Optional[float] = None, end: Optional[float] = None,
+                             x_access_token: Optional[str] = Header(None),
+                             x_admin_token: Optional[str] = Header(None)):
+    """Segmentos de una sesión guardada, opcionalmente sólo los que se solapan con [start, end] segundos.
+
+    Requiere el token de acceso de la sesión (X-Access-Token) o el de administración.
+    """
+    require_access("session", session_id, x_access_token, x_admin_token)
+    if not await session_store.exists(session_id):
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    segments = SegmentStore()
+    segments.extend_dicts(await session_store.segments(session_id))
+    if start is None and end is None:
+        indices = range(len(segments))
+    else:
+        indices = segments.between(start or 0.0, end if end is not None else float("inf"))
+    return {
+        "session_id": session_id,
+        "duration": round(segments.duration, 3),
+        "segments": [segments.to_dict(i) for i in indices],
+        "text": segments.timecoded(start, end),
+    }
+
+def access_token(kind, resource_id):
+    """Token de acceso a una sesión o trabajo: HMAC del id con ACCESS_TOKEN_SECRET."""
+    message = f"{kind}:{resource_id}".encode()
+    return hmac.new(ACCESS_TOKEN_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+def has_access(kind, resource_id, token):
+    return isinstance(token, str) and hmac.compare_digest(token.encode(), access_token(kind, resource_id).encode())
+
+def is_admin(token):
+    return bool(ADMIN_TOKEN) and isinstance(token, str) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def require_access(kind, resource_id, token, admin_token):
+    """Exige el token de acceso del recurso (X-Access-Token) o el de administración."""
+    if not (has_access(kind, resource_id, token) or is_admin(admin_token)):
+        raise HTTPException(status_code=403, detail="Token de acceso no válido")
+
+def require_admin(token):
+    """Comprueba la cabecera X-Admin-Token contra ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Endpoints de administración deshabilitados")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Token de administración no válido")
+
+@app.get("/admin/watchdog")
+async def get_watchdog(limit: int = 10, x_admin_token: Optional[str] = Header(None)):
+    """Estado de la vigilancia del event loop y los últimos bloqueos con su pila."""
+    require_admin(x_admin_token)
+    return {**loop_watchdog.state(), "recent_stalls": loop_watchdog.recent_stalls(limit)}
+
+@app.post("/admin/watchdog")
+async def configure_watchdog(enabled: Optional[bool] = None, threshold: Optional[float] = None,
+                             x_admin_token: Optional[str] = Header(None)):
+    """Activa o desactiva la captura de pilas o cambia el umbral (segundos) sin reiniciar."""
+    require_admin(x_admin_token)
+    try:
+        return loop_watchdog.configure(enabled=enabled, threshold=threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/scheduler")
+async def get_scheduler(x_admin_token: Optional[str] = Header(None)):
+    """Trabajos de análisis y reportes en curso y en cola, por tenant."""
+    require_admin(x_admin_token)
+    return {"analysis": analysis_scheduler.stats(), "render": render_scheduler.stats()}
+
+@app.get("/search")
+async def search_transcripts(q: str, limit: int = 20, offset: int = 0,
+                             session_id: Optional[str] = None, kind: Optional[str] = None,
+                             x_admin_token: Optional[str] = Header(None)):
+    """Busca en las transcripciones y análisis guardados; devuelve los resultados más relevantes primero.
+
+    ``kind`` limita a "segment" (fragmentos con start/end en segundos) o "analysis"
+    (secciones del informe). Entre comillas se busca la frase exacta. Abarca las
+    sesiones de todos los tenants, así que exige el token de administración.
+    """
+    require_admin(x_admin_token)
+    if not SEARCH_INDEX:
+        raise HTTPException(status_code=404, detail="Búsqueda deshabilitada")
+    if not search_index.ready:
+        raise HTTPException(status_code=503, detail="El índice de búsqueda no está disponible")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="La consulta está vacía")
+    if kind not in (None, "segment", "analysis"):
+        raise HTTPException(status_code=400, detail="kind debe ser 'segment' o 'analysis'")
+    if limit < 1 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit u offset no válidos")
+    hits = await search_index.search(q, limit, offset, session_id, kind)
+    return {"query": q, "hits": hits}
 
 # --- Para Ejecutar Localmente (opcional) ---
 # Se recomienda usar `uvicorn main:app --host 0.0.0.0 --port 8000 --reload`
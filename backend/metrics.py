@@ -0,0 +1,291 @@
+# backend/metrics.py
+"""Métricas del servidor en formato de texto de Prometheus y trazas por sesión.
+
+Implementación mínima sin dependencias: contadores, gauges e histogramas con
+etiquetas, registrados en ``REGISTRY`` y expuestos por ``/metrics``. Cada
+módulo observa sus propias métricas (``live`` la latencia de Deepgram,
+``analysis`` la del LLM, ``reports`` la de renderizado, etc.).
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Cubetas por defecto de los histogramas
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+QUEUE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {self.label_names}, no {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, label_values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.label_names, label_values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Gauge con valor fijado a mano o leído de una función (sin etiquetas) al exportar."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self._callback = None
+
+    def set_function(self, callback):
+        """El valor se obtiene llamando a ``callback()`` en cada exportación."""
+        self._callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        if self._callback is not None:
+            return self._callback()
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        if self._callback is not None:
+            return [("", (), (), self._callback())]
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), registry=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [conteos por cubeta (no acumulados)..., +Inf], suma, total
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            else:
+                state[0][-1] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    samples.append(("_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+                samples.append(("_sum", key, (), total))
+                samples.append(("_count", key, (), count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self):
+        """Texto de exposición de Prometheus (versión 0.0.4)."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class SessionTrace:
+    """Intervalos con nombre medidos dentro de una sesión, relativos a su inicio."""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._spans = []
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, started, time.perf_counter())
+
+    def add(self, name, started, finished):
+        """Registra un intervalo medido con ``time.perf_counter()``."""
+        self._spans.append({
+            "name": name,
+            "start_s": round(started - self._origin, 3),
+            "duration_s": round(finished - started, 3),
+        })
+
+    def spans(self):
+        return list(self._spans)
+
+
+def resident_memory_bytes():
+    """Memoria residente del proceso (Linux: /proc/self/statm; si no, el pico de ru_maxrss)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# --- Métricas compartidas ---
+active_sessions = Gauge("rtt_active_sessions", "Sesiones WebSocket de transcripción abiertas")
+sessions_total = Counter("rtt_sessions_total", "Sesiones WebSocket de transcripción aceptadas")
+deepgram_result_latency = Histogram(
+    "rtt_deepgram_result_latency_seconds",
+    "Tiempo desde la llegada del final del audio hasta recibir su transcripción",
+    labels=("final",),
+)
+deepgram_reconnects = Counter("rtt_deepgram_reconnects_total", "Reconexiones con Deepgram", labels=("result",))
+deepgram_reconnect_seconds = Histogram(
+    "rtt_deepgram_reconnect_seconds", "Duración de las reconexiones con Deepgram", buckets=DURATION_BUCKETS
+)
+audio_queue_frames = Histogram(
+    "rtt_audio_queue_frames", "Frames en la cola de audio hacia Deepgram al encolar uno nuevo",
+    buckets=QUEUE_BUCKETS,
+)
+audio_send_lag_seconds = Histogram(
+    "rtt_audio_send_lag_seconds", "Segundos entre la llegada de un frame de audio y su envío a Deepgram",
+    labels=("policy",), buckets=LAG_BUCKETS,
+)
+audio_frames_dropped = Counter("rtt_audio_frames_dropped_total", "Frames de audio descartados por cola llena")
+preprocess_bytes = Counter(
+    "rtt_preprocess_bytes_total", "Bytes de audio recibidos del cliente y enviados a Deepgram tras el preprocesado",
+    labels=("direction",),
+)
+preprocess_skipped_seconds = Counter(
+    "rtt_preprocess_skipped_seconds_total", "Segundos de silencio que el preprocesado no envió a Deepgram"
+)
+analysis_seconds = Histogram(
+    "rtt_analysis_duration_seconds", "Duración de generate_analysis", labels=("mode",), buckets=DURATION_BUCKETS
+)
+analysis_tokens = Histogram(
+    "rtt_analysis_tokens", "Tokens de entrada y salida por análisis", labels=("kind",), buckets=TOKEN_BUCKETS
+)
+analysis_errors = Counter("rtt_analysis_errors_total", "Análisis fallidos")
+analysis_reports = Counter(
+    "rtt_analysis_reports_total", "Respuestas del informe final por formato (json | text) y resultado",
+    labels=("format", "result"),
+)
+analysis_retries = Counter(
+    "rtt_analysis_retries_total", "Informes pedidos de nuevo por llegar incompletos", labels=("format",)
+)
+llm_requests = Counter("rtt_llm_requests_total", "Peticiones a OpenAI por resultado", labels=("result",))
+llm_in_flight = Gauge("rtt_llm_in_flight", "Peticiones a OpenAI en curso")
+render_seconds = Histogram(
+    "rtt_render_duration_seconds", "Duración del renderizado de cada reporte", labels=("format",),
+    buckets=DURATION_BUCKETS,
+)
+render_queue_depth = Gauge("rtt_render_queue_depth", "Reportes esperando un proceso libre")
+render_bytes = Histogram(
+    "rtt_render_size_bytes", "Tamaño de cada reporte generado", labels=("format",), buckets=SIZE_BUCKETS
+)
+scheduler_queued = Gauge("rtt_scheduler_queued", "Trabajos posteriores a la sesión esperando turno", labels=("stage",))
+scheduler_in_flight = Gauge("rtt_scheduler_in_flight", "Trabajos posteriores a la sesión en curso", labels=("stage",))
+scheduler_wait_seconds = Histogram(
+    "rtt_scheduler_wait_seconds", "Espera en cola hasta empezar el análisis o los reportes",
+    labels=("stage",), buckets=DURATION_BUCKETS,
+)
+scheduler_cancelled = Counter(
+    "rtt_scheduler_cancelled_total", "Trabajos que salieron de la cola antes de su turno", labels=("stage",)
+)
+scheduler_rejected = Counter("rtt_scheduler_rejected_total", "Trabajos rechazados por cola llena", labels=("stage",))
+search_indexed = Counter(
+    "rtt_search_indexed_total", "Segmentos y secciones de análisis indexados para la búsqueda", labels=("kind",)
+)
+search_seconds = Histogram("rtt_search_duration_seconds", "Duración de las consultas de búsqueda", buckets=LAG_BUCKETS)
+batch_jobs = Counter("rtt_batch_jobs_total", "Trabajos por lotes terminados por estado", labels=("state",))
+batch_queue_depth = Gauge("rtt_batch_queue_depth", "Trabajos por lotes esperando un worker")
+batch_realtime_factor = Histogram(
+    "rtt_batch_realtime_factor", "Segundos de audio transcritos por segundo de trabajo",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+event_loop_lag = Histogram(
+    "rtt_event_loop_lag_seconds", "Retraso del event loop al despertar de un sleep", buckets=LAG_BUCKETS
+)
+event_loop_stalls = Counter(
+    "rtt_event_loop_stalls_total", "Bloqueos del event loop por encima de LOOP_WATCHDOG_THRESHOLD"
+)
+event_loop_stall_seconds = Histogram(
+    "rtt_event_loop_stall_seconds", "Duración de los bloqueos del event loop detectados", buckets=LAG_BUCKETS
+)
+loop_watchdog_enabled = Gauge("rtt_loop_watchdog_enabled", "1 si la captura de pilas del event loop está activa")
+process_memory = Gauge("rtt_process_resident_memory_bytes", "Memoria residente del proceso")
+process_memory.set_function(resident_memory_bytes)
+cache_requests = Counter("rtt_cache_requests_total", "Consultas a la caché por resultado", labels=("result",))
@@ -0,0 +1,136 @@
+# backend/pipeline.py
+"""Etapas posteriores a la transcripción compartidas por sesiones en vivo y trabajos por lotes.
+
+Análisis y archivos se cachean por contenido (ver ``cache``); los archivos se
+pueden guardar en REPORTS_DIR para descargarlos por HTTP desde /reports.
+"""
+import os
+import json
+import asyncio
+import logging
+import tempfile
+from contextlib import nullcontext
+from datetime import datetime
+from urllib.parse import quote
+
+from analysis import ANALYSIS_MODEL, PROMPT_VERSION
+from cache import content_key, report_cache
+from reports import REPORT_FORMATS, SECTIONS, render_pool
+
+logger = logging.getLogger(__name__)
+
+# Carpeta donde se guardan los reportes para descargarlos por HTTP (modo "http" y lotes)
+REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(tempfile.gettempdir(), "rtt_reports"))
+REPORTS_TTL_SECONDS = float(os.getenv("REPORTS_TTL_SECONDS", str(24 * 3600)))
+
+
+def analysis_cache_key(text):
+    """Clave de caché del análisis: transcripción + versión del prompt + modelo."""
+    return content_key("analysis", PROMPT_VERSION, ANALYSIS_MODEL, " ".join(text.split()))
+
+
+async def cached_analysis(text, generate):
+    """Devuelve el análisis cacheado del texto o lo genera con ``await generate()`` y lo cachea."""
+    key = analysis_cache_key(text)
+    analysis = await report_cache.get(key)
+    if analysis is not None:
+        logger.info("Análisis obtenido de la caché")
+        analysis["tiempos"] = {"modo": "cache"}
+        return analysis
+    analysis = await generate()
+    if "error" not in analysis:
+        await report_cache.set(key, analysis)
+    return analysis
+
+
+def render_cache_key(format_name, text, analysis, segments=None):
+    """Clave de caché de un archivo: formato + transcripción + contenido de las secciones.
+
+    Con ``segments`` (inicio, fin, texto) se añaden los segundos en que empieza
+    cada segmento, que es lo que cambia en la transcripción con marcas de tiempo.
+    """
+    sections = json.dumps([analysis.get(key, "") for key, _ in SECTIONS], ensure_ascii=False)
+    parts = ["render", format_name, " ".join(text.split()), sections]
+    if segments:
+        parts.append(",".join(f"{int(start)}:{segment_text}" for start, _, segment_text in segments))
+    return content_key(*parts)
+
+
+async def render_cached(text, analysis, export_formats, segments=None, admission=None):
+    """Devuelve los archivos pedidos, generando en paralelo sólo los que no están en caché.
+
+    ``admission`` (p. ej. ``render_scheduler.slot(...)``) se espera sólo si hay
+    algo que generar: lo que sale de la caché no ocupa turno.
+    """
+    rendered = {}
+    missing = []
+    for format_name in export_formats:
+        data = await report_cache.get(render_cache_key(format_name, text, analysis, segments))
+        if data is None:
+            missing.append(format_name)
+        else:
+            rendered[format_name] = data
+    if missing:
+        async with admission or nullcontext():
+            new_files = await render_pool.render_all(text, analysis, missing, segments)
+        for format_name, data in new_files.items():
+            await report_cache.set(render_cache_key(format_name, text, analysis, segments), data)
+        rendered.update(new_files)
+    logger.info(f"Archivos desde caché: {len(rendered) - len(missing)}, generados: {len(missing)}")
+    return rendered
+
+
+async def build_file_data(text, analysis, export_formats, segments=None, admission=None):
+    """Genera en paralelo los archivos pedidos y devuelve nombre, bytes y tipo por formato."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    formats = [name for name in REPORT_FORMATS if name in export_formats]
+    rendered = await render_cached(text, analysis, formats, segments, admission)
+    return {
+        format_name: {
+            "filename": f"transcripcion_{timestamp}.{REPORT_FORMATS[format_name]['extension']}",
+            "data": rendered[format_name],
+            "content_type": REPORT_FORMATS[format_name]["content_type"],
+            "report_id": render_cache_key(format_name, text, analysis, segments),
+        }
+        for format_name in formats
+    }
+
+
+def file_metadata(format_name, file_info, download_mode):
+    """Metadatos de un archivo para el mensaje analysis_complete (sin los bytes)."""
+    metadata = {
+        "filename": file_info["filename"],
+        "content_type": file_info["content_type"],
+        "size": len(file_info["data"]),
+    }
+    if download_mode == "http":
+        metadata["download_url"] = f"/reports/{format_name}/{file_info['report_id']}?filename={quote(file_info['filename'])}"
+    return metadata
+
+
+def spooled_report_path(format_name, report_id):
+    return os.path.join(REPORTS_DIR, f"{report_id}.{REPORT_FORMATS[format_name]['extension']}")
+
+
+async def spool_files(file_data):
+    """Guarda los archivos en REPORTS_DIR para que sigan disponibles por HTTP aunque salgan de la caché."""
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    for format_name, file_info in file_data.items():
+        path = spooled_report_path(format_name, file_info["report_id"])
+        if not os.path.exists(path):
+            await asyncio.to_thread(write_file, path, file_info["data"])
+
+
+def purge_spooled_reports():
+    """Elimina los reportes guardados con más de REPORTS_TTL_SECONDS."""
+    if not os.path.isdir(REPORTS_DIR):
+        return
+    cutoff = datetime.now().timestamp() - REPORTS_TTL_SECONDS
+    for entry in os.scandir(REPORTS_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,389 @@
+# backend/preprocess.py
+"""Preprocesado opcional del audio de una sesión antes de enviarlo a Deepgram.
+
+Sin preprocesado cada frame del MediaRecorder se reenvía tal cual, silencios
+incluidos. Con AUDIO_PREPROCESS (o ``"preprocess": true`` en la configuración
+de la sesión) el audio pasa por un hilo de trabajo que:
+
+1. Decodifica el contenedor (WebM/Ogg con Opus) con un proceso ``ffmpeg`` que
+   además mezcla a mono y remuestrea a 16 kHz. Si el cliente declara audio sin
+   contenedor (``"audio_format": {"encoding": "linear16", "sample_rate": 48000,
+   "channels": 2}``) no hace falta ffmpeg: la mezcla y el remuestreo se hacen
+   con numpy.
+2. Clasifica cada trama de 20 ms como voz o silencio (energía sobre un suelo de
+   ruido adaptativo, o webrtcvad si está instalado y PREPROCESS_VAD=webrtc).
+3. Descarta el silencio, salvo PREPROCESS_PADDING_MS antes y después de cada
+   tramo de voz: Deepgram necesita ese margen para cerrar los enunciados.
+4. Agrupa las tramas en envíos de PREPROCESS_BATCH_MS de linear16 a 16 kHz mono.
+
+Al quitar silencio, el segundo ``t`` del audio enviado ya no es el segundo
+``t`` de la sesión. El preprocesador guarda dónde empieza cada tramo enviado
+(segundos enviados -> segundos de audio recibido) y ``LiveTranscriber`` lo usa
+con ``timeline=`` para devolver los tiempos de la sesión. Durante los
+silencios largos se manda KeepAlive para que Deepgram no cierre la conexión.
+
+numpy se importa dentro de los métodos que lo usan: las sesiones sin
+preprocesado no lo cargan.
+"""
+import os
+import time
+import queue
+import shutil
+import asyncio
+import logging
+import threading
+import subprocess
+from bisect import bisect_right
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "false").lower() in ("1", "true", "yes")
+PREPROCESS_FFMPEG = os.getenv("PREPROCESS_FFMPEG", "ffmpeg")
+PREPROCESS_VAD = os.getenv("PREPROCESS_VAD", "energy")  # "energy" o "webrtc"
+PREPROCESS_VAD_DB = float(os.getenv("PREPROCESS_VAD_DB", "12"))  # dB sobre el suelo de ruido para considerar voz
+PREPROCESS_PADDING_MS = int(os.getenv("PREPROCESS_PADDING_MS", "500"))
+PREPROCESS_BATCH_MS = int(os.getenv("PREPROCESS_BATCH_MS", "200"))
+PREPROCESS_KEEPALIVE_SECONDS = float(os.getenv("PREPROCESS_KEEPALIVE_SECONDS", "5"))
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # linear16
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH
+FRAME_MS = 20
+FRAME_BYTES = BYTES_PER_SECOND * FRAME_MS // 1000
+MIN_SPEECH_DBFS = -55.0  # Por debajo de esto nunca es voz, sea cual sea el suelo de ruido
+READ_BYTES = 4096
+
+# Opciones de Deepgram para el audio que sale del preprocesador
+LIVE_ENCODING = {"encoding": "linear16", "sample_rate": SAMPLE_RATE, "channels": 1}
+
+
+def is_raw(input_format):
+    return bool(input_format) and input_format.get("encoding") == "linear16"
+
+
+def available(input_format=None):
+    """Indica si se puede preprocesar este audio (los contenedores necesitan ffmpeg)."""
+    return is_raw(input_format) or shutil.which(PREPROCESS_FFMPEG) is not None
+
+
+class EnergyVad:
+    """Voz si la energía de la trama supera en PREPROCESS_VAD_DB el suelo de ruido estimado."""
+
+    def __init__(self, threshold_db=PREPROCESS_VAD_DB):
+        self.threshold_db = threshold_db
+        self.noise_db = -60.0
+
+    def is_speech(self, frame):
+        import numpy as np
+
+        samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples * samples))) / 32768.0
+        db = 20.0 * np.log10(max(rms, 1e-6))
+        # El suelo baja enseguida y sube despacio, para no adaptarse a la voz
+        if db < self.noise_db:
+            self.noise_db = db
+        else:
+            self.noise_db += 0.005 * (db - self.noise_db)
+        return db > max(self.noise_db + self.threshold_db, MIN_SPEECH_DBFS)
+
+
+class WebrtcVad:
+    def __init__(self, aggressiveness=2):
+        import webrtcvad
+
+        self._vad = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, frame):
+        return self._vad.is_speech(frame, SAMPLE_RATE)
+
+
+def make_vad(kind=PREPROCESS_VAD):
+    if kind == "webrtc":
+        try:
+            return WebrtcVad()
+        except ImportError:
+            logger.warning("webrtcvad no está instalado; se usa el detector por energía")
+    return EnergyVad()
+
+
+class PcmConverter:
+    """linear16 intercalado a cualquier tasa -> 16 kHz mono, conservando el estado entre trozos."""
+
+    def __init__(self, sample_rate, channels):
+        import numpy as np
+
+        self.sample_rate = int(sample_rate)
+        self.channels = int(channels)
+        self._partial = b""  # bytes de una trama multicanal incompleta
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._position = 0.0  # posición de la siguiente muestra de salida en _carry
+
+    def convert(self, data):
+        import numpy as np
+
+        data = self._partial + data
+        usable = len(data) - len(data) % (SAMPLE_WIDTH * self.channels)
+        self._partial = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if self.sample_rate == SAMPLE_RATE:
+            output = samples
+        else:
+            output = self._resample(samples)
+        return np.clip(np.round(output), -32768, 32767).astype("<i2").tobytes()
+
+    def _resample(self, samples):
+        import numpy as np
+
+        buffer = np.concatenate((self._carry, samples))
+        ratio = self.sample_rate / SAMPLE_RATE
+        if ratio.is_integer():
+            # Caso habitual (48 kHz): media de cada grupo de muestras, que además filtra el aliasing
+            factor = int(ratio)
+            usable = len(buffer) - len(buffer) % factor
+            self._carry = buffer[usable:]
+            return buffer[:usable].reshape(-1, factor).mean(axis=1)
+        last = len(buffer) - 1
+        if last < self._position:
+            self._carry = buffer
+            return np.zeros(0, dtype=np.float32)
+        count = int((last - self._position) // ratio) + 1
+        positions = self._position + np.arange(count) * ratio
+        output = np.interp(positions, np.arange(len(buffer)), buffer)
+        following = self._position + count * ratio
+        consumed = min(int(following), len(buffer))  # la siguiente salida puede caer en el próximo trozo
+        self._carry = buffer[consumed:]
+        self._position = following - consumed
+        return output
+
+
+class AudioPreprocessor:
+    """Decodificación, detección de voz y agrupación del audio de una sesión en un hilo aparte."""
+
+    def __init__(self, emit, keep_alive=None, input_format=None, vad=PREPROCESS_VAD,
+                 padding_ms=PREPROCESS_PADDING_MS, batch_ms=PREPROCESS_BATCH_MS,
+                 keepalive_seconds=PREPROCESS_KEEPALIVE_SECONDS):
+        # async (bytes) -> Any; si devuelve False el envío se descartó (cola llena con política "drop")
+        self._emit = emit
+        self._keep_alive = keep_alive  # async () -> Any, opcional
+        self.input_format = input_format if is_raw(input_format) else None
+        self.decoder = "numpy" if self.input_format else "ffmpeg"
+        self._vad = make_vad(vad)
+        self.padding_frames = max(0, padding_ms // FRAME_MS)
+        self.batch_bytes = max(1, batch_ms // FRAME_MS) * FRAME_BYTES
+        self.keepalive_frames = int(keepalive_seconds * 1000 / FRAME_MS)
+        self.bytes_per_second = BYTES_PER_SECOND  # del audio que sale (lo usa LiveTranscriber)
+        self.started = None  # reloj monotónico del primer frame recibido (segundo 0 del audio recibido)
+        self._input = queue.Queue()
+        self._loop = None
+        self._process = None
+        self._threads = []
+        # Estado del hilo de trabajo
+        self._pending = bytearray()
+        self._frames = 0           # tramas de 20 ms clasificadas (posición en el audio recibido)
+        self._pre_roll = deque(maxlen=self.padding_frames or 1)
+        self._hangover = 0
+        self._silent_frames = 0
+        self._batch = bytearray()
+        self._batch_start = 0.0    # segundo del audio recibido en que empieza el lote
+        self._contiguous = False   # el siguiente lote continúa el último enviado
+        # Línea de tiempo: inicio de cada tramo enviado en segundos enviados y en segundos recibidos
+        self._out_starts = []
+        self._source_starts = []
+        self._out_bytes = 0
+        # Métricas
+        self.bytes_in = 0
+        self.bytes_decoded = 0
+        self.bytes_forwarded = 0
+        self.bytes_dropped = 0
+        self.batches = 0
+        self.runs = 0
+        self.keepalives = 0
+        self.errors = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.input_format:
+            converter = PcmConverter(self.input_format.get("sample_rate", SAMPLE_RATE),
+                                     self.input_format.get("channels", 1))
+            self._spawn(self._convert, converter)
+        else:
+            self._process = subprocess.Popen(
+                [PREPROCESS_FFMPEG, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+                 "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+            self._spawn(self._feed_decoder)
+            self._spawn(self._read_decoder)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, name=f"preprocess-{target.__name__}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    async def put(self, data):
+        """Entrega un frame del cliente al hilo de trabajo (no bloquea el event loop)."""
+        if self.started is None:
+            self.started = time.monotonic()
+        self.bytes_in += len(data)
+        metrics.preprocess_bytes.inc(len(data), direction="in")
+        self._input.put(data)
+
+    # --- Hilos de trabajo ---
+
+    def _convert(self, converter):
+        while (data := self._input.get()) is not None:
+            try:
+                self._process_pcm(converter.convert(data))
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error al preprocesar audio: {e}")
+        self._flush()
+
+    def _feed_decoder(self):
+        stdin = self._process.stdin
+        while (data := self._input.get()) is not None:
+            if stdin.closed:
+                continue  # ffmpeg falló: se vacía la cola para que no crezca
+            try:
+                stdin.write(data)
+                stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self.errors += 1
+                logger.error(f"ffmpeg dejó de aceptar audio: {e}")
+                self._close_stdin()
+        self._close_stdin()
+
+    def _close_stdin(self):
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+
+    def _read_decoder(self):
+        stdout = self._process.stdout
+        while data := stdout.read1(READ_BYTES):
+            self._process_pcm(data)
+        self._flush()
+
+    def _process_pcm(self, pcm):
+        self.bytes_decoded += len(pcm)
+        self._pending += pcm
+        usable = len(self._pending) - len(self._pending) % FRAME_BYTES
+        for start in range(0, usable, FRAME_BYTES):
+            self._classify(bytes(self._pending[start:start + FRAME_BYTES]))
+        del self._pending[:usable]
+
+    def _classify(self, frame):
+        position = self._frames * FRAME_MS / 1000
+        self._frames += 1
+        if self._vad.is_speech(frame):
+            if self._hangover == 0:
+                # Empieza un tramo de voz: primero el silencio guardado justo antes
+                self.runs += 1
+                for index, previous in enumerate(self._pre_roll):
+                    self._add(previous, position - (len(self._pre_roll) - index) * FRAME_MS / 1000)
+                self._pre_roll.clear()
+            self._hangover = self.padding_frames + 1
+            self._silent_frames = 0
+            self._add(frame, position)
+        elif self._hangover > 0:
+            self._hangover -= 1
+            self._add(frame, position)
+            if self._hangover == 0:
+                self._send_batch()
+                self._contiguous = False
+        else:
+            if self.padding_frames:
+                self._pre_roll.append(frame)
+            self._silent_frames += 1
+            metrics.preprocess_skipped_seconds.inc(FRAME_MS / 1000)
+            if self._keep_alive and self.keepalive_frames and self._silent_frames % self.keepalive_frames == 0:
+                self.keepalives += 1
+                self._call(self._keep_alive())
+
+    def _add(self, frame, position):
+        if not self._batch:
+            self._batch_start = position
+        self._batch += frame
+        if len(self._batch) >= self.batch_bytes:
+            self._send_batch()
+
+    def _send_batch(self):
+        if not self._batch:
+            return
+        data = bytes(self._batch)
+        self._batch.clear()
+        if not self._contiguous:
+            # source_seconds() lee desde el event loop: primero la lista que indexa
+            self._source_starts.append(self._batch_start)
+            self._out_starts.append(self._out_bytes / BYTES_PER_SECOND)
+        if self._call(self._emit(data)) is False:
+            self.bytes_dropped += len(data)
+            self._contiguous = False  # El siguiente lote empieza un tramo nuevo en la línea de tiempo
+            return
+        self._contiguous = True
+        self._out_bytes += len(data)
+        self.batches += 1
+        self.bytes_forwarded += len(data)
+        metrics.preprocess_bytes.inc(len(data), direction="forwarded")
+
+    def _flush(self):
+        self._send_batch()
+
+    def _call(self, coroutine):
+        """Ejecuta una corrutina en el event loop y espera su resultado (contrapresión hacia el hilo)."""
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error al entregar el audio preprocesado: {e}")
+            return None
+
+    # --- Línea de tiempo ---
+
+    def source_seconds(self, sent_seconds):
+        """Segundo del audio recibido que corresponde al segundo ``sent_seconds`` del audio enviado."""
+        index = bisect_right(self._out_starts, sent_seconds) - 1
+        if index < 0:
+            return sent_seconds
+        return self._source_starts[index] + sent_seconds - self._out_starts[index]
+
+    async def close(self, timeout=5.0):
+        """Termina de procesar lo recibido y envía el último lote."""
+        self._input.put(None)
+
+        def join():
+            for thread in self._threads:
+                thread.join(timeout)
+            if self._process is not None:
+                try:
+                    self._process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    logger.warning("ffmpeg no terminó a tiempo; se detiene")
+                    self._process.kill()
+
+        await asyncio.to_thread(join)
+
+    def stats(self):
+        seconds_in = self._frames * FRAME_MS / 1000
+        seconds_forwarded = self.bytes_forwarded / BYTES_PER_SECOND
+        return {
+            "decoder": self.decoder,
+            "bytes_in": self.bytes_in,
+            "bytes_decoded": self.bytes_decoded,
+            "bytes_forwarded": self.bytes_forwarded,
+            "bytes_dropped": self.bytes_dropped,
+            "forwarded_ratio": round(self.bytes_forwarded / self.bytes_in, 3) if self.bytes_in else 0.0,
+            "seconds_in": round(seconds_in, 3),
+            "seconds_forwarded": round(seconds_forwarded, 3),
+            "seconds_skipped": round(max(0.0, seconds_in - seconds_forwarded), 3),
+            "speech_runs": self.runs,
+            "batches": self.batches,
+            "keepalives": self.keepalives,
+            "errors": self.errors,
+        }
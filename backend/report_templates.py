@@ -0,0 +1,205 @@
+# backend/report_templates.py
+"""Plantillas precompiladas de los reportes.
+
+Lo que es igual en todos los reportes (hoja de estilos y títulos del PDF,
+documento Word con los encabezados, fuentes de la cabecera Excel) se construye
+una sola vez por proceso con ``load_templates()`` (el pool de renderizado lo
+llama al arrancar cada proceso) y en cada exportación sólo se rellena el
+contenido de las secciones:
+
+- PDF: la transcripción se parte en párrafos de ~PDF_PARAGRAPH_WORDS palabras;
+  un único ``Paragraph`` gigante hace que reportlab lo vuelva a partir en cada
+  página (coste cuadrático: ~50 s para 100.000 palabras).
+- Word: se carga una copia del esqueleto .docx, se rellenan sus párrafos vacíos
+  y los párrafos con marcas de tiempo se clonan de uno ya construido.
+- Excel: openpyxl en modo de sólo escritura, sin pasar por pandas.
+"""
+import os
+import logging
+from io import BytesIO
+from copy import deepcopy
+from xml.sax.saxutils import escape
+
+from docx import Document
+from docx.oxml.ns import qn
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+from reports import SECTIONS
+from segments import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+PDF_PARAGRAPH_WORDS = int(os.getenv("PDF_PARAGRAPH_WORDS", "200"))
+EXCEL_MAX_CELL_CHARS = 32767  # Límite de Excel por celda
+
+REPORT_TITLE = "Análisis de Transcripción"
+TRANSCRIPT_TITLE = "Transcripción Completa"
+TIMECODED_TITLE = "Transcripción con Marcas de Tiempo"
+TIMECODED_SHEET = "Marcas de tiempo"
+
+# Columnas de la hoja principal del Excel: (título, clave en el análisis o None para la transcripción)
+EXCEL_COLUMNS = [
+    ("Transcripción Completa", None),
+    ("Resumen General", "resumen"),
+    ("Percepciones por Área", "percepciones_por_area"),
+    ("Relaciones entre Áreas", "relaciones_entre_areas"),
+    ("Factores Experiencia", "factores_experiencia"),
+    ("Análisis de Sentimiento", "analisis_sentimiento"),
+    ("Recomendaciones", "recomendaciones"),
+]
+
+
+def split_words(text, size=PDF_PARAGRAPH_WORDS):
+    """Parte ``text`` en trozos de ~``size`` palabras, cortando tras un final de frase si lo hay."""
+    words = text.split()
+    chunks = []
+    start = 0
+    while start < len(words):
+        stop = min(start + size, len(words))
+        if stop < len(words):
+            # Buscar un final de frase en la segunda mitad del trozo
+            for i in range(stop, start + size // 2, -1):
+                if words[i - 1].endswith((".", "?", "!")):
+                    stop = i
+                    break
+        chunks.append(" ".join(words[start:stop]))
+        start = stop
+    return chunks
+
+
+class PdfTemplate:
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.heading_style = styles["Heading2"]
+        self.normal_style = styles["Normal"]
+        self.title = Paragraph(REPORT_TITLE, styles["Title"])
+        self.headings = {key: Paragraph(title, self.heading_style) for key, title in SECTIONS}
+        self.transcript_heading = Paragraph(TRANSCRIPT_TITLE, self.heading_style)
+        self.timecoded_heading = Paragraph(TIMECODED_TITLE, self.heading_style)
+
+    def _paragraphs(self, text):
+        return [Paragraph(escape(chunk), self.normal_style) for chunk in split_words(text)]
+
+    def render(self, text, analysis, segments=None):
+        story = [self.title, Spacer(1, 12)]
+        for key, _ in SECTIONS:
+            story.append(self.headings[key])
+            story.extend(self._paragraphs(analysis.get(key, "")))
+            story.append(Spacer(1, 12))
+
+        story.append(self.transcript_heading)
+        story.extend(self._paragraphs(text))
+
+        if segments:
+            story.append(Spacer(1, 12))
+            story.append(self.timecoded_heading)
+            for start, _, segment_text in segments:
+                story.append(Paragraph(f"<b>[{format_timestamp(start)}]</b> {escape(segment_text)}", self.normal_style))
+
+        buffer = BytesIO()
+        SimpleDocTemplate(buffer, pagesize=letter).build(story)
+        return buffer.getvalue()
+
+
+class WordTemplate:
+    def __init__(self):
+        doc = Document()
+        doc.add_heading(REPORT_TITLE, 0)
+        # Índice del párrafo vacío que sigue a cada encabezado
+        self.placeholders = {}
+        for key, title in SECTIONS + [(None, TRANSCRIPT_TITLE)]:
+            doc.add_heading(title, level=1)
+            doc.add_paragraph()
+            self.placeholders[key] = len(doc.paragraphs) - 1
+        buffer = BytesIO()
+        doc.save(buffer)
+        self.skeleton = buffer.getvalue()
+        # Párrafo "[mm:ss] texto" que se clona por segmento: add_paragraph recorre el
+        # cuerpo en cada llamada y con miles de segmentos domina el tiempo de renderizado
+        paragraph = doc.add_paragraph()
+        paragraph.add_run("[00:00] ").bold = True
+        paragraph.add_run("texto")
+        self.timecoded_paragraph = paragraph._p
+
+    def render(self, text, analysis, segments=None):
+        doc = Document(BytesIO(self.skeleton))
+        paragraphs = doc.paragraphs
+        for key, index in self.placeholders.items():
+            content = text if key is None else analysis.get(key, "")
+            if content:
+                paragraphs[index].add_run(content)
+
+        if segments:
+            heading = doc.add_heading(TIMECODED_TITLE, level=1)._p
+            for start, _, segment_text in reversed(segments):
+                element = deepcopy(self.timecoded_paragraph)
+                timestamp, content = element.iter(qn("w:t"))
+                timestamp.text = f"[{format_timestamp(start)}] "
+                content.text = segment_text
+                heading.addnext(element)
+
+        buffer = BytesIO()
+        doc.save(buffer)
+        return buffer.getvalue()
+
+
+class ExcelTemplate:
+    def __init__(self):
+        # Mismo formato de cabecera que escribía pandas
+        thin = Side(style="thin")
+        self.header_font = Font(bold=True)
+        self.header_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        self.header_alignment = Alignment(horizontal="center", vertical="top")
+
+    def _header(self, sheet, titles):
+        row = []
+        for title in titles:
+            cell = WriteOnlyCell(sheet, value=title)
+            cell.font = self.header_font
+            cell.border = self.header_border
+            cell.alignment = self.header_alignment
+            row.append(cell)
+        sheet.append(row)
+
+    def render(self, text, analysis, segments=None):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Sheet1")
+        self._header(sheet, [title for title, _ in EXCEL_COLUMNS])
+        values = [text if key is None else analysis.get(key, "") for _, key in EXCEL_COLUMNS]
+        if any(len(value) > EXCEL_MAX_CELL_CHARS for value in values):
+            logger.warning(f"Excel: celdas de más de {EXCEL_MAX_CELL_CHARS} caracteres truncadas")
+        sheet.append([value[:EXCEL_MAX_CELL_CHARS] for value in values])
+
+        if segments:
+            timecoded = workbook.create_sheet(TIMECODED_SHEET)
+            self._header(timecoded, ["Inicio", "Fin", "Texto"])
+            for start, end, segment_text in segments:
+                timecoded.append([format_timestamp(start), format_timestamp(end), segment_text])
+
+        buffer = BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+
+
+class ReportTemplates:
+    def __init__(self):
+        self.excel = ExcelTemplate()
+        self.pdf = PdfTemplate()
+        self.word = WordTemplate()
+
+
+_templates = None
+
+
+def load_templates():
+    """Construye (una vez por proceso) y devuelve las plantillas de los reportes."""
+    global _templates
+    if _templates is None:
+        _templates = ReportTemplates()
+        logger.info(f"Plantillas de reportes cargadas en el proceso {os.getpid()}")
+    return _templates
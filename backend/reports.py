@@ -0,0 +1,214 @@
+# backend/reports.py
+"""Generación de reportes (Excel, PDF, Word) fuera del event loop.
+
+Las funciones ``render_*`` son síncronas y se ejecutan en un pool de procesos
+(``RenderPool``) para que una exportación larga no bloquee el reenvío de audio
+de las demás sesiones WebSocket. Rellenan las plantillas precompiladas de
+``report_templates``, que se importa sólo en los procesos del pool: reportlab,
+python-docx y openpyxl no se cargan en el proceso de la app.
+"""
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tamaño del pool de procesos y máximo de trabajos pendientes (en cola + en curso)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(3, os.cpu_count() or 1))))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", str(RENDER_WORKERS * 4)))
+
+# (clave en el análisis, título de la sección)
+SECTIONS = [
+    ("resumen", "Resumen General"),
+    ("percepciones_por_area", "Percepciones por Área"),
+    ("relaciones_entre_areas", "Relaciones entre Áreas"),
+    ("factores_experiencia", "Factores que Afectan la Experiencia del Empleado"),
+    ("analisis_sentimiento", "Análisis de Sentimiento"),
+    ("recomendaciones", "Recomendaciones"),
+]
+
+# Formatos soportados, en el orden en que se envían al cliente
+REPORT_FORMATS = {
+    "excel": {
+        "extension": "xlsx",
+        "content_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    },
+    "pdf": {
+        "extension": "pdf",
+        "content_type": "application/pdf",
+    },
+    "word": {
+        "extension": "docx",
+        "content_type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    },
+}
+
+
+def load_templates():
+    """Importa report_templates y construye sus plantillas (una vez por proceso)."""
+    from report_templates import load_templates
+
+    return load_templates()
+
+
+def render_excel(text, analysis, segments=None):
+    """Genera un archivo Excel con el análisis.
+
+    ``segments`` (opcional) es una lista de (inicio, fin, texto) que se añade
+    como transcripción con marcas de tiempo; lo mismo en PDF y Word.
+    """
+    return load_templates().excel.render(text, analysis, segments)
+
+
+def render_pdf(text, analysis, segments=None):
+    """Genera un archivo PDF con el análisis."""
+    return load_templates().pdf.render(text, analysis, segments)
+
+
+def render_word(text, analysis, segments=None):
+    """Genera un archivo Word con el análisis."""
+    return load_templates().word.render(text, analysis, segments)
+
+
+RENDERERS = {
+    "excel": render_excel,
+    "pdf": render_pdf,
+    "word": render_word,
+}
+
+
+def _noop():
+    return None
+
+
+def _render_job(format_name, text, analysis, segments=None):
+    """Punto de entrada en el proceso hijo: devuelve (bytes, inicio, fin)."""
+    started = time.time()
+    data = RENDERERS[format_name](text, analysis, segments)
+    return data, started, time.time()
+
+
+class RenderPool:
+    """Pool de procesos acotado para generar reportes con métricas básicas."""
+
+    def __init__(self, max_workers=RENDER_WORKERS, max_pending=RENDER_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = None
+        # Métricas
+        self.queued = 0       # esperando un hueco libre (RENDER_MAX_PENDING)
+        self.in_flight = 0    # enviados al pool y aún sin terminar
+        self.completed = 0
+        self.failed = 0
+        self.render_seconds = {name: [0, 0.0, 0.0] for name in RENDERERS}  # [n, total, max]
+        self.queue_wait_total = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            # "spawn" evita heredar hilos y sockets del proceso de uvicorn
+            # Cada proceso construye las plantillas de los reportes al arrancar
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=load_templates,
+            )
+            logger.info(f"Pool de renderizado iniciado con {self.max_workers} procesos")
+        return self._executor
+
+    async def start(self):
+        """Arranca los procesos por adelantado para no pagar el arranque en la primera exportación."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._get_executor(), _noop)
+
+    async def render(self, format_name, text, analysis, segments=None):
+        """Genera un único formato en el pool y devuelve sus bytes."""
+        if format_name not in RENDERERS:
+            raise ValueError(f"Formato de exportación no soportado: {format_name}")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        submitted = time.time()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            data, started, finished = await loop.run_in_executor(
+                self._get_executor(), _render_job, format_name, text, analysis, segments
+            )
+        except BrokenProcessPool:
+            # Un proceso hijo murió; se recrea el pool en la siguiente llamada
+            logger.error("El pool de renderizado se rompió, se reiniciará")
+            self._executor = None
+            self.failed += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+        elapsed = finished - started
+        stats = self.render_seconds[format_name]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        self.queue_wait_total += max(0.0, started - submitted)
+        self.completed += 1
+        metrics.render_seconds.observe(elapsed, format=format_name)
+        metrics.render_bytes.observe(len(data), format=format_name)
+        logger.info(
+            f"Reporte {format_name} generado en {elapsed:.2f}s "
+            f"(espera en cola {max(0.0, started - submitted):.2f}s, {len(data)} bytes)"
+        )
+        return data
+
+    async def render_all(self, text, analysis, export_formats, segments=None):
+        """Genera en paralelo todos los formatos pedidos, en el orden de REPORT_FORMATS."""
+        formats = [name for name in REPORT_FORMATS if name in export_formats]
+        results = await asyncio.gather(
+            *(self.render(name, text, analysis, segments) for name in formats)
+        )
+        return dict(zip(formats, results))
+
+    @property
+    def queue_depth(self):
+        """Trabajos que aún no han empezado a ejecutarse en un proceso."""
+        return self.queued + max(0, self.in_flight - self.max_workers)
+
+    def stats(self):
+        """Instantánea de las métricas del pool."""
+        return {
+            "workers": self.max_workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "queue_wait_total_seconds": self.queue_wait_total,
+            "render_seconds": {
+                name: {"count": n, "total": total, "max": peak}
+                for name, (n, total, peak) in self.render_seconds.items()
+            },
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Pool de renderizado detenido")
+
+
+render_pool = RenderPool()
+metrics.render_queue_depth.set_function(lambda: render_pool.queue_depth)
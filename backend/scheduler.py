@@ -0,0 +1,205 @@
+# backend/scheduler.py
+"""Admisión y reparto justo del trabajo posterior a las sesiones (análisis y reportes).
+
+Cuando muchas sesiones terminan a la vez, lanzar todos los análisis con gpt-4o
+y todos los renderizados de golpe satura el worker y todos esperan. Cada etapa
+tiene un ``FairScheduler`` con un máximo de trabajos en curso; el resto espera
+en cola con:
+
+- Prioridad: las sesiones en vivo (PRIORITY_INTERACTIVE) pasan antes que los
+  trabajos por lotes (PRIORITY_BATCH).
+- Reparto por tenant: con la misma prioridad se turnan los tenants, empezando
+  por el que lleva más tiempo sin ser atendido, así que un tenant con veinte
+  entrevistas en cola no deja esperando al que tiene una.
+- Posición en la cola: ``on_position(posición)`` se llama cada vez que cambia
+  (1 = la siguiente) y con ``None`` cuando le toca el turno, para avisar al
+  cliente.
+- Cancelación: si la tarea que espera se cancela (el cliente se desconecta),
+  sale de la cola sin ocupar hueco.
+
+Uso::
+
+    async with analysis_scheduler.slot(tenant, on_position=avisar):
+        analysis = await generate_analysis(text)
+"""
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+POST_SESSION_MAX_ANALYSES = int(os.getenv("POST_SESSION_MAX_ANALYSES", "4"))
+POST_SESSION_MAX_RENDERS = int(os.getenv("POST_SESSION_MAX_RENDERS", "2"))
+POST_SESSION_MAX_QUEUED = int(os.getenv("POST_SESSION_MAX_QUEUED", "200"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+class _Ticket:
+    __slots__ = ("seq", "tenant", "priority", "enqueued", "position", "granted", "changed")
+
+    def __init__(self, seq, tenant, priority):
+        self.seq = seq
+        self.tenant = tenant
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.position = None
+        self.granted = False
+        self.changed = asyncio.Event()
+
+
+class FairScheduler:
+    """Cola con prioridad y turnos por tenant delante de un máximo de trabajos en curso."""
+
+    def __init__(self, stage, max_in_flight, max_queued=POST_SESSION_MAX_QUEUED):
+        self.stage = stage
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.in_flight = 0
+        self._tenants = {}      # tenant -> deque de tickets en espera (orden de llegada)
+        self._last_served = {}  # tenant -> número del último turno concedido
+        self._turns = 0
+        self._seq = itertools.count()
+        # Métricas
+        self.granted = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.max_wait = 0.0
+
+    @property
+    def queued(self):
+        return sum(len(tickets) for tickets in self._tenants.values())
+
+    @asynccontextmanager
+    async def slot(self, tenant, priority=PRIORITY_INTERACTIVE, on_position=None):
+        """Espera turno (avisando de la posición) y ocupa un hueco mientras dura el bloque."""
+        ticket = self._enqueue(tenant, priority)
+        try:
+            await self._wait(ticket, on_position)
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _enqueue(self, tenant, priority):
+        ticket = _Ticket(next(self._seq), tenant, priority)
+        if self.in_flight < self.max_in_flight and not self._tenants:
+            self._grant(ticket)
+            self._update()
+            return ticket
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            metrics.scheduler_rejected.inc(stage=self.stage)
+            raise SchedulerFull(f"Hay {self.queued} trabajos de {self.stage} en cola")
+        self._tenants.setdefault(tenant, deque()).append(ticket)
+        self._update()
+        return ticket
+
+    async def _wait(self, ticket, on_position):
+        notified = None
+        while True:
+            ticket.changed.clear()
+            if ticket.granted:
+                if notified is not None and on_position:
+                    await on_position(None)
+                return
+            if ticket.position != notified and on_position:
+                notified = ticket.position
+                await on_position(ticket.position)
+                continue  # La posición pudo cambiar mientras se avisaba
+            await ticket.changed.wait()
+
+    def _withdraw(self, ticket):
+        """Saca de la cola un ticket cuya tarea se canceló (o libera su hueco si ya lo tenía)."""
+        if ticket.granted:
+            self._release()
+            return
+        tickets = self._tenants.get(ticket.tenant)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._tenants[ticket.tenant]
+            self.cancelled += 1
+            metrics.scheduler_cancelled.inc(stage=self.stage)
+            logger.info(f"Trabajo de {self.stage} de '{ticket.tenant}' cancelado mientras esperaba turno")
+            self._update()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._update()
+
+    def _grant(self, ticket):
+        self.in_flight += 1
+        self._turns += 1
+        self._last_served[ticket.tenant] = self._turns
+        ticket.granted = True
+        ticket.position = None
+        ticket.changed.set()
+        self.granted += 1
+        waited = time.monotonic() - ticket.enqueued
+        self.max_wait = max(self.max_wait, waited)
+        metrics.scheduler_wait_seconds.observe(waited, stage=self.stage)
+
+    @staticmethod
+    def _next_tenant(tenants, last_served):
+        """Tenant del siguiente turno: mejor prioridad y, a igualdad, el atendido hace más tiempo."""
+        return min(tenants, key=lambda t: (tenants[t][0].priority, last_served.get(t, 0), tenants[t][0].seq))
+
+    def _update(self):
+        """Concede los huecos libres y recalcula la posición de los que siguen esperando."""
+        while self._tenants and self.in_flight < self.max_in_flight:
+            tenant = self._next_tenant(self._tenants, self._last_served)
+            tickets = self._tenants[tenant]
+            ticket = tickets.popleft()
+            if not tickets:
+                del self._tenants[tenant]
+            self._grant(ticket)
+
+        # Orden en que se atenderían si no llega nadie más
+        tenants = {tenant: deque(tickets) for tenant, tickets in self._tenants.items()}
+        last_served = dict(self._last_served)
+        turn = self._turns
+        position = 0
+        while tenants:
+            tenant = self._next_tenant(tenants, last_served)
+            ticket = tenants[tenant].popleft()
+            if not tenants[tenant]:
+                del tenants[tenant]
+            turn += 1
+            last_served[tenant] = turn
+            position += 1
+            if ticket.position != position:
+                ticket.position = position
+                ticket.changed.set()
+        metrics.scheduler_queued.set(self.queued, stage=self.stage)
+        metrics.scheduler_in_flight.set(self.in_flight, stage=self.stage)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self.queued,
+            "queued_by_tenant": {tenant: len(tickets) for tenant, tickets in self._tenants.items()},
+            "granted": self.granted,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "max_wait_s": round(self.max_wait, 3),
+        }
+
+
+analysis_scheduler = FairScheduler("analysis", POST_SESSION_MAX_ANALYSES)
+render_scheduler = FairScheduler("render", POST_SESSION_MAX_RENDERS)
@@ -0,0 +1,304 @@
+# backend/search.py
+"""Índice de búsqueda de texto completo sobre transcripciones y análisis.
+
+Cada segmento final se indexa al llegar (no al terminar la sesión) y cada
+análisis al completarse, en una tabla FTS5 de SQLite (SEARCH_DB_PATH)
+compartida por los workers de la máquina, igual que el almacén de sesiones.
+Las consultas van contra el índice invertido, así que su coste no depende del
+número de entrevistas guardadas.
+
+Tokenización para español: minúsculas, sin tildes ("fricción" = "friccion"),
+sin palabras vacías ("de", "entre", "y"...) y con un stemmer ligero que quita
+plurales y la vocal final de género ("Ventas", "venta" y "ventas" -> "vent";
+"Operaciones" y "operación" -> "operacion"). El mismo proceso se aplica al
+texto indexado y a la consulta.
+
+Las inserciones se encolan y una tarea las escribe en lotes cada
+SEARCH_FLUSH_SECONDS, en una transacción por lote: indexar no añade escrituras
+a SQLite por cada segmento de cada sesión.
+"""
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+import tempfile
+import threading
+import unicodedata
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "false").lower() in ("1", "true", "yes")
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", os.path.join(tempfile.gettempdir(), "rtt_search.db"))
+SEARCH_FLUSH_SECONDS = float(os.getenv("SEARCH_FLUSH_SECONDS", "0.5"))
+SEARCH_TTL_SECONDS = float(os.getenv("SEARCH_TTL_SECONDS", os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600))))
+SEARCH_MAX_LIMIT = 100
+SNIPPET_WORDS = 12  # palabras de contexto a cada lado de la primera coincidencia
+
+STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella ellas
+ellos en entre era eran es esa esas ese eso esos esta estaba estan estar estas este esto estos fue fueron ha
+han hasta hay la las le les lo los mas me mi mis mucho muchos muy nada ni no nos nosotros o os otra otras otro
+otros para pero poco por porque que quien quienes se ser si sin sobre son su sus tambien tanto te tiene tienen
+todo todos tu tus un una uno unos y ya yo
+""".split())
+
+_WORD = re.compile(r"\w+")
+_PHRASE = re.compile(r'"([^"]*)"')
+# Marcas diacríticas tras NFD, salvo la virgulilla de la ñ
+_ACCENTS = re.compile("(?<!n)\u0303|[\u0300-\u0302\u0304-\u036f]")
+
+
+def fold(text):
+    """Minúsculas y sin tildes ni diéresis (la ñ se conserva)."""
+    text = unicodedata.normalize("NFD", text.lower())
+    text = _ACCENTS.sub("", text)
+    return unicodedata.normalize("NFC", text)
+
+
+def stem(word):
+    """Stemmer ligero para español: plurales y vocal final de género."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("ces") and len(word) > 4:
+        word = word[:-3] + "z"           # veces -> vez
+    elif word.endswith("es") and len(word) > 4 and word[-3] not in "aeiou":
+        word = word[:-2]                 # operaciones -> operacion
+    elif word.endswith("s") and word[-2] in "aeiou":
+        word = word[:-1]                 # ventas -> venta
+    if len(word) > 4 and word[-1] in "aoe":
+        word = word[:-1]                 # venta -> vent, equipo -> equip
+    return word
+
+
+def terms(text):
+    """Raíces de las palabras significativas del texto, en orden."""
+    return [stem(word) for word in _WORD.findall(fold(text)) if word not in STOPWORDS]
+
+
+def match_expression(query):
+    """Consulta de FTS5: todas las palabras (AND); lo que va entre comillas, como frase."""
+    parts = []
+    for phrase in _PHRASE.findall(query):
+        words = terms(phrase)
+        if words:
+            parts.append('"' + " ".join(words) + '"')
+    for word in terms(_PHRASE.sub(" ", query)):
+        parts.append(f'"{word}"')
+    return " AND ".join(dict.fromkeys(parts))
+
+
+def snippet(text, query):
+    """Fragmento del texto alrededor de la primera palabra que coincide, marcada con «»."""
+    wanted = set(terms(query))
+    words = text.split()
+    for i, word in enumerate(words):
+        if any(stem(token) in wanted for token in _WORD.findall(fold(word))):
+            start = max(0, i - SNIPPET_WORDS)
+            stop = min(len(words), i + SNIPPET_WORDS + 1)
+            marked = words[start:i] + [f"«{word}»"] + words[i + 1:stop]
+            return ("… " if start else "") + " ".join(marked) + (" …" if stop < len(words) else "")
+    return " ".join(words[:2 * SNIPPET_WORDS]) + (" …" if len(words) > 2 * SNIPPET_WORDS else "")
+
+
+class SearchIndex:
+    """Índice FTS5 con cola de escritura; los accesos bloqueantes se hacen desde un hilo."""
+
+    def __init__(self, path=SEARCH_DB_PATH, flush_seconds=SEARCH_FLUSH_SECONDS, ttl=SEARCH_TTL_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pending = []  # operaciones a escribir en el próximo lote
+        self._wakeup = None
+        self._task = None
+        # Métricas
+        self.indexed = 0
+        self.queries = 0
+
+    def _connect(self):
+        # timeout: otros workers pueden estar escribiendo en la misma base
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            # Una fila por segmento (kind "segment", seq = índice) o sección del análisis (kind "analysis")
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, kind TEXT NOT NULL, seq INTEGER NOT NULL,"
+            " section TEXT, start REAL, end REAL, text TEXT NOT NULL, created REAL NOT NULL,"
+            " UNIQUE (session_id, kind, seq));"
+            # Sólo las raíces se indexan; el rowid es el id de entries
+            "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(terms, tokenize='unicode61');"
+        )
+        conn.commit()
+        return conn
+
+    async def start(self):
+        self._conn = await asyncio.to_thread(self._connect)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Índice de búsqueda en {self.path}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await asyncio.to_thread(self._write, self._take())
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+        self._wakeup = None  # Lo que llegue después no se encola
+        self._pending = []
+
+    @property
+    def ready(self):
+        return self._conn is not None
+
+    # --- Escritura ---
+
+    def add_segment(self, session_id, seq, segment):
+        """Encola un segmento final (dict con text, start, end) para indexarlo."""
+        self._enqueue(("upsert", session_id, "segment", seq, None, segment.get("start"), segment.get("end"),
+                       segment["text"]))
+
+    def add_analysis(self, session_id, analysis, sections):
+        """Encola las secciones del análisis de la sesión, sustituyendo las de un análisis anterior."""
+        self._enqueue(("clear", session_id, "analysis"))
+        for seq, (key, _) in enumerate(sections):
+            if analysis.get(key):
+                self._enqueue(("upsert", session_id, "analysis", seq, key, None, None, analysis[key]))
+
+    def remove_session(self, session_id):
+        self._enqueue(("clear", session_id, None))
+
+    def _enqueue(self, operation):
+        if self._wakeup is None:
+            return  # Índice no iniciado (SEARCH_INDEX=false)
+        self._pending.append(operation)
+        self._wakeup.set()
+
+    def _take(self):
+        operations, self._pending = self._pending, []
+        return operations
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            operations = self._take()
+            try:
+                await asyncio.to_thread(self._write, operations)
+            except Exception as e:
+                logger.error(f"No se pudieron indexar {len(operations)} entradas: {e}")
+            await asyncio.sleep(self.flush_seconds)  # Lo que llegue mientras tanto va en el siguiente lote
+
+    def _delete(self, where, params):
+        ids = [row[0] for row in self._conn.execute(f"SELECT id FROM entries WHERE {where}", params)]
+        self._conn.executemany("DELETE FROM entries_fts WHERE rowid = ?", [(i,) for i in ids])
+        self._conn.execute(f"DELETE FROM entries WHERE {where}", params)
+        return len(ids)
+
+    def _write(self, operations):
+        if not operations:
+            return
+        now = time.time()
+        indexed = 0
+        with self._lock:
+            for operation in operations:
+                if operation[0] == "clear":
+                    _, session_id, kind = operation
+                    if kind is None:
+                        self._delete("session_id = ?", (session_id,))
+                    else:
+                        self._delete("session_id = ? AND kind = ?", (session_id, kind))
+                    continue
+                _, session_id, kind, seq, section, start, end, text = operation
+                self._delete("session_id = ? AND kind = ? AND seq = ?", (session_id, kind, seq))
+                rowid = self._conn.execute(
+                    "INSERT INTO entries (session_id, kind, seq, section, start, end, text, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session_id, kind, seq, section, start, end, text, now),
+                ).lastrowid
+                self._conn.execute(
+                    "INSERT INTO entries_fts (rowid, terms) VALUES (?, ?)", (rowid, " ".join(terms(text)))
+                )
+                indexed += 1
+                metrics.search_indexed.inc(kind=kind)
+            self._conn.commit()
+        self.indexed += indexed
+
+    # --- Consulta ---
+
+    async def search(self, query, limit=20, offset=0, session_id=None, kind=None):
+        """Entradas que contienen todas las palabras de ``query``, de más a menos relevante (BM25)."""
+        expression = match_expression(query)
+        if not expression:
+            return []
+        started = time.perf_counter()
+        rows = await asyncio.to_thread(
+            self._search, expression, min(limit, SEARCH_MAX_LIMIT), offset, session_id, kind
+        )
+        self.queries += 1
+        metrics.search_seconds.observe(time.perf_counter() - started)
+        return [
+            {
+                "session_id": row_session,
+                "kind": row_kind,
+                "section": section,
+                "start": start,
+                "end": end,
+                "text": text,
+                "snippet": snippet(text, query),
+                "score": round(-score, 4),
+            }
+            for row_session, row_kind, section, start, end, text, score in rows
+        ]
+
+    def _search(self, expression, limit, offset, session_id, kind):
+        sql = (
+            "SELECT e.session_id, e.kind, e.section, e.start, e.end, e.text, bm25(entries_fts) AS score"
+            " FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid WHERE entries_fts MATCH ?"
+        )
+        params = [expression]
+        if session_id:
+            sql += " AND e.session_id = ?"
+            params.append(session_id)
+        if kind:
+            sql += " AND e.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY score LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def purge_expired(self):
+        """Quita del índice las sesiones sin entradas nuevas en SEARCH_TTL_SECONDS."""
+        def purge():
+            cutoff = time.time() - self.ttl
+            with self._lock:
+                deleted = self._delete(
+                    "session_id IN (SELECT session_id FROM entries GROUP BY session_id HAVING MAX(created) < ?)",
+                    (cutoff,),
+                )
+                self._conn.commit()
+            return deleted
+
+        deleted = await asyncio.to_thread(purge)
+        if deleted:
+            logger.info(f"Búsqueda: {deleted} entradas expiradas eliminadas del índice")
+        return deleted
+
+    def stats(self):
+        return {"indexed": self.indexed, "queries": self.queries, "pending": len(self._pending)}
+
+
+search_index = SearchIndex()
@@ -0,0 +1,174 @@
+# backend/segments.py
+"""Segmentos finales de una sesión en estructuras compactas.
+
+``SegmentStore`` guarda los tiempos y confianzas en ``array`` y el texto de
+todos los segmentos en un único ``bytearray`` UTF-8 con offsets, en lugar de
+una lista de objetos por segmento. Una hora de audio (~1.000 segmentos y
+~10.000 palabras) ocupa unos 400 KB, frente a ~3,5 MB como lista de dicts;
+obtener el texto de un tramo es cortar el buffer (sin ``" ".join``) y buscar
+por rango de tiempo es una búsqueda binaria sobre los inicios.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+Segment = namedtuple("Segment", "text start end confidence")
+Word = namedtuple("Word", "text start end confidence")
+
+_SEPARATOR = b" "
+
+
+def format_timestamp(seconds):
+    """Segundos → "mm:ss" (o "h:mm:ss" a partir de una hora)."""
+    seconds = int(max(0.0, seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class SegmentStore:
+    """Segmentos (texto, inicio, fin, confianza) y sus palabras, sólo de añadido."""
+
+    __slots__ = (
+        "_starts", "_ends", "_confidences", "_text", "_text_offsets",
+        "_word_starts", "_word_ends", "_word_confidences", "_word_text", "_word_text_offsets",
+        "_word_offsets", "_max_end",
+    )
+
+    def __init__(self):
+        self._starts = array("d")
+        self._ends = array("d")
+        self._confidences = array("f")
+        self._text = bytearray()
+        self._text_offsets = array("Q", [0])  # segmento i: _text[off[i]:off[i+1] - 1]
+        # Palabras en float32 (precisión de ~1 ms hasta varias horas) y offsets de 32 bits
+        self._word_starts = array("f")
+        self._word_ends = array("f")
+        self._word_confidences = array("f")
+        self._word_text = bytearray()
+        self._word_text_offsets = array("I", [0])
+        self._word_offsets = array("I", [0])  # palabras del segmento i: [off[i], off[i+1])
+        self._max_end = array("d")  # máximo de _ends hasta i, para buscar por rango
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __bool__(self):
+        return len(self._starts) > 0
+
+    def append(self, text, start, end, confidence=0.0, words=()):
+        """Añade un segmento; ``words`` es un iterable de (texto, inicio, fin, confianza)."""
+        self._starts.append(start)
+        self._ends.append(end)
+        self._confidences.append(confidence)
+        self._max_end.append(max(end, self._max_end[-1]) if self._max_end else end)
+        self._text += text.encode("utf-8") + _SEPARATOR
+        self._text_offsets.append(len(self._text))
+        for word, word_start, word_end, word_confidence in words:
+            self._word_starts.append(word_start)
+            self._word_ends.append(word_end)
+            self._word_confidences.append(word_confidence)
+            self._word_text += word.encode("utf-8")
+            self._word_text_offsets.append(len(self._word_text))
+        self._word_offsets.append(len(self._word_starts))
+
+    def append_result(self, result, offset=0.0):
+        """Añade un resultado final de Deepgram; ``offset`` lo lleva a la línea de tiempo de la sesión."""
+        alternative = result.channel.alternatives[0]
+        words = (
+            (w.punctuated_word or w.word, offset + w.start, offset + w.end, w.confidence or 0.0)
+            for w in (alternative.words or ())
+        )
+        self.append(
+            alternative.transcript,
+            offset + result.start,
+            offset + result.start + result.duration,
+            alternative.confidence or 0.0,
+            words,
+        )
+
+    def _segment_text(self, i):
+        return self._text[self._text_offsets[i]:self._text_offsets[i + 1] - 1].decode("utf-8")
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("índice de segmento fuera de rango")
+        return Segment(self._segment_text(i), self._starts[i], self._ends[i], self._confidences[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def text(self, start=0, stop=None):
+        """Texto de los segmentos [start, stop) separados por espacios."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return ""
+        return self._text[self._text_offsets[start]:self._text_offsets[stop] - 1].decode("utf-8")
+
+    def texts(self):
+        return [self._segment_text(i) for i in range(len(self))]
+
+    def words(self, i):
+        """Palabras del segmento ``i`` con sus tiempos."""
+        first, last = self._word_offsets[i], self._word_offsets[i + 1]
+        return [
+            Word(
+                self._word_text[self._word_text_offsets[j]:self._word_text_offsets[j + 1]].decode("utf-8"),
+                self._word_starts[j], self._word_ends[j], self._word_confidences[j],
+            )
+            for j in range(first, last)
+        ]
+
+    def between(self, start, end):
+        """Índices de los segmentos que se solapan con [start, end] segundos."""
+        # Los inicios crecen con el tiempo; _max_end permite descartar por la izquierda
+        first = bisect_left(self._max_end, start)
+        last = bisect_right(self._starts, end, lo=first)
+        return [i for i in range(first, last) if self._ends[i] >= start]
+
+    def rows(self):
+        """(inicio, fin, texto) por segmento; forma compacta para renderizar reportes."""
+        return [(self._starts[i], self._ends[i], self._segment_text(i)) for i in range(len(self))]
+
+    def timecoded(self, start=None, end=None):
+        """Transcripción con marcas de tiempo, una línea por segmento."""
+        indices = range(len(self)) if start is None and end is None else self.between(
+            start or 0.0, end if end is not None else float("inf")
+        )
+        return "\n".join(f"[{format_timestamp(self._starts[i])}] {self._segment_text(i)}" for i in indices)
+
+    def to_dict(self, i):
+        """Segmento ``i`` en el formato del almacén de sesiones."""
+        segment = {
+            "text": self._segment_text(i),
+            "start": round(self._starts[i], 3),
+            "end": round(self._ends[i], 3),
+            "confidence": round(self._confidences[i], 3),
+        }
+        words = self.words(i)
+        if words:
+            segment["words"] = [[w.text, round(w.start, 3), round(w.end, 3), round(w.confidence, 3)] for w in words]
+        return segment
+
+    def extend_dicts(self, segments):
+        """Carga segmentos guardados con ``to_dict`` (o sólo con text/start/end)."""
+        for segment in segments:
+            self.append(
+                segment["text"], segment.get("start") or 0.0, segment.get("end") or 0.0,
+                segment.get("confidence", 0.0), segment.get("words", ()),
+            )
+
+    @property
+    def duration(self):
+        return self._max_end[-1] if self._max_end else 0.0
+
+    def nbytes(self):
+        """Memoria aproximada de los datos (sin la cabecera de los objetos)."""
+        arrays = (
+            self._starts, self._ends, self._confidences, self._text_offsets, self._word_starts,
+            self._word_ends, self._word_confidences, self._word_text_offsets, self._word_offsets, self._max_end,
+        )
+        return sum(a.itemsize * len(a) for a in arrays) + len(self._text) + len(self._word_text)
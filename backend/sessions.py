@@ -0,0 +1,245 @@
+# backend/sessions.py
+"""Almacén de sesiones: segmentos finales persistidos a medida que llegan.
+
+Con SESSION_STORE=sqlite los segmentos se guardan en un log de sólo añadido en
+SQLite (SESSION_DB_PATH), compartido por todos los workers de uvicorn de la
+máquina: una sesión se puede reanudar tras un reinicio o desde otro worker, y
+``stop_and_analyze`` puede cargar la transcripción completa desde cualquiera.
+El almacén en memoria (por defecto) sólo sirve dentro de un mismo proceso.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import secrets
+import logging
+import tempfile
+import threading
+
+from segments import SegmentStore
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORES = ("memory", "sqlite")
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(tempfile.gettempdir(), "rtt_sessions.db"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+# Memoria: segundos que se conserva una sesión tras cerrarse su WebSocket (para reanudarla o analizarla)
+SESSION_RELEASE_SECONDS = float(os.getenv("SESSION_RELEASE_SECONDS", "900"))
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", "300"))
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+class MemorySessionStore:
+    """Sesiones en un dict del proceso; se pierden al reiniciar.
+
+    Una sesión liberada (su WebSocket o trabajo terminó) se borra en la siguiente
+    purga pasados SESSION_RELEASE_SECONDS sin cambios, para que la memoria no
+    crezca con cada sesión que atiende el worker. Los segmentos (y sus palabras)
+    se guardan en un ``SegmentStore``, no como dicts.
+    """
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS, release_ttl=SESSION_RELEASE_SECONDS):
+        self.ttl = ttl
+        self.release_ttl = release_ttl
+        self._sessions = {}  # id -> {"created", "updated", "meta", "segments", "released"}
+
+    async def create(self, session_id=None, meta=None):
+        session_id = session_id or new_session_id()
+        now = time.time()
+        session = self._sessions.setdefault(
+            session_id, {"created": now, "updated": now, "meta": meta or {}, "segments": SegmentStore(), "released": False}
+        )
+        session["released"] = False  # Reanudada: vuelve a estar en uso
+        return session_id
+
+    async def exists(self, session_id):
+        return session_id in self._sessions
+
+    async def append(self, session_id, segment):
+        """Añade un segmento final (dict con text, start, end)."""
+        session = self._sessions[session_id]
+        session["segments"].extend_dicts((segment,))
+        session["updated"] = time.time()
+
+    async def segments(self, session_id):
+        """Segmentos de la sesión en orden de llegada (lista vacía si no existe)."""
+        session = self._sessions.get(session_id)
+        if not session:
+            return []
+        segments = session["segments"]
+        return [segments.to_dict(i) for i in range(len(segments))]
+
+    async def release(self, session_id):
+        """La sesión ya no está en uso; se conserva SESSION_RELEASE_SECONDS por si se reanuda."""
+        session = self._sessions.get(session_id)
+        if session:
+            session["released"] = True
+            session["updated"] = time.time()
+
+    async def purge_expired(self):
+        now = time.time()
+        expired = [
+            sid for sid, session in self._sessions.items()
+            if session["updated"] < now - (self.release_ttl if session["released"] else self.ttl)
+        ]
+        for session_id in expired:
+            del self._sessions[session_id]
+        return len(expired)
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore:
+    """Log de segmentos en SQLite; los accesos bloqueantes se hacen desde un hilo."""
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # timeout: otros workers pueden estar escribiendo en la misma base
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, created REAL NOT NULL, updated REAL NOT NULL, meta TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " session_id TEXT NOT NULL, seq INTEGER NOT NULL, start REAL, end REAL,"
+            " text TEXT NOT NULL, data TEXT, created REAL NOT NULL,"
+            " PRIMARY KEY (session_id, seq));"
+        )
+        self._conn.commit()
+        logger.info(f"Almacén de sesiones SQLite en {path}")
+
+    def _create(self, session_id, meta):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (id, created, updated, meta) VALUES (?, ?, ?, ?)",
+                (session_id, now, now, json.dumps(meta or {}, ensure_ascii=False)),
+            )
+            self._conn.commit()
+
+    def _exists(self, session_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def _append(self, session_id, segment):
+        now = time.time()
+        extra = {k: v for k, v in segment.items() if k not in ("text", "start", "end")}
+        with self._lock:
+            # seq se calcula dentro de la misma transacción que la inserción
+            self._conn.execute(
+                "INSERT INTO segments (session_id, seq, start, end, text, data, created)"
+                " SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ?, ?, ? FROM segments WHERE session_id = ?",
+                (session_id, segment.get("start"), segment.get("end"), segment["text"],
+                 json.dumps(extra, ensure_ascii=False) if extra else None, now, session_id),
+            )
+            self._conn.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+            self._conn.commit()
+
+    def _segments(self, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start, end, text, data FROM segments WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        segments = []
+        for start, end, text, data in rows:
+            segment = {"text": text, "start": start, "end": end}
+            if data:
+                segment.update(json.loads(data))
+            segments.append(segment)
+        return segments
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM segments WHERE session_id IN (SELECT id FROM sessions WHERE updated < ?)", (cutoff,)
+            )
+            deleted = self._conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    async def create(self, session_id=None, meta=None):
+        session_id = session_id or new_session_id()
+        await asyncio.to_thread(self._create, session_id, meta)
+        return session_id
+
+    async def exists(self, session_id):
+        return await asyncio.to_thread(self._exists, session_id)
+
+    async def append(self, session_id, segment):
+        await asyncio.to_thread(self._append, session_id, segment)
+
+    async def segments(self, session_id):
+        return await asyncio.to_thread(self._segments, session_id)
+
+    async def release(self, session_id):
+        pass  # Persisten hasta SESSION_TTL_SECONDS
+
+    async def purge_expired(self):
+        deleted = await asyncio.to_thread(self._purge_expired)
+        if deleted:
+            logger.info(f"Sesiones: {deleted} sesiones expiradas eliminadas")
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def load_or_create_secret(path):
+    """Clave compartida por los workers que usan la misma base: se lee de ``path`` o se crea (0600).
+
+    La creación es atómica (``os.link`` falla si otro worker se adelantó), así
+    que todos acaban leyendo la misma clave.
+    """
+    try:
+        with open(path) as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+    temporary = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32))
+    try:
+        os.link(temporary, path)
+        logger.info(f"Clave de los tokens de acceso generada en {path}")
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temporary)
+    with open(path) as f:
+        return f.read().strip()
+
+
+def create_session_store(kind=SESSION_STORE):
+    if kind not in SESSION_STORES:
+        raise ValueError(f"Almacén de sesiones no soportado: {kind}")
+    if kind == "sqlite":
+        return SQLiteSessionStore()
+    return MemorySessionStore()
+
+
+async def purge_periodically(store, interval=SESSION_PURGE_INTERVAL):
+    """Purga las sesiones expiradas cada ``interval`` segundos mientras vive la app."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await store.purge_expired()
+        except Exception as e:
+            logger.error(f"Error al purgar sesiones expiradas: {e}")
+
+
+session_store = create_session_store()
@@ -0,0 +1 @@
+"""Servidores locales que imitan a OpenAI y Deepgram para pruebas y benchmarks."""
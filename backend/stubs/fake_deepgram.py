@@ -0,0 +1,154 @@
+# backend/stubs/fake_deepgram.py
+"""Servidor WebSocket local que imita la API de transcripción en vivo de Deepgram.
+
+Cuenta los bytes de audio recibidos y, cada ``--segment-seconds`` de audio
+(estimado con ``--bytes-per-second``, o con ``sample_rate``/``channels`` de la
+URL si la conexión pide ``encoding=linear16``), responde con un resultado parcial y
+uno final con palabras y marcas de tiempo.
+
+Uso (desde backend/):
+    python -m stubs.fake_deepgram --port 8002 --latency 0.2 --jitter 0.1 --recv-delay 0.01
+    python -m stubs.fake_deepgram --drop-after 10  # corta cada conexión tras 10 s de audio
+    DEEPGRAM_URL=http://127.0.0.1:8002 DEEPGRAM_API_KEY=fake uvicorn main:app
+"""
+import json
+import uuid
+import random
+import asyncio
+import argparse
+from urllib.parse import urlsplit, parse_qs
+
+import websockets
+
+WORDS = (
+    "el equipo de ventas siente que operaciones no responde a tiempo y eso genera "
+    "fricción con los clientes pero el ambiente en el área es bueno y los jefes escuchan"
+).split()
+
+
+def _result(start, duration, words, is_final, request_id):
+    step = duration / max(1, len(words))
+    return {
+        "type": "Results",
+        "channel_index": [0, 1],
+        "duration": duration,
+        "start": start,
+        "is_final": is_final,
+        "speech_final": is_final,
+        "channel": {"alternatives": [{
+            "transcript": " ".join(words),
+            "confidence": 0.95,
+            "words": [
+                {
+                    "word": word,
+                    "start": round(start + i * step, 3),
+                    "end": round(start + (i + 1) * step, 3),
+                    "confidence": round(random.uniform(0.8, 1.0), 3),
+                    "punctuated_word": word,
+                }
+                for i, word in enumerate(words)
+            ],
+        }]},
+        "metadata": {
+            "request_id": request_id,
+            "model_info": {"name": "fake", "version": "0", "arch": "fake"},
+            "model_uuid": "fake",
+        },
+    }
+
+
+class FakeDeepgram:
+    def __init__(self, latency=0.0, recv_delay=0.0, bytes_per_second=4000, segment_seconds=2.0,
+                 drop_after=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.recv_delay = recv_delay
+        self.bytes_per_second = bytes_per_second
+        self.segment_seconds = segment_seconds
+        self.drop_after = drop_after  # segundos de audio tras los que se corta la conexión (0 = nunca)
+        self.connections = 0
+
+    async def handler(self, websocket):
+        self.connections += 1
+        request_id = str(uuid.uuid4())
+        bytes_per_second = self.bytes_per_second
+        query = parse_qs(urlsplit(websocket.request.path).query)
+        if query.get("encoding") == ["linear16"]:
+            bytes_per_second = 2 * int(query.get("sample_rate", ["16000"])[0]) * int(query.get("channels", ["1"])[0])
+        received = 0
+        emitted_until = 0.0  # segundos de audio ya transcritos
+        pending = set()
+        loop = asyncio.get_running_loop()
+        last_due = 0.0  # con jitter, los resultados se siguen enviando en orden
+
+        async def respond(message, due):
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            try:
+                await websocket.send(json.dumps(message))
+            except websockets.ConnectionClosed:
+                pass
+
+        def schedule(message):
+            nonlocal last_due
+            last_due = max(last_due, loop.time() + self.latency + random.uniform(0, self.jitter))
+            task = asyncio.create_task(respond(message, last_due))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        try:
+            async for frame in websocket:
+                if isinstance(frame, str):
+                    if json.loads(frame).get("type") == "CloseStream":
+                        break
+                    continue  # KeepAlive / Finalize
+                if self.recv_delay:
+                    await asyncio.sleep(self.recv_delay)  # Simula un upstream lento
+                received += len(frame)
+                audio_seconds = received / bytes_per_second
+                while audio_seconds - emitted_until >= self.segment_seconds:
+                    words = random.sample(WORDS, k=6)
+                    schedule(_result(emitted_until, self.segment_seconds, words[:3], False, request_id))
+                    schedule(_result(emitted_until, self.segment_seconds, words, True, request_id))
+                    emitted_until += self.segment_seconds
+                if self.drop_after and audio_seconds >= self.drop_after:
+                    await websocket.close(code=1011, reason="fake drop")  # Simula un corte del servicio
+                    return
+            if pending:
+                await asyncio.wait(pending)
+            await websocket.send(json.dumps({
+                "type": "Metadata",
+                "transaction_key": "fake",
+                "request_id": request_id,
+                "sha256": "",
+                "created": "",
+                "duration": received / bytes_per_second,
+                "channels": 1,
+                "models": [],
+                "model_info": {},
+            }))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def serve(self, host="127.0.0.1", port=8002):
+        return await websockets.serve(self.handler, host, port)
+
+
+async def _main(args):
+    server = FakeDeepgram(args.latency, args.recv_delay, args.bytes_per_second, args.segment_seconds,
+                          args.drop_after, args.jitter)
+    async with await server.serve(port=args.port):
+        print(f"Fake Deepgram escuchando en ws://127.0.0.1:{args.port}/v1/listen")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos hasta responder cada resultado")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Segundos aleatorios añadidos a la latencia")
+    parser.add_argument("--recv-delay", type=float, default=0.0, help="Segundos de espera por frame recibido")
+    parser.add_argument("--bytes-per-second", type=int, default=4000, help="Tasa de bits del audio simulado")
+    parser.add_argument("--segment-seconds", type=float, default=2.0, help="Audio por segmento final")
+    parser.add_argument("--drop-after", type=float, default=0.0,
+                        help="Cierra cada conexión tras estos segundos de audio (0 = nunca)")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,143 @@
+# backend/stubs/fake_openai.py
+"""Stub local del endpoint de chat completions de OpenAI.
+
+Uso (desde backend/):
+    python -m stubs.fake_openai --port 8001 --latency 0.5 --jitter 0.2
+    python -m stubs.fake_openai --incomplete-rate 0.3  # 30% de informes incompletos (texto libre o JSON)
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_REPORT = """Resumen general: La entrevista trata sobre la coordinación entre áreas y la carga de trabajo.
+
+Percepciones por área: Ventas se percibe como exigente; Operaciones como sobrecargada.
+
+Relaciones entre áreas: Hay fricción entre Ventas y Operaciones por los plazos de entrega.
+
+Factores que afectan positiva o negativamente la experiencia del empleado: El buen ambiente del equipo ayuda; la falta de planificación perjudica.
+
+Análisis de sentimiento general: Neutral con tendencia negativa en Operaciones.
+
+Recomendaciones accionables: Definir acuerdos de servicio entre Ventas y Operaciones y revisar la planificación semanal."""
+
+# Respuesta con salida estructurada (response_format json_schema): los mismos textos por campo
+FAKE_SECTIONS = dict(zip(
+    ["resumen", "percepciones_por_area", "relaciones_entre_areas", "factores_experiencia",
+     "analisis_sentimiento", "recomendaciones"],
+    [paragraph.split(": ", 1)[1] for paragraph in FAKE_REPORT.split("\n\n")],
+))
+
+# Respuesta en Markdown con encabezados propios, como las que deja incompletas el parser de encabezados
+FAKE_INCOMPLETE_REPORT = """### Visión general
+La entrevista trata sobre la coordinación entre áreas y la carga de trabajo.
+
+### Lo que se dice de cada área
+- **Ventas**: exigente.
+- **Operaciones**: sobrecargada.
+
+### Recomendaciones
+1. Definir acuerdos de servicio entre Ventas y Operaciones."""
+
+app = FastAPI()
+app.state.latency = 0.0
+app.state.jitter = 0.0
+app.state.error_rate = 0.0
+app.state.incomplete_rate = 0.0
+app.state.requests = 0
+
+
+def _incomplete_sections():
+    """JSON válido pero con campos vacíos, o cortado a mitad (como al agotar max_tokens)."""
+    if random.random() < 0.5:
+        empty = random.sample(list(FAKE_SECTIONS), k=random.randint(1, 3))
+        return json.dumps({key: "" if key in empty else text for key, text in FAKE_SECTIONS.items()},
+                          ensure_ascii=False)
+    content = json.dumps(FAKE_SECTIONS, ensure_ascii=False)
+    return content[:random.randint(len(content) // 4, len(content) * 3 // 4)]
+
+
+def _report_content(body):
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        if random.random() < app.state.incomplete_rate:
+            return _incomplete_sections()
+        return json.dumps(FAKE_SECTIONS, ensure_ascii=False)
+    if random.random() < app.state.incomplete_rate:
+        return FAKE_INCOMPLETE_REPORT
+    return FAKE_REPORT
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    await asyncio.sleep(app.state.latency + random.uniform(0, app.state.jitter))
+    if random.random() < app.state.error_rate:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": "0.2"},
+            content={"error": {"message": "Rate limit (stub)", "type": "rate_limit_error"}},
+        )
+    content = _report_content(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream_report(body.get("model", "gpt-4o"), content), media_type="text/event-stream")
+    prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+    return {
+        "id": f"chatcmpl-fake-{app.state.requests}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+        },
+    }
+
+
+async def _stream_report(model, content):
+    """Emite ``content`` como eventos SSE, unas pocas palabras por evento."""
+    words = content.split(" ")
+    for i in range(0, len(words), 3):
+        piece = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+        chunk = {
+            "id": "chatcmpl-fake-stream",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(0.01)
+    yield "data: [DONE]\n\n"
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos de latencia base por petición")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Segundos aleatorios añadidos a la latencia")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de peticiones que responden 429")
+    parser.add_argument("--incomplete-rate", type=float, default=0.0,
+                        help="Fracción de informes incompletos: texto libre sin los encabezados esperados o, "
+                             "con salida estructurada, JSON con campos vacíos o cortado")
+    args = parser.parse_args()
+    app.state.incomplete_rate = args.incomplete_rate
+    app.state.latency = args.latency
+    app.state.jitter = args.jitter
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port)